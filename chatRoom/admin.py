@@ -1,12 +1,12 @@
 # chat/admin.py
 from django.contrib import admin
-from .models import ChatRoom, Message
+from .models import ChatRoom, ChunkedUpload, Message, OutboxEvent
 
 class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
     readonly_fields = ['id', 'created_at']
-    fields = ['sender', 'content', 'file', 'is_read', 'created_at']
+    fields = ['sender', 'content', 'file', 'created_at']
     ordering = ['-created_at']
 
     def has_add_permission(self, request, obj=None):
@@ -17,16 +17,31 @@ class MessageInline(admin.TabularInline):
 
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
-    list_display = ['id_short', 'student', 'teacher', 'message_count', 'last_message', 'created_at', 'updated_at']
+    list_display = ['id_short', 'student', 'teacher', 'message_count', 'ultimo_mensaje', 'unread_student', 'unread_teacher', 'created_at', 'updated_at']
+    list_select_related = ['student', 'teacher', 'last_message__sender']
     list_filter = ['created_at', 'updated_at', 'student', 'teacher']
     search_fields = ['student__username', 'teacher__username', 'student__email', 'teacher__email']
-    readonly_fields = ['id', 'created_at', 'updated_at']
+    readonly_fields = [
+        'id', 'created_at', 'updated_at', 'last_message', 'last_message_at', 'unread_student', 'unread_teacher',
+        'student_last_read_at', 'student_last_read_message', 'teacher_last_read_at', 'teacher_last_read_message',
+    ]
     inlines = [MessageInline]
     
     fieldsets = (
         ('Información Básica', {
             'fields': ('id', 'student', 'teacher')
         }),
+        ('Último mensaje', {
+            'fields': ('last_message', 'last_message_at', 'unread_student', 'unread_teacher'),
+            'classes': ('collapse',)
+        }),
+        ('Lectura', {
+            'fields': (
+                'student_last_read_at', 'student_last_read_message',
+                'teacher_last_read_at', 'teacher_last_read_message',
+            ),
+            'classes': ('collapse',)
+        }),
         ('Fechas', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -41,24 +56,25 @@ class ChatRoomAdmin(admin.ModelAdmin):
         return obj.messages.count()
     message_count.short_description = 'Mensajes'
 
-    def last_message(self, obj):
-        last_msg = obj.messages.last()
+    def ultimo_mensaje(self, obj):
+        last_msg = obj.last_message
         if last_msg:
             return f"{last_msg.sender.username}: {last_msg.content[:50]}..."
         return "Sin mensajes"
-    last_message.short_description = 'Último mensaje'
+    ultimo_mensaje.short_description = 'Último mensaje'
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['id_short', 'room_info', 'sender', 'content_short', 'has_file', 'is_read', 'created_at']
-    list_filter = ['is_read', 'created_at', 'sender', 'room']
+    list_display = ['id_short', 'room_info', 'sender', 'content_short', 'has_file', 'leido', 'created_at']
+    list_select_related = ['room__student', 'room__teacher', 'sender']
+    list_filter = ['created_at', 'sender', 'room']
     search_fields = ['content', 'sender__username', 'room__student__username', 'room__teacher__username']
     readonly_fields = ['id', 'created_at']
     date_hierarchy = 'created_at'
     
     fieldsets = (
         ('Información del Mensaje', {
-            'fields': ('id', 'room', 'sender', 'content', 'is_read')
+            'fields': ('id', 'room', 'sender', 'content')
         }),
         ('Archivo Adjunto', {
             'fields': ('file', 'file_name', 'file_size'),
@@ -87,15 +103,35 @@ class MessageAdmin(admin.ModelAdmin):
         return "✅" if obj.file else "❌"
     has_file.short_description = 'Archivo'
 
+    def leido(self, obj):
+        return obj.is_read
+    leido.boolean = True
+    leido.short_description = 'Leído'
+
     # Acciones personalizadas
-    actions = ['mark_as_read', 'mark_as_unread']
+    actions = ['mark_as_read']
 
     def mark_as_read(self, request, queryset):
-        updated = queryset.update(is_read=True)
-        self.message_user(request, f"{updated} mensajes marcados como leídos.")
+        # Con marcas de lectura, marcar un mensaje marca también los anteriores de su sala
+        updated = 0
+        for message in queryset.select_related('room').order_by('-created_at'):
+            room = message.room
+            destinatario = room.teacher_id if message.sender_id == room.student_id else room.student_id
+            updated += room.marcar_leido(destinatario, hasta=message)
+        self.message_user(request, f"{updated} salas con la marca de lectura actualizada.")
     mark_as_read.short_description = "Marcar como leído"
 
-    def mark_as_unread(self, request, queryset):
-        updated = queryset.update(is_read=False)
-        self.message_user(request, f"{updated} mensajes marcados como no leídos.")
-    mark_as_unread.short_description = "Marcar como no leído"
\ No newline at end of file
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'event', 'channel', 'created_at', 'sent_at', 'attempts']
+    list_filter = ['event', 'sent_at']
+    search_fields = ['channel']
+    readonly_fields = ['channel', 'event', 'data', 'created_at', 'sent_at', 'attempts', 'last_error', 'claimed_until']
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'user', 'room', 'offset', 'total_size', 'status', 'updated_at']
+    list_filter = ['status', 'updated_at']
+    search_fields = ['file_name', 'user__username']
+    readonly_fields = ['id', 'user', 'room', 'file_name', 'total_size', 'offset', 'message', 'created_at', 'updated_at']
@@ -0,0 +1,92 @@
+# chatRoom/busqueda.py
+"""
+Búsqueda de texto completo en el historial de chat.
+
+En SQLite se consulta el índice FTS5 chatRoom_message_fts (migración 0006), que los
+triggers mantienen al crear, editar y borrar mensajes; los resultados salen ordenados
+por relevancia (bm25) con el fragmento coincidente resaltado. En otras bases de datos
+se cae a icontains, sin resaltado, ordenado por fecha.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import ChatRoom, Message
+
+# Marcadores temporales del resaltado: se sustituyen por <mark> después de escapar el texto
+INICIO_MARCA, FIN_MARCA = '\x02', '\x03'
+# Palabras del fragmento de contenido que devuelve snippet()
+PALABRAS_FRAGMENTO = 16
+
+
+def terminos(texto):
+    """Palabras de la búsqueda (se ignora la sintaxis de FTS5 que pudiera escribir el usuario)"""
+    return re.findall(r'\w+', texto, flags=re.UNICODE)
+
+
+def _consulta_fts(palabras):
+    # Todas las palabras (AND) en contenido o nombre de archivo; la última como prefijo
+    partes = [f'"{palabra}"' for palabra in palabras]
+    partes[-1] += '*'
+    return '{content file_name} : (' + ' '.join(partes) + ')'
+
+
+def _resaltado(texto):
+    if not texto:
+        return texto
+    return html.escape(texto).replace(INICIO_MARCA, '<mark>').replace(FIN_MARCA, '</mark>')
+
+
+def buscar_mensajes(usuario, texto, room_id=None, offset=0, limite=20):
+    """
+    Mensajes de las salas de `usuario` que contienen `texto`. Devuelve una lista de
+    (mensaje, contenido_resaltado, archivo_resaltado) con hasta `limite` + 1 elementos
+    para que quien llama sepa si hay más páginas.
+    """
+    palabras = terminos(texto)
+    if not palabras:
+        return []
+
+    salas = ChatRoom.objects.filter(Q(student=usuario) | Q(teacher=usuario))
+    if room_id:
+        salas = salas.filter(id=room_id)
+
+    if connection.vendor != 'sqlite':
+        filtro = Q()
+        for palabra in palabras:
+            filtro &= Q(content__icontains=palabra) | Q(file_name__icontains=palabra)
+        mensajes = (
+            Message.objects.filter(filtro, room__in=salas)
+            .select_related('sender', 'room')
+            .order_by('-created_at', '-id')[offset:offset + limite + 1]
+        )
+        return [(mensaje, html.escape(mensaje.content), mensaje.file_name and html.escape(mensaje.file_name))
+                for mensaje in mensajes]
+
+    salas_sql, salas_params = salas.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT fts.message_id,
+                   snippet("chatRoom_message_fts", 0, %s, %s, '…', %s),
+                   highlight("chatRoom_message_fts", 1, %s, %s)
+            FROM "chatRoom_message_fts" fts
+            JOIN "chatRoom_message" m ON m.id = fts.message_id
+            WHERE "chatRoom_message_fts" MATCH %s AND m.room_id IN ({salas_sql})
+            ORDER BY bm25("chatRoom_message_fts", 10.0, 5.0, 0.0), m.created_at DESC
+            LIMIT %s OFFSET %s
+            ''',
+            [INICIO_MARCA, FIN_MARCA, PALABRAS_FRAGMENTO, INICIO_MARCA, FIN_MARCA,
+             _consulta_fts(palabras), *salas_params, limite + 1, offset]
+        )
+        filas = cursor.fetchall()
+
+    mensajes = Message.objects.select_related('sender', 'room').in_bulk([message_id for message_id, _, _ in filas])
+    resultados = []
+    for message_id, contenido, archivo in filas:
+        mensaje = mensajes.get(Message._meta.pk.to_python(message_id))
+        if mensaje is not None:
+            resultados.append((mensaje, _resaltado(contenido), _resaltado(archivo) or None))
+    return resultados
@@ -0,0 +1,138 @@
+# chatRoom/difusion.py
+"""
+Canal en tiempo real propio, servido por ASGI con Server-Sent Events.
+
+Cada proceso ASGI tiene un Difusor: reparte en memoria los eventos de cada canal
+`chat-room-<id>` entre las conexiones abiertas en ese proceso. Los eventos llegan de un
+broker compartido por todos los procesos (TIEMPO_REAL_BROKER). El broker por defecto es
+el propio outbox: una sola consulta por id cada TIEMPO_REAL_SONDEO segundos y proceso, da
+igual cuántos clientes haya conectados. Otro broker (Redis, por ejemplo) solo tiene que
+implementar `ultimo_id()` y `leer(desde_id, canales)`.
+
+Los eventos se emiten con el mismo nombre y los mismos datos que en Pusher
+(new-message, message-deleted, messages-read) y el id del outbox como id SSE, así que un
+cliente que reconecta con Last-Event-ID recibe lo que se perdió.
+
+Los ids del outbox se asignan al insertar, no al confirmar: una transacción lenta puede
+hacer visible un id menor que otros ya leídos. Por eso cada sondeo relee los últimos
+VENTANA_REORDEN ids por detrás del mayor visto y descarta los repetidos; un evento que
+tarde más que eso en confirmarse no se difunde en vivo. Last-Event-ID y el cursor de
+sync_chat siguen siendo marcas de máximo, con el mismo límite al reconectar.
+"""
+import asyncio
+from collections import defaultdict
+import logging
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Eventos que se leen del broker por consulta
+EVENTOS_POR_LECTURA = 500
+# Ids por detrás del mayor leído que se releen en cada sondeo (eventos confirmados tarde)
+VENTANA_REORDEN = 200
+# Eventos que puede acumular una conexión lenta antes de cerrarla (reconecta con Last-Event-ID)
+COLA_MAXIMA = 1000
+
+
+class BrokerOutbox:
+    """Lee los eventos directamente de la tabla OutboxEvent, ordenados por id"""
+
+    async def ultimo_id(self):
+        ultimo = await OutboxEvent.objects.order_by('-id').values_list('id', flat=True).afirst()
+        return ultimo or 0
+
+    async def leer(self, desde_id, canales):
+        consulta = (
+            OutboxEvent.objects
+            .filter(id__gt=desde_id, channel__in=list(canales))
+            .order_by('id')
+            .values_list('id', 'channel', 'event', 'data')
+        )
+        return [evento async for evento in consulta[:EVENTOS_POR_LECTURA]]
+
+
+class Difusor:
+    """Suscripciones por canal de un proceso, alimentadas por una única tarea que sondea el broker"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.suscriptores = defaultdict(set)
+        self._tarea = None
+
+    async def suscribir(self, canales, desde_id=None):
+        """
+        Devuelve una cola con los eventos de `canales`. Con `desde_id` se reenvían primero
+        los posteriores a ese id; pueden llegar repetidos y desordenados, el consumidor
+        descarta por id los que ya ha enviado.
+        """
+        cola = asyncio.Queue(maxsize=COLA_MAXIMA)
+        for canal in canales:
+            self.suscriptores[canal].add(cola)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._sondear())
+
+        if desde_id is not None:
+            while True:
+                eventos = await self.broker.leer(desde_id, canales)
+                for evento in eventos:
+                    self._encolar(cola, evento)
+                if len(eventos) < EVENTOS_POR_LECTURA:
+                    break
+                desde_id = eventos[-1][0]
+        return cola
+
+    def cancelar(self, canales, cola):
+        for canal in canales:
+            colas = self.suscriptores.get(canal)
+            if colas is not None:
+                colas.discard(cola)
+                if not colas:
+                    del self.suscriptores[canal]
+
+    def _encolar(self, cola, evento):
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: se le cierra la conexión y recupera al reconectar
+            cola.get_nowait()
+            cola.put_nowait(None)
+
+    async def _sondear(self):
+        # Lo anterior al arranque ya no se difunde; después, cada id una sola vez
+        inicio = desde = ultimo = await self.broker.ultimo_id()
+        vistos = set()
+        while self.suscriptores:
+            try:
+                eventos = await self.broker.leer(desde, list(self.suscriptores))
+            except Exception as e:
+                logger.error(f"Error leyendo eventos en tiempo real: {e}")
+                eventos = []
+            for evento in eventos:
+                if evento[0] <= inicio or evento[0] in vistos:
+                    continue
+                vistos.add(evento[0])
+                ultimo = max(ultimo, evento[0])
+                for cola in list(self.suscriptores.get(evento[1], ())):
+                    self._encolar(cola, evento)
+            if len(eventos) == EVENTOS_POR_LECTURA:
+                # Queda más: se sigue por la página siguiente sin esperar
+                desde = eventos[-1][0]
+                continue
+            desde = max(ultimo - VENTANA_REORDEN, inicio)
+            vistos = {evento_id for evento_id in vistos if evento_id > desde}
+            await asyncio.sleep(settings.TIEMPO_REAL_SONDEO)
+
+
+_difusor = None
+
+
+def difusor():
+    """Difusor del proceso (se crea con el primer cliente, dentro del bucle de eventos de ASGI)"""
+    global _difusor
+    if _difusor is None:
+        _difusor = Difusor(import_string(settings.TIEMPO_REAL_BROKER)())
+    return _difusor
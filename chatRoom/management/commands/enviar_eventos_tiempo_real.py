@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatRoom.realtime import enviar_pendientes, purgar_enviados
+
+# Cada cuántos segundos se borran los eventos antiguos mientras el worker está en marcha
+PURGA_CADA_SEGUNDOS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Worker que entrega a Pusher los eventos en tiempo real pendientes del outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=settings.TIEMPO_REAL_LOTE,
+            help="Eventos leídos por pasada"
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help="Vaciar los pendientes y terminar en lugar de quedarse esperando"
+        )
+
+    def handle(self, *args, **options):
+        ultima_purga = None
+        total = 0
+        try:
+            while True:
+                if ultima_purga is None or time.monotonic() - ultima_purga > PURGA_CADA_SEGUNDOS:
+                    borrados = purgar_enviados()
+                    if borrados:
+                        self.stdout.write(f"{borrados} eventos antiguos borrados")
+                    ultima_purga = time.monotonic()
+
+                leidos = enviar_pendientes(options['lote'])
+                total += leidos
+                if leidos < options['lote']:
+                    if options['una_vez']:
+                        break
+                    time.sleep(settings.TIEMPO_REAL_ESPERA)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} eventos procesados"))
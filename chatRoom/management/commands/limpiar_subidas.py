@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatRoom.subidas import purgar_abandonadas
+
+
+class Command(BaseCommand):
+    help = "Borra las subidas por trozos abandonadas y sus archivos temporales"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas', type=int, default=settings.CHAT_SUBIDAS_CADUCIDAD_HORAS,
+            help="Horas sin recibir trozos tras las que una subida se da por abandonada"
+        )
+
+    def handle(self, *args, **options):
+        borradas = purgar_abandonadas(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {borradas} subidas abandonadas borradas"))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def rellenar_salas(apps, schema_editor):
+    """Calcula último mensaje y no leídos de las salas existentes en un solo UPDATE"""
+    ChatRoom = apps.get_model('chatRoom', 'ChatRoom')
+    Message = apps.get_model('chatRoom', 'Message')
+
+    ultimo = Message.objects.filter(room=OuterRef('pk')).order_by('-created_at', '-id')
+
+    def no_leidos(participante):
+        pendientes = (
+            Message.objects
+            .filter(room=OuterRef('pk'), is_read=False)
+            .exclude(sender=OuterRef(participante))
+            .order_by()
+            .values('room')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return Coalesce(Subquery(pendientes), Value(0))
+
+    ChatRoom.objects.update(
+        last_message=Subquery(ultimo.values('id')[:1]),
+        last_message_at=Subquery(ultimo.values('created_at')[:1]),
+        unread_student=no_leidos('student'),
+        unread_teacher=no_leidos('teacher'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatRoom', '0002_message_room_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatRoom.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='unread_student',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='unread_teacher',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(rellenar_salas, migrations.RunPython.noop),
+    ]
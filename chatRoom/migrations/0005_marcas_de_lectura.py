@@ -0,0 +1,74 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def marcas_desde_is_read(apps, schema_editor):
+    """
+    La marca de cada participante pasa a ser el último mensaje del otro que tenía
+    is_read; los no leídos se recalculan como los mensajes del otro posteriores a ella.
+    """
+    ChatRoom = apps.get_model('chatRoom', 'ChatRoom')
+    Message = apps.get_model('chatRoom', 'Message')
+
+    for papel in ('student', 'teacher'):
+        leidos = (
+            Message.objects
+            .filter(room=OuterRef('pk'), is_read=True)
+            .exclude(sender=OuterRef(papel))
+            .order_by('-created_at', '-id')
+        )
+        ChatRoom.objects.update(**{
+            f'{papel}_last_read_at': Subquery(leidos.values('created_at')[:1]),
+            f'{papel}_last_read_message': Subquery(leidos.values('id')[:1]),
+        })
+
+        pendientes = (
+            Message.objects
+            .filter(room=OuterRef('pk'))
+            .exclude(sender=OuterRef(papel))
+            .filter(Q(**{f'room__{papel}_last_read_at__isnull': True}) | Q(created_at__gt=OuterRef(f'{papel}_last_read_at')))
+            .order_by()
+            .values('room')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        ChatRoom.objects.update(**{f'unread_{papel}': Coalesce(Subquery(pendientes), Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatRoom', '0004_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='student_last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='student_last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatRoom.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='teacher_last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='teacher_last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatRoom.message'),
+        ),
+        migrations.RunPython(marcas_desde_is_read, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:27
+
+from django.db import migrations
+
+
+# Índice FTS5 propio (no external content: el rowid de chatRoom_message puede cambiar con
+# VACUUM). message_id también se indexa para localizar la fila a borrar sin recorrer la tabla.
+CREAR = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS "chatRoom_message_fts" USING fts5(
+        content, file_name, message_id,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "chatRoom_message_fts_insert" AFTER INSERT ON "chatRoom_message" BEGIN
+        INSERT INTO "chatRoom_message_fts" (content, file_name, message_id)
+        VALUES (new.content, coalesce(new.file_name, ''), new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "chatRoom_message_fts_delete" AFTER DELETE ON "chatRoom_message" BEGIN
+        DELETE FROM "chatRoom_message_fts" WHERE rowid IN (
+            SELECT rowid FROM "chatRoom_message_fts" WHERE "chatRoom_message_fts" MATCH 'message_id : "' || old.id || '"'
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "chatRoom_message_fts_update" AFTER UPDATE OF content, file_name ON "chatRoom_message" BEGIN
+        DELETE FROM "chatRoom_message_fts" WHERE rowid IN (
+            SELECT rowid FROM "chatRoom_message_fts" WHERE "chatRoom_message_fts" MATCH 'message_id : "' || old.id || '"'
+        );
+        INSERT INTO "chatRoom_message_fts" (content, file_name, message_id)
+        VALUES (new.content, coalesce(new.file_name, ''), new.id);
+    END
+    """,
+    """
+    INSERT INTO "chatRoom_message_fts" (content, file_name, message_id)
+    SELECT content, coalesce(file_name, ''), id FROM "chatRoom_message"
+    """,
+]
+
+BORRAR = [
+    'DROP TRIGGER IF EXISTS "chatRoom_message_fts_insert"',
+    'DROP TRIGGER IF EXISTS "chatRoom_message_fts_delete"',
+    'DROP TRIGGER IF EXISTS "chatRoom_message_fts_update"',
+    'DROP TABLE IF EXISTS "chatRoom_message_fts"',
+]
+
+
+def _ejecutar(sentencias):
+    def ejecutar(apps, schema_editor):
+        # Solo SQLite tiene FTS5; en otras bases de datos la búsqueda usa icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sentencia in sentencias:
+            schema_editor.execute(sentencia)
+    return ejecutar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatRoom', '0005_marcas_de_lectura'),
+    ]
+
+    operations = [
+        migrations.RunPython(_ejecutar(CREAR), _ejecutar(BORRAR)),
+    ]
@@ -1,6 +1,9 @@
 # chatRoom/models.py
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+import os
 import uuid
 
 class ChatRoom(models.Model):
@@ -18,6 +21,38 @@ class ChatRoom(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Desnormalizado: se mantiene con UPDATE ... F() al crear, borrar y leer mensajes
+    # (ver chatRoom/signals.py) para que los listados de chats lean solo esta tabla
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    unread_student = models.PositiveIntegerField(default=0)
+    unread_teacher = models.PositiveIntegerField(default=0)
+
+    # Marca de lectura de cada participante: los mensajes del otro creados hasta
+    # `*_last_read_at` están leídos (Message.is_read se deriva de aquí)
+    student_last_read_at = models.DateTimeField(null=True, blank=True)
+    student_last_read_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    teacher_last_read_at = models.DateTimeField(null=True, blank=True)
+    teacher_last_read_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+
     class Meta:
         unique_together = ['student', 'teacher']
         ordering = ['-updated_at']
@@ -25,6 +60,59 @@ class ChatRoom(models.Model):
     def __str__(self):
         return f"Chat: {self.student.username} - {self.teacher.username}"
 
+    def participante(self, user_id):
+        """'student' o 'teacher' según el papel de `user_id` en la sala (None si no es de la sala)"""
+        if user_id == self.student_id:
+            return 'student'
+        if user_id == self.teacher_id:
+            return 'teacher'
+        return None
+
+    def unread_for(self, user):
+        papel = self.participante(user.id)
+        return getattr(self, f'unread_{papel}') if papel else 0
+
+    def leido_hasta(self, user_id):
+        papel = self.participante(user_id)
+        return getattr(self, f'{papel}_last_read_at') if papel else None
+
+    def marcar_leido(self, lector_id, hasta=None):
+        """
+        Avanza la marca de lectura de `lector_id` en una sola fila. Sin `hasta` marca la
+        sala entera: la marca y el contador se toman del último mensaje en el mismo UPDATE,
+        así que un mensaje que llegue a la vez no se pierde. Con `hasta` (un mensaje) solo
+        avanza si es posterior a la marca actual y el contador se recalcula con un COUNT
+        sobre el índice (room, created_at, id). Devuelve si la marca ha cambiado.
+        """
+        papel = self.participante(lector_id)
+        if papel is None:
+            return False
+        salas = ChatRoom.objects.filter(pk=self.pk)
+
+        if hasta is None:
+            return bool(salas.exclude(**{f'unread_{papel}': 0}).update(**{
+                f'{papel}_last_read_at': F('last_message_at'),
+                f'{papel}_last_read_message': F('last_message'),
+                f'unread_{papel}': 0,
+            }))
+
+        pendientes = (
+            Message.objects
+            .filter(room=OuterRef('pk'), created_at__gt=hasta.created_at)
+            .exclude(sender_id=lector_id)
+            .order_by()
+            .values('room')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return bool(salas.filter(
+            Q(**{f'{papel}_last_read_at__isnull': True}) | Q(**{f'{papel}_last_read_at__lt': hasta.created_at})
+        ).update(**{
+            f'{papel}_last_read_at': hasta.created_at,
+            f'{papel}_last_read_message': hasta.pk,
+            f'unread_{papel}': Coalesce(Subquery(pendientes), Value(0)),
+        }))
+
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
@@ -33,11 +121,81 @@ class Message(models.Model):
     file = models.FileField(upload_to='chat_files/', null=True, blank=True)
     file_name = models.CharField(max_length=255, null=True, blank=True)
     file_size = models.IntegerField(null=True, blank=True)
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Paginación por cursor del historial de una sala
+            models.Index(fields=['room', 'created_at', 'id'], name='message_room_cursor'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender.username}: {self.content[:50]}"
+
+    @property
+    def is_read(self):
+        """Leído si el destinatario tiene la marca de lectura en este mensaje o después"""
+        room = self.room
+        leido_hasta = room.leido_hasta(room.teacher_id if self.sender_id == room.student_id else room.student_id)
+        return leido_hasta is not None and self.created_at <= leido_hasta
+
+
+class OutboxEvent(models.Model):
+    """
+    Evento en tiempo real pendiente de entregar (outbox transaccional). Se guarda en la
+    misma transacción que el cambio que lo origina y lo envía el worker
+    `enviar_eventos_tiempo_real`, así que la petición no espera a Pusher y los eventos
+    sobreviven a un reinicio.
+    """
+    channel = models.CharField(max_length=200)
+    event = models.CharField(max_length=50)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Reservado por un worker hasta este instante mientras lo entrega (fuera de transacción)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # El worker lee los pendientes por orden de llegada
+            models.Index(fields=['sent_at', 'id'], name='outbox_pendientes'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} -> {self.channel}"
+
+
+class ChunkedUpload(models.Model):
+    """
+    Subida reanudable de un adjunto del chat. Los trozos se añaden en orden a un archivo
+    temporal en CHAT_SUBIDAS_DIR; `offset` es lo ya recibido y confirmado, así que un
+    cliente que se corta pregunta por él y sigue desde ahí. Al completarse se crea el
+    Message con el archivo.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('completada', 'Completada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_uploads')
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='uploads')
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    content = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.sender.username}: {self.content[:50]}"
\ No newline at end of file
+        return f"{self.file_name} ({self.offset}/{self.total_size})"
+
+    @property
+    def ruta_temporal(self):
+        return os.path.join(settings.CHAT_SUBIDAS_DIR, f'{self.id}.part')
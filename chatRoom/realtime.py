@@ -0,0 +1,239 @@
+# chatRoom/realtime.py
+"""
+Eventos en tiempo real del chat (Pusher) a través de un outbox transaccional.
+
+Las vistas llaman a `publicar()` dentro de su transacción: el evento queda guardado en
+OutboxEvent junto con el mensaje y la petición responde sin esperar a Pusher. El worker
+(`python manage.py enviar_eventos_tiempo_real`) reserva los pendientes por orden en una
+transacción corta, los funde por canal y los entrega fuera de cualquier transacción con
+el backend de TIEMPO_REAL_BACKEND (Pusher por defecto); el resultado se apunta en otra
+transacción corta. Así la base de datos no queda bloqueada durante la llamada a Pusher.
+Si una entrega falla, los eventos siguen pendientes y se reintentan en la próxima pasada.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+import logging
+
+import pusher
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Límite de eventos por llamada a trigger_batch de Pusher
+EVENTOS_POR_BATCH = 10
+
+# Configurar Pusher con manejo de errores
+try:
+    pusher_client = pusher.Pusher(
+        app_id=settings.PUSHER_APP_ID,
+        key=settings.PUSHER_KEY,
+        secret=settings.PUSHER_SECRET,
+        cluster=settings.PUSHER_CLUSTER,
+        ssl=True
+    )
+    PUSHER_AVAILABLE = True
+    logger.info("Pusher configurado correctamente")
+except Exception as e:
+    logger.error(f"Error configurando Pusher: {e}")
+    PUSHER_AVAILABLE = False
+    pusher_client = None
+
+
+def canal_sala(room_id):
+    return f'chat-room-{room_id}'
+
+
+def datos_mensaje(message):
+    """Mensaje tal como lo recibe el cliente en 'new-message' (ids como texto para JSON)"""
+    return {
+        'id': str(message.id),
+        'room': str(message.room_id),
+        'sender': {
+            'id': message.sender.id,
+            'username': message.sender.username,
+            'email': message.sender.email,
+            'role': message.sender.role,
+            'country': message.sender.country
+        },
+        'content': message.content,
+        'file': message.file.url if message.file else None,
+        'file_name': message.file_name,
+        'file_size': message.file_size,
+        'is_read': message.is_read,
+        'created_at': message.created_at.isoformat()
+    }
+
+
+def publicar(channel, event, data):
+    """Encola un evento; se envía solo si la transacción en curso se confirma"""
+    return OutboxEvent.objects.create(channel=channel, event=event, data=data)
+
+
+def _agrupar(eventos):
+    """
+    Funde por canal los eventos que otro posterior deja sin efecto, manteniendo el orden de
+    llegada del resto. Devuelve (a_entregar, ids_omitidos):
+    - Varios 'messages-read' del mismo usuario se funden en el último, con los mensajes
+      sumados: para el cliente solo cuenta que a esa altura ya está todo leído.
+    - Un 'new-message' seguido de su 'message-deleted' no se entrega: el cliente nunca
+      llegó a ver el mensaje.
+    """
+    pendientes = []
+    lecturas = {}
+    nuevos = {}  # (canal, message_id) -> 'new-message' aún sin entregar
+    omitidos = []
+    for evento in eventos:
+        if evento.event == 'messages-read':
+            clave = (evento.channel, evento.data.get('user_id'))
+            previo = lecturas.get(clave)
+            if previo is not None:
+                pendientes.remove(previo)
+                evento.data['messages_updated'] = (
+                    previo['data'].get('messages_updated', 0) + evento.data.get('messages_updated', 0)
+                )
+                evento_ids = previo['ids'] + [evento.id]
+            else:
+                evento_ids = [evento.id]
+            lecturas[clave] = {'channel': evento.channel, 'name': evento.event, 'data': evento.data, 'ids': evento_ids}
+            pendientes.append(lecturas[clave])
+            continue
+
+        if evento.event == 'message-deleted':
+            creado = nuevos.pop((evento.channel, evento.data.get('message_id')), None)
+            if creado is not None:
+                pendientes.remove(creado)
+                omitidos.extend(creado['ids'] + [evento.id])
+                continue
+
+        pendiente = {'channel': evento.channel, 'name': evento.event, 'data': evento.data, 'ids': [evento.id]}
+        if evento.event == 'new-message':
+            nuevos[(evento.channel, evento.data.get('message', {}).get('id'))] = pendiente
+        pendientes.append(pendiente)
+    return pendientes, omitidos
+
+
+class BackendPusher:
+    """Entrega los eventos a Pusher con trigger_batch"""
+
+    def entregar(self, batch):
+        if not PUSHER_AVAILABLE or pusher_client is None:
+            raise RuntimeError("Pusher no disponible")
+        pusher_client.trigger_batch([
+            {'channel': evento['channel'], 'name': evento['name'], 'data': evento['data']}
+            for evento in batch
+        ])
+
+
+class BackendLocal:
+    """
+    Sin servicio externo: los procesos ASGI leen el outbox y reparten los eventos a sus
+    clientes SSE (chatRoom/difusion.py), así que el worker solo los marca como enviados.
+    """
+
+    def entregar(self, batch):
+        pass
+
+
+@lru_cache(maxsize=None)
+def backend():
+    return import_string(settings.TIEMPO_REAL_BACKEND)()
+
+
+def _reservar(lote):
+    """
+    Reserva (claimed_until) hasta `lote` eventos pendientes en una transacción corta.
+    Se saltan los canales que otro worker tiene reservados para no desordenar sus eventos.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        # skip_locked permite varios workers en bases de datos que lo soportan
+        eventos = list(
+            OutboxEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, attempts__lt=settings.TIEMPO_REAL_MAX_INTENTOS)
+            .exclude(claimed_until__gt=ahora)
+            .order_by('id')[:lote]
+        )
+        if not eventos:
+            return []
+        ocupados = set(
+            OutboxEvent.objects
+            .filter(sent_at__isnull=True, claimed_until__gt=ahora, channel__in={evento.channel for evento in eventos})
+            .values_list('channel', flat=True)
+        )
+        eventos = [evento for evento in eventos if evento.channel not in ocupados]
+        OutboxEvent.objects.filter(id__in=[evento.id for evento in eventos]).update(
+            claimed_until=ahora + timedelta(seconds=settings.TIEMPO_REAL_RESERVA)
+        )
+    return eventos
+
+
+def enviar_pendientes(lote=None):
+    """
+    Una pasada del worker: entrega hasta `lote` eventos pendientes y devuelve cuántos ha
+    leído. Cuando un batch falla, los canales afectados no envían nada más en esta pasada
+    para no desordenar sus eventos.
+    """
+    lote = lote or settings.TIEMPO_REAL_LOTE
+    eventos = _reservar(lote)
+    if not eventos:
+        return 0
+
+    a_entregar, enviados = _agrupar(eventos)
+    fallidos = defaultdict(list)  # error -> ids
+    bloqueados = set()
+    batch = []
+
+    def enviar(batch):
+        ids = [evento_id for evento in batch for evento_id in evento['ids']]
+        try:
+            backend().entregar(batch)
+            enviados.extend(ids)
+        except Exception as e:
+            logger.error(f"Error entregando {len(ids)} eventos en tiempo real: {e}")
+            bloqueados.update(evento['channel'] for evento in batch)
+            fallidos[str(e)[:500]].extend(ids)
+
+    # La llamada al backend va fuera de transacción: no retiene ningún bloqueo de la base de datos
+    for evento in a_entregar:
+        if evento['channel'] in bloqueados:
+            continue
+        batch.append(evento)
+        if len(batch) == EVENTOS_POR_BATCH:
+            enviar(batch)
+            batch = []
+    if batch:
+        enviar(batch)
+
+    with transaction.atomic():
+        if enviados:
+            OutboxEvent.objects.filter(id__in=enviados).update(sent_at=timezone.now(), claimed_until=None)
+        for error, ids in fallidos.items():
+            OutboxEvent.objects.filter(id__in=ids).update(
+                attempts=F('attempts') + 1, last_error=error, claimed_until=None
+            )
+        # Lo que se saltó por un fallo en su canal queda libre para la próxima pasada
+        OutboxEvent.objects.filter(id__in=[evento.id for evento in eventos], sent_at__isnull=True).update(
+            claimed_until=None
+        )
+
+    logger.info(
+        f"Eventos en tiempo real: {len(enviados)} enviados, {sum(map(len, fallidos.values()))} fallidos"
+    )
+    return len(eventos)
+
+
+def purgar_enviados(dias=None):
+    """Borra los eventos ya enviados (o descartados tras agotar reintentos) más antiguos que `dias`"""
+    dias = settings.TIEMPO_REAL_RETENCION_DIAS if dias is None else dias
+    borrados, _ = OutboxEvent.objects.filter(created_at__lt=timezone.now() - timedelta(days=dias)).exclude(
+        sent_at__isnull=True, attempts__lt=settings.TIEMPO_REAL_MAX_INTENTOS
+    ).delete()
+    return borrados
@@ -19,7 +19,7 @@ class MessageSerializer(serializers.ModelSerializer):
     
     # Convertir UUID a string para JSON
     id = serializers.UUIDField(read_only=True)
-    room = serializers.UUIDField(source='room.id', read_only=True)
+    room = serializers.UUIDField(source='room_id', read_only=True)
     
     class Meta:
         model = Message
@@ -49,19 +49,23 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatRoom
         fields = ['id', 'student', 'teacher', 'created_at', 'updated_at', 
-                 'last_message', 'unread_count']
+                 'last_message', 'last_message_at', 'unread_count']
+
+    @staticmethod
+    def optimizar(queryset):
+        """Participantes y último mensaje (con su autor) en la misma consulta que las salas"""
+        return queryset.select_related('student', 'teacher', 'last_message__sender')
 
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
-        if last_message:
-            return MessageSerializer(last_message).data
+        if obj.last_message:
+            # is_read se deriva de las marcas de la sala, que ya está cargada
+            obj.last_message.room = obj
+            return MessageSerializer(obj.last_message).data
         return None
 
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            # Solo contar mensajes de otros usuarios que no estén leídos
-            return obj.messages.filter(
-                is_read=False
-            ).exclude(sender=request.user).count()
-        return 0
\ No newline at end of file
+            # Contador desnormalizado de los mensajes de otros usuarios sin leer
+            return obj.unread_for(request.user)
+        return 0
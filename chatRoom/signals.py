@@ -0,0 +1,60 @@
+# chatRoom/signals.py
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import ChatRoom, Message
+
+
+def _contador_destinatario(message, expresion):
+    """
+    Aplica `expresion(campo)` al contador del destinatario: si escribe el alumno cuenta
+    para el profesor y viceversa. Se resuelve en el propio UPDATE, sin leer la sala.
+    """
+    escribe_alumno = Q(student_id=message.sender_id)
+    entero = PositiveIntegerField()
+    return {
+        'unread_teacher': Case(
+            When(escribe_alumno, then=expresion('teacher')), default=F('unread_teacher'), output_field=entero
+        ),
+        'unread_student': Case(
+            When(escribe_alumno, then=F('unread_student')), default=expresion('student'), output_field=entero
+        ),
+    }
+
+
+@receiver(post_save, sender=Message)
+def registrar_mensaje_en_sala(sender, instance, created, **kwargs):
+    """Un mensaje nuevo actualiza último mensaje, fecha y no leídos de la sala en un único UPDATE"""
+    if not created:
+        return
+    # Si llegan dos mensajes a la vez, el último por fecha se queda aunque su UPDATE llegue antes
+    mas_reciente = Q(last_message_at__isnull=True) | Q(last_message_at__lte=instance.created_at)
+    campos = {
+        'last_message': Case(When(mas_reciente, then=Value(instance.pk)), default=F('last_message')),
+        'last_message_at': Case(When(mas_reciente, then=Value(instance.created_at)), default=F('last_message_at')),
+        'updated_at': Greatest(F('updated_at'), Value(instance.created_at)),
+    }
+    campos.update(_contador_destinatario(instance, lambda papel: F(f'unread_{papel}') + Value(1)))
+    ChatRoom.objects.filter(pk=instance.room_id).update(**campos)
+
+
+@receiver(post_delete, sender=Message)
+def descontar_mensaje_de_sala(sender, instance, **kwargs):
+    # Solo descuenta si el destinatario aún no lo había leído (posterior a su marca de lectura)
+    def descontar_si_no_leido(papel):
+        no_leido = Q(**{f'{papel}_last_read_at__isnull': True}) | Q(**{f'{papel}_last_read_at__lt': instance.created_at})
+        campo = f'unread_{papel}'
+        return Case(
+            When(no_leido, then=Greatest(F(campo) - Value(1), Value(0))), default=F(campo),
+            output_field=PositiveIntegerField()
+        )
+    ChatRoom.objects.filter(pk=instance.room_id).update(**_contador_destinatario(instance, descontar_si_no_leido))
+
+    # Si era el último mensaje, SET_NULL ya ha vaciado last_message: se busca el anterior
+    anterior = Message.objects.filter(room=OuterRef('pk')).order_by('-created_at', '-id')
+    ChatRoom.objects.filter(pk=instance.room_id, last_message__isnull=True).update(
+        last_message=Subquery(anterior.values('id')[:1]),
+        last_message_at=Subquery(anterior.values('created_at')[:1]),
+    )
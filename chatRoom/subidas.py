@@ -0,0 +1,157 @@
+# chatRoom/subidas.py
+"""
+Subidas por trozos y reanudables de adjuntos del chat.
+
+Protocolo (ChunkedUploadViewSet, /api/chat/uploads/):
+1. POST con room_id, file_name y total_size -> id de la subida y offset 0.
+2. PUT <id>/chunk/ con el trozo en crudo (application/octet-stream), la cabecera
+   Upload-Offset con la posición donde empieza y X-Chunk-Sha256 con su hash. Si el
+   offset no es el esperado se responde 409 con el offset real.
+3. GET <id>/ tras un corte para saber desde dónde seguir.
+4. POST <id>/complete/ cuando offset == total_size -> crea el Message con el archivo.
+
+El cuerpo se lee del stream en bloques y se escribe a un archivo del trozo mientras se
+calcula el hash; solo si el hash coincide se añade al archivo de la subida, con la fila
+bloqueada para que dos peticiones no escriban a la vez. Ningún paso carga el archivo
+(ni un trozo) entero en memoria.
+"""
+from datetime import timedelta
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload, Message
+from .realtime import publicar, canal_sala, datos_mensaje
+
+# Bytes leídos o copiados de una vez
+BLOQUE = 64 * 1024
+
+
+class ErrorSubida(ValueError):
+    status = 400
+
+
+class OffsetIncorrecto(ErrorSubida):
+    status = 409
+
+    def __init__(self, offset):
+        super().__init__(f"La subida continúa en el byte {offset}")
+        self.offset = offset
+
+
+class TrozoDemasiadoGrande(ErrorSubida):
+    status = 413
+
+
+def _copiar(origen, destino):
+    while True:
+        bloque = origen.read(BLOQUE)
+        if not bloque:
+            return
+        destino.write(bloque)
+
+
+def anadir_trozo(subida, offset, flujo, sha256):
+    """Escribe el trozo que llega por `flujo` a continuación de lo recibido y devuelve el nuevo offset"""
+    if subida.status != 'pendiente':
+        raise ErrorSubida("La subida ya está completada")
+    if offset != subida.offset:
+        raise OffsetIncorrecto(subida.offset)
+    if not sha256:
+        raise ErrorSubida("Falta la cabecera X-Chunk-Sha256")
+
+    os.makedirs(settings.CHAT_SUBIDAS_DIR, exist_ok=True)
+    ruta_trozo = os.path.join(settings.CHAT_SUBIDAS_DIR, f'{subida.id}.{uuid.uuid4().hex}.chunk')
+    maximo = min(settings.CHAT_SUBIDAS_MAX_TROZO, subida.total_size - offset)
+    resumen = hashlib.sha256()
+    recibidos = 0
+    try:
+        with open(ruta_trozo, 'wb') as trozo:
+            while True:
+                bloque = flujo.read(BLOQUE) if flujo is not None else b''
+                if not bloque:
+                    break
+                recibidos += len(bloque)
+                if recibidos > maximo:
+                    raise TrozoDemasiadoGrande(f"El trozo supera los {maximo} bytes permitidos")
+                resumen.update(bloque)
+                trozo.write(bloque)
+
+        if not recibidos:
+            raise ErrorSubida("Trozo vacío")
+        if resumen.hexdigest() != sha256.strip().lower():
+            raise ErrorSubida("El checksum del trozo no coincide; reenvíalo")
+
+        with transaction.atomic():
+            actual = ChunkedUpload.objects.select_for_update().get(pk=subida.pk)
+            if actual.offset != offset:
+                raise OffsetIncorrecto(actual.offset)
+            with open(ruta_trozo, 'rb') as trozo, open(actual.ruta_temporal, 'ab') as destino:
+                # Si un intento anterior se cortó a medio añadir, se descarta lo que no se confirmó
+                destino.truncate(offset)
+                _copiar(trozo, destino)
+            actual.offset = offset + recibidos
+            actual.save(update_fields=['offset', 'updated_at'])
+        subida.offset = actual.offset
+        return subida.offset
+    finally:
+        if os.path.exists(ruta_trozo):
+            os.remove(ruta_trozo)
+
+
+def completar(subida):
+    """Adjunta el archivo ensamblado a un Message nuevo de la sala y publica 'new-message'"""
+    if subida.status == 'completada':
+        return subida.message
+    if subida.offset != subida.total_size:
+        raise OffsetIncorrecto(subida.offset)
+
+    with transaction.atomic():
+        subida = ChunkedUpload.objects.select_for_update().select_related('room').get(pk=subida.pk)
+        if subida.status == 'completada':
+            return subida.message
+        message = Message(
+            room=subida.room,
+            sender=subida.user,
+            content=subida.content or subida.file_name,
+            file_name=subida.file_name,
+            file_size=subida.total_size,
+        )
+        with open(subida.ruta_temporal, 'rb') as ensamblado:
+            # El almacenamiento copia por bloques (chunks()), sin leer el archivo entero
+            message.file.save(subida.file_name, File(ensamblado), save=False)
+        message.save()
+        publicar(canal_sala(message.room_id), 'new-message', {
+            'message': datos_mensaje(message),
+            'room_id': str(message.room_id)
+        })
+        subida.status = 'completada'
+        subida.message = message
+        subida.save(update_fields=['status', 'message', 'updated_at'])
+
+    borrar_temporales(subida)
+    return message
+
+
+def borrar_temporales(subida):
+    if os.path.exists(subida.ruta_temporal):
+        os.remove(subida.ruta_temporal)
+
+
+def purgar_abandonadas(horas=None):
+    """Borra las subidas pendientes sin trozos nuevos en `horas` (CHAT_SUBIDAS_CADUCIDAD_HORAS) y sus archivos"""
+    horas = settings.CHAT_SUBIDAS_CADUCIDAD_HORAS if horas is None else horas
+    limite = timezone.now() - timedelta(hours=horas)
+    borradas = 0
+    for subida in ChunkedUpload.objects.filter(status='pendiente', updated_at__lt=limite).iterator():
+        borrar_temporales(subida)
+        subida.delete()
+        borradas += 1
+    # Las completadas ya no tienen archivo temporal; solo se guardan como registro
+    ChunkedUpload.objects.filter(status='completada', updated_at__lt=limite).delete()
+    return borradas
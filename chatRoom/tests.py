@@ -1,3 +1,485 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+import hashlib
+import shutil
+import tempfile
+from unittest import skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.models import CustomUser
+from .difusion import Difusor
+from .models import ChatRoom, ChunkedUpload, Message, OutboxEvent
+from .realtime import backend, enviar_pendientes, publicar
+
+
+class MyChatsConsultasTest(TestCase):
+    """my_chats debe costar las mismas consultas tenga el usuario 2 o 12 salas"""
+
+    def setUp(self):
+        self.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alumno)
+
+    def _crear_salas(self, desde, hasta):
+        for i in range(desde, hasta):
+            profesor = CustomUser.objects.create_user(
+                username=f'profe{i}', email=f'profe{i}@test.com', password='x', role='teacher'
+            )
+            room = ChatRoom.objects.create(student=self.alumno, teacher=profesor)
+            Message.objects.create(room=room, sender=profesor, content='hola')
+            Message.objects.create(room=room, sender=self.alumno, content=f'último {i}')
+
+    def _consultas_my_chats(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/api/chat/rooms/my_chats/')
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas), respuesta.json()
+
+    def test_consultas_constantes(self):
+        self._crear_salas(0, 2)
+        pocas, _ = self._consultas_my_chats()
+
+        self._crear_salas(2, 12)
+        muchas, datos = self._consultas_my_chats()
+
+        self.assertEqual(pocas, muchas)
+        self.assertEqual(len(datos), 12)
+
+    def test_ultimo_mensaje_y_no_leidos(self):
+        self._crear_salas(0, 1)
+        _, datos = self._consultas_my_chats()
+
+        self.assertEqual(datos[0]['last_message']['content'], 'último 0')
+        self.assertEqual(datos[0]['last_message']['sender']['username'], 'alumno')
+        # Solo cuenta el mensaje del profesor, no el propio
+        self.assertEqual(datos[0]['unread_count'], 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', "el índice FTS5 (migración 0006) solo existe en SQLite")
+class BusquedaMensajesTest(TestCase):
+    """Búsqueda en el historial: los triggers de la migración 0006 mantienen el índice FTS5"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        otro = CustomUser.objects.create_user(
+            username='otro', email='otro@test.com', password='x', role='student'
+        )
+        cls.sala = ChatRoom.objects.create(student=cls.alumno, teacher=cls.profesor)
+        cls.sala_ajena = ChatRoom.objects.create(student=otro, teacher=cls.profesor)
+        Message.objects.create(room=cls.sala_ajena, sender=otro, content='Repasamos la canción de ayer')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.alumno)
+
+    def _buscar(self, q, **params):
+        respuesta = self.client.get('/api/chat/messages/search/', {'q': q, **params})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['results']
+
+    def test_sin_tildes_y_por_prefijo(self):
+        mensaje = Message.objects.create(room=self.sala, sender=self.profesor, content='Practica la canción nueva')
+
+        for q in ('cancion', 'CANCIÓN', 'canc'):
+            resultados = self._buscar(q)
+            self.assertEqual([r['id'] for r in resultados], [str(mensaje.id)], q)
+        self.assertIn('<mark>canción</mark>', resultados[0]['content_highlight'])
+
+    def test_resaltado_escapa_html(self):
+        Message.objects.create(room=self.sala, sender=self.profesor, content='<script>alert(1)</script> deberes')
+
+        resaltado = self._buscar('deberes')[0]['content_highlight']
+        self.assertNotIn('<script>', resaltado)
+        self.assertIn('&lt;script&gt;', resaltado)
+        self.assertIn('<mark>deberes</mark>', resaltado)
+
+    def test_solo_salas_del_usuario(self):
+        # La sala ajena también tiene "canción", pero el alumno no participa en ella
+        self.assertEqual(self._buscar('cancion'), [])
+        self.assertEqual(self._buscar('cancion', room_id=str(self.sala_ajena.id)), [])
+
+    def test_editar_y_borrar_actualizan_indice(self):
+        mensaje = Message.objects.create(room=self.sala, sender=self.profesor, content='examen el lunes')
+        self.assertEqual(len(self._buscar('examen')), 1)
+
+        mensaje.content = 'prueba el martes'
+        mensaje.save()
+        self.assertEqual(self._buscar('examen'), [])
+        self.assertEqual(len(self._buscar('martes')), 1)
+
+        mensaje.delete()
+        self.assertEqual(self._buscar('martes'), [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "chatRoom_message_fts"')
+            self.assertEqual(cursor.fetchone()[0], 1)  # solo queda el de la sala ajena
+
+
+class SubidaPorTrozosTest(TestCase):
+    """Protocolo de subidas reanudables de /api/chat/uploads/"""
+
+    TROZO = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        cls.sala = ChatRoom.objects.create(student=cls.alumno, teacher=cls.profesor)
+
+    def setUp(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        ajustes = override_settings(
+            CHAT_SUBIDAS_DIR=f'{carpeta}/subidas', MEDIA_ROOT=f'{carpeta}/media', CHAT_SUBIDAS_MAX_TROZO=self.TROZO
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.datos = bytes(range(256)) * 10  # 2560 bytes: tres trozos
+        self.client = APIClient()
+        self.client.force_authenticate(self.alumno)
+        respuesta = self.client.post('/api/chat/uploads/', {
+            'room_id': str(self.sala.id), 'file_name': 'grabacion.mp3', 'total_size': len(self.datos)
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.url = f"/api/chat/uploads/{respuesta.json()['id']}/"
+
+    def _trozo(self, offset, trozo, sha256=None):
+        return self.client.generic(
+            'PUT', f'{self.url}chunk/', trozo, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_X_CHUNK_SHA256=sha256 or hashlib.sha256(trozo).hexdigest()
+        )
+
+    def _subir_todo(self):
+        for offset in range(0, len(self.datos), self.TROZO):
+            self.assertEqual(self._trozo(offset, self.datos[offset:offset + self.TROZO]).status_code, 200)
+
+    def test_offset_incorrecto_devuelve_el_real(self):
+        self._trozo(0, self.datos[:self.TROZO])
+
+        respuesta = self._trozo(0, self.datos[:self.TROZO])
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['offset'], self.TROZO)
+        self.assertEqual(respuesta['Upload-Offset'], str(self.TROZO))
+
+    def test_checksum_incorrecto_no_avanza(self):
+        respuesta = self._trozo(0, self.datos[:self.TROZO], sha256='0' * 64)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.client.get(self.url).json()['offset'], 0)
+
+    def test_trozo_demasiado_grande(self):
+        respuesta = self._trozo(0, self.datos[:self.TROZO + 1])
+        self.assertEqual(respuesta.status_code, 413)
+        self.assertEqual(self.client.get(self.url).json()['offset'], 0)
+
+    def test_completar_antes_de_tiempo(self):
+        self._trozo(0, self.datos[:self.TROZO])
+
+        respuesta = self.client.post(f'{self.url}complete/')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['offset'], self.TROZO)
+        self.assertFalse(Message.objects.exists())
+
+    def test_completar_dos_veces_devuelve_el_mismo_mensaje(self):
+        self._subir_todo()
+
+        primera = self.client.post(f'{self.url}complete/')
+        segunda = self.client.post(f'{self.url}complete/')
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(primera.json()['id'], segunda.json()['id'])
+        self.assertEqual(Message.objects.count(), 1)
+
+        mensaje = Message.objects.get()
+        self.assertEqual((mensaje.file_name, mensaje.file_size), ('grabacion.mp3', len(self.datos)))
+        with mensaje.file.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.datos)
+        self.assertEqual(ChunkedUpload.objects.get().status, 'completada')
+
+    def test_otro_usuario_no_ve_la_subida(self):
+        otro = APIClient()
+        otro.force_authenticate(self.profesor)
+
+        self.assertEqual(otro.get(self.url).status_code, 404)
+        self.assertEqual(otro.post(f'{self.url}complete/').status_code, 404)
+        self.assertEqual(otro.delete(self.url).status_code, 404)
+
+
+class ContadoresSalaTest(TestCase):
+    """Último mensaje y no leídos desnormalizados en ChatRoom (chatRoom/signals.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+
+    def setUp(self):
+        self.sala = ChatRoom.objects.create(student=self.alumno, teacher=self.profesor)
+
+    def _enviar(self, remitente, content='Hola'):
+        return Message.objects.create(room=self.sala, sender=remitente, content=content)
+
+    def _sala(self):
+        return ChatRoom.objects.get(pk=self.sala.pk)
+
+    def test_enviar_solo_suma_al_destinatario(self):
+        self._enviar(self.alumno)
+        self._enviar(self.alumno)
+        mensaje = self._enviar(self.profesor)
+
+        sala = self._sala()
+        self.assertEqual((sala.unread_teacher, sala.unread_student), (2, 1))
+        self.assertEqual(sala.last_message_id, mensaje.pk)
+        self.assertEqual(sala.last_message_at, mensaje.created_at)
+
+    def test_borrar_no_leido_resta(self):
+        self._enviar(self.alumno)
+        mensaje = self._enviar(self.alumno)
+
+        mensaje.delete()
+        self.assertEqual(self._sala().unread_teacher, 1)
+
+    def test_borrar_leido_no_resta(self):
+        mensaje = self._enviar(self.alumno)
+        self._sala().marcar_leido(self.profesor.id)
+        self._enviar(self.alumno)
+
+        mensaje.delete()
+        self.assertEqual(self._sala().unread_teacher, 1)
+
+    def test_borrar_el_ultimo_restaura_el_anterior(self):
+        anterior = self._enviar(self.alumno, 'Primero')
+        self._enviar(self.profesor, 'Segundo').delete()
+
+        sala = self._sala()
+        self.assertEqual(sala.last_message_id, anterior.pk)
+        self.assertEqual(sala.last_message_at, anterior.created_at)
+        self.assertEqual(sala.unread_student, 0)
+
+        anterior.delete()
+        sala = self._sala()
+        self.assertIsNone(sala.last_message_id)
+        self.assertIsNone(sala.last_message_at)
+        self.assertEqual(sala.unread_teacher, 0)
+
+
+class MarcaLecturaTest(TestCase):
+    """ChatRoom.marcar_leido: la marca de lectura solo avanza y el contador sale de ella"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+
+    def setUp(self):
+        self.sala = ChatRoom.objects.create(student=self.alumno, teacher=self.profesor)
+        self.mensajes = [
+            Message.objects.create(room=self.sala, sender=self.alumno, content=f'Mensaje {i}') for i in range(4)
+        ]
+
+    def _sala(self):
+        return ChatRoom.objects.get(pk=self.sala.pk)
+
+    def test_hasta_recalcula_el_contador(self):
+        self.assertTrue(self._sala().marcar_leido(self.profesor.id, hasta=self.mensajes[1]))
+
+        sala = self._sala()
+        self.assertEqual(sala.unread_teacher, 2)
+        self.assertEqual(sala.teacher_last_read_at, self.mensajes[1].created_at)
+        self.assertEqual(sala.teacher_last_read_message_id, self.mensajes[1].pk)
+        self.assertTrue(Message.objects.get(pk=self.mensajes[1].pk).is_read)
+        self.assertFalse(Message.objects.get(pk=self.mensajes[2].pk).is_read)
+
+    def test_hasta_nunca_retrocede(self):
+        self._sala().marcar_leido(self.profesor.id, hasta=self.mensajes[2])
+
+        for anterior in (self.mensajes[0], self.mensajes[2]):
+            self.assertFalse(self._sala().marcar_leido(self.profesor.id, hasta=anterior))
+        sala = self._sala()
+        self.assertEqual(sala.teacher_last_read_at, self.mensajes[2].created_at)
+        self.assertEqual(sala.unread_teacher, 1)
+
+    def test_marcar_la_sala_entera(self):
+        self.assertTrue(self._sala().marcar_leido(self.profesor.id))
+        sala = self._sala()
+        self.assertEqual(sala.unread_teacher, 0)
+        self.assertEqual(sala.teacher_last_read_message_id, self.mensajes[-1].pk)
+
+        # Sin nada pendiente no cambia nada (y la vista no publica messages-read)
+        self.assertFalse(self._sala().marcar_leido(self.profesor.id))
+        # El remitente no tiene nada que leer y un ajeno no es de la sala
+        self.assertFalse(self._sala().marcar_leido(self.alumno.id))
+        self.assertFalse(self._sala().marcar_leido(-1))
+
+
+class BackendPrueba:
+    """Backend de TIEMPO_REAL_BACKEND que apunta los batches y falla con los canales de `fallar`"""
+    entregados = []
+    fallar = set()
+
+    def entregar(self, batch):
+        if any(evento['channel'] in self.fallar for evento in batch):
+            raise RuntimeError("Canal caído")
+        BackendPrueba.entregados.append(batch)
+
+
+@override_settings(TIEMPO_REAL_BACKEND='chatRoom.tests.BackendPrueba', TIEMPO_REAL_MAX_INTENTOS=2)
+class OutboxTiempoRealTest(TestCase):
+    """Worker del outbox: fusión de eventos, bloqueo de canales tras un fallo y reservas"""
+
+    def setUp(self):
+        backend.cache_clear()
+        self.addCleanup(backend.cache_clear)
+        BackendPrueba.entregados = []
+        BackendPrueba.fallar = set()
+
+    def _entregados(self):
+        return [(evento['channel'], evento['name'], evento['data']) for batch in BackendPrueba.entregados for evento in batch]
+
+    def _nuevo(self, canal, message_id):
+        return publicar(canal, 'new-message', {'message': {'id': message_id}})
+
+    def test_lecturas_del_mismo_usuario_se_funden(self):
+        publicar('sala-a', 'messages-read', {'user_id': 1, 'messages_updated': 2})
+        self._nuevo('sala-a', 'm1')
+        publicar('sala-a', 'messages-read', {'user_id': 1, 'messages_updated': 3})
+        publicar('sala-a', 'messages-read', {'user_id': 2, 'messages_updated': 1})
+
+        self.assertEqual(enviar_pendientes(), 4)
+        self.assertEqual(self._entregados(), [
+            ('sala-a', 'new-message', {'message': {'id': 'm1'}}),
+            ('sala-a', 'messages-read', {'user_id': 1, 'messages_updated': 5}),
+            ('sala-a', 'messages-read', {'user_id': 2, 'messages_updated': 1}),
+        ])
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+
+    def test_nuevo_seguido_de_su_borrado_no_se_entrega(self):
+        self._nuevo('sala-a', 'm1')
+        self._nuevo('sala-a', 'm2')
+        publicar('sala-a', 'message-deleted', {'message_id': 'm1'})
+
+        enviar_pendientes()
+        self.assertEqual(self._entregados(), [('sala-a', 'new-message', {'message': {'id': 'm2'}})])
+        # Los dos omitidos cuentan como enviados
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+
+    def test_batch_fallido_bloquea_su_canal_en_la_pasada(self):
+        BackendPrueba.fallar = {'sala-a'}
+        # El primer batch (10 eventos de sala-a) falla; el 11.º ya no se intenta y sala-b sí sale
+        eventos_a = [self._nuevo('sala-a', f'm{i}') for i in range(11)]
+        self._nuevo('sala-b', 'b1')
+
+        enviar_pendientes()
+        self.assertEqual(self._entregados(), [('sala-b', 'new-message', {'message': {'id': 'b1'}})])
+        fallidos = OutboxEvent.objects.filter(id__in=[evento.id for evento in eventos_a[:10]])
+        self.assertEqual(set(fallidos.values_list('attempts', 'last_error')), {(1, 'Canal caído')})
+        saltado = OutboxEvent.objects.get(pk=eventos_a[-1].pk)
+        self.assertEqual((saltado.attempts, saltado.sent_at), (0, None))
+        # Nada queda reservado: la siguiente pasada puede reintentarlo
+        self.assertFalse(OutboxEvent.objects.filter(claimed_until__isnull=False).exists())
+
+    def test_reintentos_hasta_el_maximo(self):
+        BackendPrueba.fallar = {'sala-a'}
+        evento = self._nuevo('sala-a', 'm1')
+
+        self.assertEqual(enviar_pendientes(), 1)
+        self.assertEqual(enviar_pendientes(), 1)
+        self.assertEqual(OutboxEvent.objects.get(pk=evento.pk).attempts, 2)
+        # Agotados los TIEMPO_REAL_MAX_INTENTOS, el worker ya no lo lee aunque el canal se recupere
+        BackendPrueba.fallar = set()
+        self.assertEqual(enviar_pendientes(), 0)
+        self.assertEqual(self._entregados(), [])
+
+    def test_canal_reservado_por_otro_worker_se_salta(self):
+        ajeno = self._nuevo('sala-a', 'm1')
+        OutboxEvent.objects.filter(pk=ajeno.pk).update(claimed_until=timezone.now() + timedelta(minutes=1))
+        siguiente = self._nuevo('sala-a', 'm2')
+        self._nuevo('sala-b', 'b1')
+
+        enviar_pendientes()
+        self.assertEqual(self._entregados(), [('sala-b', 'new-message', {'message': {'id': 'b1'}})])
+        # El siguiente evento de sala-a ni siquiera se reserva
+        self.assertIsNone(OutboxEvent.objects.get(pk=siguiente.pk).claimed_until)
+
+        # Cuando caduca la reserva del otro worker, sala-a sale en orden
+        OutboxEvent.objects.filter(pk=ajeno.pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        BackendPrueba.entregados = []
+        enviar_pendientes()
+        self.assertEqual(self._entregados(), [
+            ('sala-a', 'new-message', {'message': {'id': 'm1'}}),
+            ('sala-a', 'new-message', {'message': {'id': 'm2'}}),
+        ])
+
+
+class BrokerMemoria:
+    """Broker en memoria: `confirmar` hace visible un id, en el orden que se quiera"""
+
+    def __init__(self, confirmados=()):
+        self.eventos = {evento_id: 'sala-a' for evento_id in confirmados}
+
+    def confirmar(self, evento_id, canal='sala-a'):
+        self.eventos[evento_id] = canal
+
+    async def ultimo_id(self):
+        return max(self.eventos, default=0)
+
+    async def leer(self, desde_id, canales):
+        return [
+            (evento_id, canal, 'new-message', {})
+            for evento_id, canal in sorted(self.eventos.items())
+            if evento_id > desde_id and canal in canales
+        ]
+
+
+@override_settings(TIEMPO_REAL_SONDEO=0.01)
+class DifusorSondeoTest(SimpleTestCase):
+    """El sondeo del difusor no pierde ids confirmados fuera de orden ni los repite"""
+
+    def _recibidos(self, cola):
+        recibidos = []
+        while not cola.empty():
+            recibidos.append(cola.get_nowait()[0])
+        return recibidos
+
+    def test_id_confirmado_tarde_se_difunde_una_vez(self):
+        async def escenario():
+            broker = BrokerMemoria(confirmados=[1])
+            difusor = Difusor(broker)
+            cola = await difusor.suscribir(['sala-a'])
+            await asyncio.sleep(0.05)
+
+            # El id 3 se confirma antes que el 2, cuya transacción era más lenta
+            broker.confirmar(3)
+            await asyncio.sleep(0.05)
+            broker.confirmar(2)
+            broker.confirmar(4, canal='sala-b')
+            await asyncio.sleep(0.05)
+            recibidos = self._recibidos(cola)
+            difusor.cancelar(['sala-a'], cola)
+            await difusor._tarea
+            return recibidos
+
+        self.assertEqual(asyncio.run(escenario()), [3, 2])
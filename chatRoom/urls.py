@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register(r'rooms', views.ChatRoomViewSet, basename='chatroom')
 router.register(r'messages', views.MessageViewSet, basename='message')
 router.register(r'teacher-students', views.TeacherStudentsViewSet, basename='teacher-students')
+router.register(r'uploads', views.ChunkedUploadViewSet, basename='upload')
 
 # chat/urls.py
 urlpatterns = [
@@ -17,4 +18,7 @@ urlpatterns = [
     path('check_unread/<uuid:room_id>/', views.check_unread_count, name='check-unread'),
     path('teachers/all/', views.list_all_teachers, name='list-all-teachers'),
     path('students/all/', views.list_all_students, name='list-all-students'),  # ← NUEVA RUTA
+    path('stream/', views.stream_eventos, name='stream-eventos'),
+    path('stream/token/', views.token_stream, name='stream-token'),
+    path('sync/', views.sync_chat, name='sync-chat'),
 ]
\ No newline at end of file
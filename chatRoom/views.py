@@ -1,36 +1,47 @@
 # chat/views.py
-import pusher
-from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse, Http404
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import F, FilteredRelation, Q
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+import asyncio
 import logging
+import os
 from uuid import UUID
 import json
-from .models import ChatRoom, Message
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+from .models import ChatRoom, ChunkedUpload, Message, OutboxEvent
 from .serializers import ChatRoomSerializer, MessageSerializer
+from .realtime import PUSHER_AVAILABLE, publicar, canal_sala, datos_mensaje
+from . import difusion
+from .busqueda import buscar_mensajes, terminos
+from .subidas import ErrorSubida, OffsetIncorrecto, anadir_trozo, borrar_temporales, completar
 from users.models import CustomUser
+from django_tests_backend.idempotencia import idempotente
 
 logger = logging.getLogger(__name__)
 
-# Configurar Pusher con manejo de errores
-try:
-    pusher_client = pusher.Pusher(
-        app_id=settings.PUSHER_APP_ID,
-        key=settings.PUSHER_KEY,
-        secret=settings.PUSHER_SECRET,
-        cluster=settings.PUSHER_CLUSTER,
-        ssl=True
-    )
-    PUSHER_AVAILABLE = True
-    logger.info("Pusher configurado correctamente")
-except Exception as e:
-    logger.error(f"Error configurando Pusher: {e}")
-    PUSHER_AVAILABLE = False
-    pusher_client = None
+# Tamaño de página del historial de mensajes de una sala
+MENSAJES_POR_PAGINA = 50
+MAX_MENSAJES_POR_PAGINA = 200
+
+# Resultados por página de la búsqueda en el historial
+RESULTADOS_POR_PAGINA = 20
+MAX_RESULTADOS_POR_PAGINA = 100
+
+# Segundos máximos que puede quedar abierta una petición de sincronización (long-polling)
+CHAT_SYNC_TIMEOUT_MAXIMO = 55
+
+# Máximo de alumnos por página cuando los listados se piden paginados (?page_size=)
+MAX_ALUMNOS_POR_PAGINA = 200
 
 # Encoder personalizado para UUID
 class UUIDEncoder(json.JSONEncoder):
@@ -48,9 +59,10 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         logger.info(f"Usuario accediendo a chats: {user.username} (rol: {user.role})")
         
         if user.role == 'teacher':
-            return ChatRoom.objects.filter(teacher=user)
+            rooms = ChatRoom.objects.filter(teacher=user)
         else:
-            return ChatRoom.objects.filter(student=user)
+            rooms = ChatRoom.objects.filter(student=user)
+        return ChatRoomSerializer.optimizar(rooms)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -115,59 +127,25 @@ class MessageViewSet(viewsets.ModelViewSet):
         student_rooms = user.chat_rooms_as_student.all()
         teacher_rooms = user.chat_rooms_as_teacher.all()
         all_rooms = student_rooms | teacher_rooms
-        return Message.objects.filter(room__in=all_rooms)
+        # La sala hace falta para derivar is_read de las marcas de lectura
+        return Message.objects.filter(room__in=all_rooms).select_related('room', 'sender')
 
     def perform_create(self, serializer):
         try:
-            message = serializer.save(sender=self.request.user)
+            # El evento se encola en la misma transacción que el mensaje (outbox)
+            with transaction.atomic():
+                message = serializer.save(sender=self.request.user)
+                publicar(canal_sala(message.room_id), 'new-message', {
+                    'message': datos_mensaje(message),
+                    'room_id': str(message.room_id)
+                })
             logger.info(f"Mensaje creado por {self.request.user.username} en room {message.room.id}")
-            
-            # Notificar via Pusher si está disponible
-            if PUSHER_AVAILABLE and pusher_client:
-                self._notify_pusher(message)
-            else:
-                logger.warning("Pusher no disponible para notificación")
                 
         except Exception as e:
             logger.error(f"Error en perform_create: {e}")
             raise
 
-    def _notify_pusher(self, message):
-        """Notificar a Pusher sobre nuevo mensaje"""
-        try:
-            # Serializar el mensaje manualmente para evitar problemas de UUID
-            message_data = {
-                'id': str(message.id),
-                'room': str(message.room.id),
-                'sender': {
-                    'id': message.sender.id,
-                    'username': message.sender.username,
-                    'email': message.sender.email,
-                    'role': message.sender.role,
-                    'country': message.sender.country
-                },
-                'content': message.content,
-                'file': message.file.url if message.file else None,
-                'file_name': message.file_name,
-                'file_size': message.file_size,
-                'is_read': message.is_read,
-                'created_at': message.created_at.isoformat()
-            }
-            
-            # Notificar via Pusher
-            pusher_client.trigger(
-                f'chat-room-{str(message.room.id)}',
-                'new-message',
-                {
-                    'message': message_data,
-                    'room_id': str(message.room.id)
-                }
-            )
-            logger.info(f"Mensaje {message.id} notificado via Pusher")
-            
-        except Exception as e:
-            logger.error(f"Error notificando Pusher: {e}")
-
+    @idempotente
     def create(self, request, *args, **kwargs):
         """Sobrescribir create para mejor manejo de errores"""
         try:
@@ -193,18 +171,12 @@ class MessageViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Notificar via Pusher antes de eliminar
-            if PUSHER_AVAILABLE and pusher_client:
-                pusher_client.trigger(
-                    f'chat-room-{str(message.room.id)}',
-                    'message-deleted',
-                    {
-                        'message_id': str(message.id),
-                        'room_id': str(message.room.id)
-                    }
-                )
-            
-            message.delete()
+            with transaction.atomic():
+                publicar(canal_sala(message.room_id), 'message-deleted', {
+                    'message_id': str(message.id),
+                    'room_id': str(message.room_id)
+                })
+                message.delete()
             logger.info(f"Mensaje {message.id} eliminado por {request.user.username}")
             return Response(status=status.HTTP_204_NO_CONTENT)
             
@@ -217,7 +189,14 @@ class MessageViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def room_messages(self, request):
-        """Obtener mensajes de una sala específica"""
+        """
+        Obtener mensajes de una sala específica, por páginas.
+
+        Sin cursor devuelve la última página. `before=<id>` trae los anteriores a ese mensaje
+        y `after=<id>` los posteriores; cada página es una lectura acotada sobre el índice
+        (room, created_at, id). La respuesta sigue siendo la lista en orden cronológico y la
+        paginación va en las cabeceras X-Has-More, X-Next-Before y X-Next-After.
+        """
         try:
             room_id = request.query_params.get('room_id')
             if not room_id:
@@ -229,11 +208,57 @@ class MessageViewSet(viewsets.ModelViewSet):
             if request.user not in [room.student, room.teacher]:
                 return Response({"error": "No tienes acceso a esta sala"}, status=403)
             
-            messages = Message.objects.filter(room=room).order_by('created_at')
-            serializer = self.get_serializer(messages, many=True)
-            logger.info(f"Enviados {len(messages)} mensajes del room {room_id}")
-            return Response(serializer.data)
+            try:
+                limit = min(max(int(request.query_params.get('limit', MENSAJES_POR_PAGINA)), 1), MAX_MENSAJES_POR_PAGINA)
+            except ValueError:
+                return Response({"error": "limit debe ser un número"}, status=400)
+            
+            before = request.query_params.get('before')
+            after = request.query_params.get('after')
+            if before and after:
+                return Response({"error": "Usa before o after, no ambos"}, status=400)
+            
+            messages = Message.objects.filter(room=room).select_related('sender', 'room')
+            cursor_id = before or after
+            if cursor_id:
+                try:
+                    cursor = Message.objects.filter(room=room, id=cursor_id).values('created_at', 'id').first()
+                except ValidationError:
+                    cursor = None
+                if cursor is None:
+                    return Response({"error": "El mensaje del cursor no existe en esta sala"}, status=400)
+            
+            if after:
+                messages = messages.filter(
+                    Q(created_at__gt=cursor['created_at']) |
+                    Q(created_at=cursor['created_at'], id__gt=cursor['id'])
+                ).order_by('created_at', 'id')
+            else:
+                if before:
+                    messages = messages.filter(
+                        Q(created_at__lt=cursor['created_at']) |
+                        Q(created_at=cursor['created_at'], id__lt=cursor['id'])
+                    )
+                messages = messages.order_by('-created_at', '-id')
+            
+            # Se pide uno de más para saber si hay otra página sin hacer un COUNT
+            page = list(messages[:limit + 1])
+            has_more = len(page) > limit
+            page = page[:limit]
+            if not after:
+                page.reverse()
+            
+            serializer = self.get_serializer(page, many=True)
+            response = Response(serializer.data)
+            response['X-Has-More'] = 'true' if has_more else 'false'
+            if page:
+                response['X-Next-Before'] = str(page[0].id)
+                response['X-Next-After'] = str(page[-1].id)
+            logger.info(f"Enviados {len(page)} mensajes del room {room_id}")
+            return response
             
+        except Http404:
+            raise
         except Exception as e:
             logger.error(f"Error en room_messages: {e}")
             return Response(
@@ -241,14 +266,62 @@ class MessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Buscar en el historial de las salas del usuario (`q`, opcionalmente `room_id`).
+        Resultados por relevancia con el texto coincidente marcado con <mark>, paginados
+        con `page` y `page_size`.
+        """
+        try:
+            texto = request.query_params.get('q', '').strip()
+            if not terminos(texto):
+                return Response({"error": "q es requerido"}, status=400)
+            
+            try:
+                page = max(int(request.query_params.get('page', 1)), 1)
+                page_size = min(max(int(request.query_params.get('page_size', RESULTADOS_POR_PAGINA)), 1), MAX_RESULTADOS_POR_PAGINA)
+            except ValueError:
+                return Response({"error": "page y page_size deben ser números"}, status=400)
+            
+            room_id = request.query_params.get('room_id')
+            try:
+                hits = buscar_mensajes(request.user, texto, room_id, (page - 1) * page_size, page_size)
+            except ValidationError:
+                return Response({"error": "room_id no válido"}, status=400)
+            
+            has_more = len(hits) > page_size
+            hits = hits[:page_size]
+            messages = self.get_serializer([message for message, _, _ in hits], many=True).data
+            results = [
+                {**data, 'content_highlight': contenido, 'file_name_highlight': archivo}
+                for data, (_, contenido, archivo) in zip(messages, hits)
+            ]
+            logger.info(f"Búsqueda de {request.user.username}: {len(results)} resultados (página {page})")
+            return Response({'results': results, 'page': page, 'has_more': has_more})
+            
+        except Exception as e:
+            logger.error(f"Error en search: {e}")
+            return Response(
+                {"error": "Error buscando mensajes"}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Marcar mensajes como leídos"""
         try:
             message = self.get_object()
             if message.room.student == request.user or message.room.teacher == request.user:
-                message.is_read = True
-                message.save()
+                with transaction.atomic():
+                    # Avanza la marca de lectura de la sala hasta este mensaje (una sola fila)
+                    if message.room.marcar_leido(request.user.id, hasta=message):
+                        publicar(canal_sala(message.room_id), 'messages-read', {
+                            'room_id': str(message.room_id),
+                            'user_id': request.user.id,
+                            'messages_updated': 1,
+                            'message_id': str(message.id)
+                        })
                 logger.info(f"Mensaje {message.id} marcado como leído")
                 return Response({"status": "marked as read"})
             return Response({"error": "No autorizado"}, status=403)
@@ -273,25 +346,20 @@ class MessageViewSet(viewsets.ModelViewSet):
             if request.user not in [room.student, room.teacher]:
                 return Response({"error": "No tienes acceso a esta sala"}, status=403)
             
-            # Marcar todos los mensajes no leídos (excepto los del usuario actual) como leídos
-            messages_updated = Message.objects.filter(
-                room=room,
-                is_read=False
-            ).exclude(sender=request.user).update(is_read=True)
-            
-            logger.info(f"Marcados {messages_updated} mensajes como leídos en room {room_id} por {request.user.username}")
-            
-            # Notificar via Pusher que los mensajes fueron leídos
-            if PUSHER_AVAILABLE and pusher_client:
-                pusher_client.trigger(
-                    f'chat-room-{str(room.id)}',
-                    'messages-read',
-                    {
+            with transaction.atomic():
+                # Marcar la sala como leída hasta el último mensaje: un UPDATE de una fila
+                messages_updated = room.unread_for(request.user)
+                if room.marcar_leido(request.user.id):
+                    # Avisar en tiempo real solo si la marca de lectura ha avanzado
+                    publicar(canal_sala(room.id), 'messages-read', {
                         'room_id': str(room.id),
                         'user_id': request.user.id,
                         'messages_updated': messages_updated
-                    }
-                )
+                    })
+                else:
+                    messages_updated = 0
+            
+            logger.info(f"Marcados {messages_updated} mensajes como leídos en room {room_id} por {request.user.username}")
             
             return Response({
                 "status": "messages marked as read",
@@ -305,7 +373,179 @@ class MessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class ChunkedUploadViewSet(viewsets.ViewSet):
+    """Subida de adjuntos por trozos, reanudable (ver chatRoom/subidas.py)"""
+    permission_classes = [IsAuthenticated]
+
+    def _subida(self, request, pk):
+        return get_object_or_404(ChunkedUpload, id=pk, user=request.user)
+
+    def _estado(self, subida, **extra):
+        response = Response({
+            'id': str(subida.id),
+            'room_id': str(subida.room_id),
+            'file_name': subida.file_name,
+            'total_size': subida.total_size,
+            'offset': subida.offset,
+            'status': subida.status,
+            'chunk_size': settings.CHAT_SUBIDAS_MAX_TROZO,
+        }, **extra)
+        response['Upload-Offset'] = str(subida.offset)
+        return response
+
+    def create(self, request):
+        """Iniciar una subida: room_id, file_name, total_size y opcionalmente content"""
+        room_id = request.data.get('room_id')
+        file_name = (request.data.get('file_name') or '').strip()
+        if not room_id or not file_name:
+            return Response({"error": "room_id y file_name son requeridos"}, status=400)
+        try:
+            total_size = int(request.data.get('total_size'))
+        except (TypeError, ValueError):
+            return Response({"error": "total_size debe ser un número de bytes"}, status=400)
+        if total_size <= 0 or total_size > settings.CHAT_SUBIDAS_MAX_ARCHIVO:
+            return Response(
+                {"error": f"total_size debe estar entre 1 y {settings.CHAT_SUBIDAS_MAX_ARCHIVO} bytes"},
+                status=400
+            )
+
+        room = get_object_or_404(ChatRoom, id=room_id)
+        if request.user not in [room.student, room.teacher]:
+            return Response({"error": "No tienes acceso a esta sala"}, status=403)
+
+        subida = ChunkedUpload.objects.create(
+            user=request.user,
+            room=room,
+            file_name=os.path.basename(file_name)[:255],
+            total_size=total_size,
+            content=request.data.get('content') or '',
+        )
+        logger.info(f"Subida {subida.id} iniciada por {request.user.username} ({total_size} bytes)")
+        return self._estado(subida, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        """Estado de la subida: el cliente sigue enviando desde `offset` tras un corte"""
+        return self._estado(self._subida(request, pk))
+
+    def destroy(self, request, pk=None):
+        """Cancelar una subida pendiente y borrar lo recibido"""
+        subida = self._subida(request, pk)
+        if subida.status == 'pendiente':
+            borrar_temporales(subida)
+            subida.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        """
+        Añadir un trozo. Cuerpo en crudo; cabeceras Upload-Offset (byte donde empieza) y
+        X-Chunk-Sha256. Se lee del stream por bloques: nunca se usa request.data aquí.
+        """
+        subida = self._subida(request, pk)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({"error": "Cabecera Upload-Offset requerida"}, status=400)
+
+        try:
+            anadir_trozo(subida, offset, request.stream, request.headers.get('X-Chunk-Sha256'))
+        except OffsetIncorrecto as e:
+            # Otro intento ya avanzó la subida: se devuelve dónde sigue
+            subida.offset = e.offset
+            return self._estado(subida, status=status.HTTP_409_CONFLICT)
+        except ErrorSubida as e:
+            return Response({"error": str(e), "offset": subida.offset}, status=e.status)
+        except Exception as e:
+            logger.error(f"Error recibiendo trozo de la subida {pk}: {e}")
+            return Response(
+                {"error": "Error recibiendo el trozo"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return self._estado(subida)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Cerrar la subida: crea el mensaje con el archivo y lo publica en la sala"""
+        subida = self._subida(request, pk)
+        try:
+            message = completar(subida)
+        except OffsetIncorrecto:
+            return self._estado(subida, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Error completando la subida {pk}: {e}")
+            return Response(
+                {"error": "Error completando la subida"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        logger.info(f"Subida {subida.id} completada: mensaje {message.id}")
+        serializer = MessageSerializer(message, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 # Vista para que el profesor vea todos los alumnos
+class PaginacionOpcional(PageNumberPagination):
+    """Sin `page_size` en la query se devuelve la lista completa, como hasta ahora"""
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_ALUMNOS_POR_PAGINA
+
+
+def _alumnos_del_profesor(request, solo_con_chat):
+    """
+    Alumnos con la sala que comparten con el profesor en una sola consulta: LEFT JOIN a
+    ChatRoom filtrado por profesor (FilteredRelation) y de ahí al último mensaje; los no
+    leídos salen del contador desnormalizado de la sala. Admite `search` por username.
+    """
+    students = CustomUser.objects.filter(role='student').annotate(
+        sala=FilteredRelation('chat_rooms_as_student', condition=Q(chat_rooms_as_student__teacher=request.user)),
+    )
+    if solo_con_chat:
+        students = students.filter(sala__isnull=False)
+    else:
+        students = students.filter(is_active=True)
+
+    search = request.query_params.get('search', '').strip()
+    if search:
+        students = students.filter(username__icontains=search)
+
+    return students.annotate(
+        chat_room_id=F('sala__id'),
+        unread_messages=F('sala__unread_teacher'),
+        last_interaction=F('sala__updated_at'),
+        last_message_content=F('sala__last_message__content'),
+        last_message_created_at=F('sala__last_message__created_at'),
+        last_message_sender=F('sala__last_message__sender_id'),
+    ).order_by('username', 'id')
+
+
+def _fila_alumno(student, **extra):
+    last_message = None
+    if student.last_message_created_at:
+        last_message = {
+            'content': student.last_message_content,
+            'created_at': student.last_message_created_at.isoformat(),
+            'sender': student.last_message_sender
+        }
+    return {
+        'id': student.id,
+        'username': student.username,
+        'email': student.email,
+        'country': student.country,
+        **extra,
+        'chat_room_id': str(student.chat_room_id) if student.chat_room_id else None,
+        'unread_messages': student.unread_messages or 0,
+        'last_message': last_message,
+        'last_interaction': student.last_interaction.isoformat() if student.last_interaction else None
+    }
+
+
+def _respuesta_paginada(request, students, fila):
+    paginator = PaginacionOpcional()
+    page = paginator.paginate_queryset(students, request)
+    if page is None:
+        return Response([fila(student) for student in students])
+    return paginator.get_paginated_response([fila(student) for student in page])
+
+
 class TeacherStudentsViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
@@ -314,48 +554,12 @@ class TeacherStudentsViewSet(viewsets.ViewSet):
             if request.user.role != 'teacher':
                 return Response({"error": "Solo para profesores"}, status=403)
             
-            # Obtener todos los alumnos que han tenido alguna interacción
-            students = CustomUser.objects.filter(
-                role='student',
-                chat_rooms_as_student__teacher=request.user
-            ).distinct()
+            # Alumnos que han tenido alguna interacción, con su sala y último mensaje
+            students = _alumnos_del_profesor(request, solo_con_chat=True)
+            response = _respuesta_paginada(request, students, _fila_alumno)
             
-            student_data = []
-            for student in students:
-                chat_room = ChatRoom.objects.filter(student=student, teacher=request.user).first()
-                
-                # Calcular mensajes no leídos correctamente
-                unread_count = 0
-                if chat_room:
-                    unread_count = Message.objects.filter(
-                        room=chat_room, 
-                        is_read=False
-                    ).exclude(sender=request.user).count()
-                
-                # Obtener último mensaje
-                last_message = None
-                if chat_room:
-                    last_message_obj = chat_room.messages.last()
-                    if last_message_obj:
-                        last_message = {
-                            'content': last_message_obj.content,
-                            'created_at': last_message_obj.created_at.isoformat(),
-                            'sender': last_message_obj.sender.id
-                        }
-                
-                student_data.append({
-                    'id': student.id,
-                    'username': student.username,
-                    'email': student.email,
-                    'country': student.country,
-                    'chat_room_id': str(chat_room.id) if chat_room else None,
-                    'unread_messages': unread_count,
-                    'last_message': last_message,  # Añadir último mensaje
-                    'last_interaction': chat_room.updated_at.isoformat() if chat_room else None
-                })
-            
-            logger.info(f"Profesor {request.user.username} ve {len(student_data)} alumnos")
-            return Response(student_data)
+            logger.info(f"Profesor {request.user.username} ve la lista de sus alumnos")
+            return response
             
         except Exception as e:
             logger.error(f"Error en TeacherStudentsViewSet: {e}")
@@ -376,6 +580,7 @@ def debug_info(request):
             'username': request.user.username if request.user.is_authenticated else None,
             'user_role': request.user.role if request.user.is_authenticated else None,
             'pusher_available': PUSHER_AVAILABLE,
+            'pending_realtime_events': OutboxEvent.objects.filter(sent_at__isnull=True).count(),
             'total_chat_rooms': ChatRoom.objects.count(),
             'total_messages': Message.objects.count(),
         }
@@ -449,14 +654,10 @@ def check_unread_count(request, room_id):
     """Endpoint temporal para verificar contadores"""
     try:
         room = get_object_or_404(ChatRoom, id=room_id)
-        unread_count = Message.objects.filter(
-            room=room,
-            is_read=False
-        ).exclude(sender=request.user).count()
         
         return Response({
             'room_id': room_id,
-            'unread_count': unread_count,
+            'unread_count': room.unread_for(request.user),
             'total_messages': room.messages.count(),
             'user': request.user.username
         })
@@ -541,63 +742,226 @@ def list_all_students(request):
         if request.user.role != 'teacher':
             return Response({"error": "Solo para profesores"}, status=403)
         
-        # Obtener todos los estudiantes registrados
-        students = CustomUser.objects.filter(
-            role='student', 
-            is_active=True
-        ).order_by('username')
-        
-        student_data = []
-        for student in students:
-            # Verificar si ya existe un chat con este estudiante
-            existing_chat = ChatRoom.objects.filter(
-                student=student,
-                teacher=request.user
-            ).first()
-            
-            # Calcular mensajes no leídos si hay chat existente
-            unread_count = 0
-            last_message = None
-            last_interaction = None
-            
-            if existing_chat:
-                unread_count = Message.objects.filter(
-                    room=existing_chat,
-                    is_read=False
-                ).exclude(sender=request.user).count()
-                
-                # Obtener último mensaje
-                last_message_obj = existing_chat.messages.last()
-                if last_message_obj:
-                    last_message = {
-                        'content': last_message_obj.content,
-                        'created_at': last_message_obj.created_at.isoformat(),
-                        'sender': last_message_obj.sender.id
-                    }
-                
-                last_interaction = existing_chat.updated_at.isoformat()
-            
-            student_data.append({
-                'id': student.id,
-                'username': student.username,
-                'email': student.email,
-                'country': student.country,
-                'timezone': student.timezone,
-                'is_active': student.is_active,
-                'date_joined': student.date_joined.isoformat() if student.date_joined else None,
-                'chat_room_id': str(existing_chat.id) if existing_chat else None,
-                'has_chat': existing_chat is not None,
-                'unread_messages': unread_count,
-                'last_message': last_message,
-                'last_interaction': last_interaction
-            })
+        # Todos los estudiantes registrados, con la sala si ya existe
+        students = _alumnos_del_profesor(request, solo_con_chat=False)
+        response = _respuesta_paginada(request, students, lambda student: _fila_alumno(
+            student,
+            timezone=student.timezone,
+            is_active=student.is_active,
+            date_joined=student.date_joined.isoformat() if student.date_joined else None,
+            has_chat=student.chat_room_id is not None,
+        ))
         
-        logger.info(f"Profesor {request.user.username} ve {len(student_data)} estudiantes totales")
-        return Response(student_data)
+        logger.info(f"Profesor {request.user.username} ve la lista de estudiantes")
+        return response
         
     except Exception as e:
         logger.error(f"Error en list_all_students: {e}")
         return Response(
             {"error": "Error obteniendo lista de estudiantes"}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )        
\ No newline at end of file
+        )
+
+
+# Canal en tiempo real propio (SSE). Vistas async de Django: necesitan un servidor ASGI
+# (uvicorn django_tests_backend.asgi:application); con runserver/WSGI responden 503
+SALT_TOKEN_STREAM = 'chatRoom.stream'
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def token_stream(request):
+    """
+    Token firmado y de corta duración para abrir /stream/ o /sync/ con ?token=. EventSource
+    no envía cabeceras y la URL acaba en los logs de acceso, así que ahí no va el token de
+    la API; si caduca (401), el cliente pide otro y vuelve a conectar.
+    """
+    return Response({
+        'token': signing.dumps(request.user.id, salt=SALT_TOKEN_STREAM),
+        'expires_in': settings.CHAT_STREAM_TOKEN_TTL,
+    })
+
+
+def _sin_asgi(request):
+    """Sin ASGI no hay bucle de eventos persistente: el difusor nunca entregaría nada"""
+    if isinstance(request, ASGIRequest):
+        return None
+    return JsonResponse(
+        {"error": "El canal en tiempo real necesita un servidor ASGI: "
+                  "uvicorn django_tests_backend.asgi:application"},
+        status=503
+    )
+
+
+async def _usuario_stream(request):
+    """?token= firmado (token_stream), Authorization: Token o la sesión"""
+    clave = request.GET.get('token')
+    if clave:
+        try:
+            user_id = signing.loads(clave, salt=SALT_TOKEN_STREAM, max_age=settings.CHAT_STREAM_TOKEN_TTL)
+        except signing.BadSignature:
+            return None
+        return await CustomUser.objects.filter(id=user_id, is_active=True).afirst()
+    cabecera = request.headers.get('Authorization', '')
+    if cabecera.startswith('Token '):
+        token = await Token.objects.select_related('user').filter(key=cabecera[len('Token '):]).afirst()
+        return token.user if token and token.user.is_active else None
+    usuario = await request.auser()
+    return usuario if usuario.is_authenticated else None
+
+
+async def _eventos_sse(canales, desde_id):
+    difusor = difusion.difusor()
+    cola = await difusor.suscribir(canales, desde_id)
+    # Last-Event-ID es una marca de máximo; por encima se descarta por id, porque el
+    # difusor puede entregar tarde (y desordenado) un id menor que otros ya enviados
+    suelo = desde_id or 0
+    enviados = set()
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=settings.TIEMPO_REAL_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if evento is None:
+                break
+            evento_id, _, nombre, datos = evento
+            if evento_id <= suelo or evento_id in enviados:
+                continue
+            enviados.add(evento_id)
+            if len(enviados) > 2 * difusion.VENTANA_REORDEN:
+                # Se olvidan los más antiguos: como mucho, un repetido; nunca un evento perdido
+                enviados = set(sorted(enviados)[-difusion.VENTANA_REORDEN:])
+            yield f"id: {evento_id}\nevent: {nombre}\ndata: {json.dumps(datos)}\n\n"
+    finally:
+        difusor.cancelar(canales, cola)
+
+
+async def stream_eventos(request):
+    """
+    Eventos en tiempo real de las salas del usuario por Server-Sent Events: los mismos
+    new-message, message-deleted y messages-read que Pusher, con el id del outbox como id
+    del evento. `rooms=<id>,<id>` limita las salas; Last-Event-ID (o ?last_event_id=)
+    recupera lo perdido al reconectar.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    error = _sin_asgi(request)
+    if error is not None:
+        return error
+
+    usuario = await _usuario_stream(request)
+    if usuario is None:
+        return JsonResponse({"error": "No autenticado"}, status=401)
+
+    salas = ChatRoom.objects.filter(Q(student=usuario) | Q(teacher=usuario))
+    pedidas = [room_id for room_id in request.GET.get('rooms', '').split(',') if room_id]
+    if pedidas:
+        try:
+            salas = salas.filter(id__in=pedidas)
+        except ValidationError:
+            return JsonResponse({"error": "rooms debe ser una lista de ids"}, status=400)
+    canales = [canal_sala(room_id) async for room_id in salas.values_list('id', flat=True)]
+    if not canales:
+        return JsonResponse({"error": "No tienes acceso a estas salas"}, status=403)
+
+    desde_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        desde_id = int(desde_id) if desde_id else None
+    except ValueError:
+        return JsonResponse({"error": "Last-Event-ID no válido"}, status=400)
+
+    logger.info(f"{usuario.username} abre el canal en tiempo real ({len(canales)} salas)")
+    response = StreamingHttpResponse(_eventos_sse(canales, desde_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _resumen_sync(eventos):
+    """Convierte eventos del outbox en mensajes nuevos, borrados y lecturas (un mensaje borrado ya no se envía)"""
+    borrados = {datos['message_id'] for _, _, nombre, datos in eventos if nombre == 'message-deleted'}
+    return {
+        'messages': [
+            datos['message'] for _, _, nombre, datos in eventos
+            if nombre == 'new-message' and datos['message']['id'] not in borrados
+        ],
+        'deleted': [datos for _, _, nombre, datos in eventos if nombre == 'message-deleted'],
+        'read': [datos for _, _, nombre, datos in eventos if nombre == 'messages-read'],
+    }
+
+
+async def sync_chat(request):
+    """
+    Sincronización incremental por long-polling para clientes sin tiempo real.
+
+    `since` es la marca (id del outbox) devuelta como `cursor` en la llamada anterior; sin
+    ella solo se devuelve la marca actual. Si no hay cambios, la petición espera hasta
+    `timeout` segundos suscrita al difusor del proceso, sin consultar la base de datos
+    mientras tanto. `room_id` limita la sincronización a una sala. Si la marca es anterior
+    a los eventos que se conservan, se responde `reset: true` y hay que recargar las salas.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Método no permitido"}, status=405)
+    error = _sin_asgi(request)
+    if error is not None:
+        return error
+
+    usuario = await _usuario_stream(request)
+    if usuario is None:
+        return JsonResponse({"error": "No autenticado"}, status=401)
+
+    salas = ChatRoom.objects.filter(Q(student=usuario) | Q(teacher=usuario))
+    room_id = request.GET.get('room_id')
+    if room_id:
+        try:
+            salas = salas.filter(id=room_id)
+        except ValidationError:
+            return JsonResponse({"error": "room_id no válido"}, status=400)
+    canales = [canal_sala(sala_id) async for sala_id in salas.values_list('id', flat=True)]
+    if room_id and not canales:
+        return JsonResponse({"error": "No tienes acceso a esta sala"}, status=403)
+
+    try:
+        since = request.GET.get('since')
+        since = int(since) if since not in (None, '') else None
+        timeout = min(max(float(request.GET.get('timeout', settings.CHAT_SYNC_TIMEOUT)), 0), CHAT_SYNC_TIMEOUT_MAXIMO)
+    except ValueError:
+        return JsonResponse({"error": "since y timeout deben ser números"}, status=400)
+
+    difusor = difusion.difusor()
+    if since is None:
+        return JsonResponse({'cursor': await difusor.broker.ultimo_id(), 'reset': True,
+                             'messages': [], 'deleted': [], 'read': [], 'has_more': False})
+
+    primero = await OutboxEvent.objects.order_by('id').values_list('id', flat=True).afirst()
+    if primero is not None and since < primero - 1:
+        return JsonResponse({'cursor': await difusor.broker.ultimo_id(), 'reset': True,
+                             'messages': [], 'deleted': [], 'read': [], 'has_more': False})
+
+    eventos = []
+    if canales:
+        # La suscripción reenvía lo posterior a `since`, así que no se pierde nada entre lectura y espera
+        cola = await difusor.suscribir(canales, since)
+        try:
+            if cola.empty():
+                await asyncio.wait_for(cola.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            eventos = await difusor.broker.leer(since, canales)
+        finally:
+            difusor.cancelar(canales, cola)
+    else:
+        # Sin salas no hay nada que esperar, pero se respeta el timeout para no responder en bucle
+        await asyncio.sleep(timeout)
+
+    return JsonResponse({
+        'cursor': eventos[-1][0] if eventos else since,
+        'reset': False,
+        **_resumen_sync(eventos),
+        'has_more': len(eventos) == difusion.EVENTOS_POR_LECTURA,
+    })
+
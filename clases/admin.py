@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Clase, Reserva
+from .models import Clase, Reserva, ReservaArchivada, BloqueoReserva, ResumenDiarioProfesor, ExcepcionHorario
 
 # ----- ClaseAdmin -----
 @admin.register(Clase)
@@ -65,3 +65,38 @@ class ReservaAdmin(admin.ModelAdmin):
                 self.message_user(request, f"No se pudo validar la reserva {reserva.id}: {e}", level='error')
         self.message_user(request, "Reservas seleccionadas validadas.")
     validar_reservas.short_description = "Validar reservas seleccionadas"
+
+# ----- BloqueoReservaAdmin -----
+@admin.register(BloqueoReserva)
+class BloqueoReservaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'profesor', 'alumno', 'clase', 'inicio', 'fin', 'expira_en')
+    list_filter = ('profesor', 'expira_en')
+    search_fields = ('alumno__username', 'profesor__username')
+    ordering = ('-expira_en',)
+    readonly_fields = ('id', 'creado_en')
+
+# ----- ReservaArchivadaAdmin -----
+@admin.register(ReservaArchivada)
+class ReservaArchivadaAdmin(admin.ModelAdmin):
+    list_display = ('reserva_id', 'clase', 'profesor', 'alumno', 'inicio', 'estado', 'archivada_en')
+    list_filter = ('estado', 'profesor')
+    search_fields = ('alumno__username', 'profesor__username', 'clase__titulo')
+    ordering = ('-inicio',)
+    readonly_fields = ('archivada_en',)
+
+# ----- ResumenDiarioProfesorAdmin -----
+@admin.register(ResumenDiarioProfesor)
+class ResumenDiarioProfesorAdmin(admin.ModelAdmin):
+    list_display = ('profesor', 'fecha', 'minutos_disponibles', 'minutos_reservados', 'minutos_impartidos', 'ingresos')
+    list_filter = ('profesor',)
+    date_hierarchy = 'fecha'
+    ordering = ('-fecha',)
+    readonly_fields = ('actualizado_en',)
+
+# ----- ExcepcionHorarioAdmin -----
+@admin.register(ExcepcionHorario)
+class ExcepcionHorarioAdmin(admin.ModelAdmin):
+    list_display = ('profesor', 'inicio', 'fin', 'motivo')
+    list_filter = ('profesor',)
+    search_fields = ('profesor__username', 'motivo')
+    ordering = ('-inicio',)
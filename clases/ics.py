@@ -0,0 +1,294 @@
+# clases/ics.py
+"""
+Importación de calendarios .ics (iCalendar) en streaming.
+
+El fichero se recorre línea a línea con generadores: solo se mantiene en memoria el
+evento que se está leyendo y el lote de excepciones pendiente de insertar, así que
+un fichero de varios megas con años de eventos no se carga nunca entero.
+
+Cómo se interpreta cada VEVENT:
+- Repetición semanal (o diaria) vigente -> franjas de HorarioRecurrente en la zona del profesor.
+- Evento puntual que aún no ha terminado -> ExcepcionHorario (tiempo bloqueado).
+- Eventos pasados, cancelados o con repeticiones no soportadas -> se omiten y se cuentan.
+"""
+from datetime import datetime, timedelta
+import logging
+
+import pytz
+from django.db import transaction
+from django.utils import timezone
+
+from .models import HorarioRecurrente, ExcepcionHorario
+from .utils import zona_horaria, invalidar_huecos_libres
+
+logger = logging.getLogger(__name__)
+
+DIAS_ICS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+# Clave (no puede ser un nombre de propiedad iCalendar) con las líneas mal formadas del evento
+LINEAS_INVALIDAS = '_lineas_invalidas'
+
+
+class ErrorICS(ValueError):
+    pass
+
+
+def lineas_desplegadas(lineas):
+    """
+    Deshace el plegado de líneas de RFC 5545 (las continuaciones empiezan por espacio
+    o tabulador). Acepta cualquier iterable de líneas en bytes o str.
+    """
+    actual = None
+    for linea in lineas:
+        if isinstance(linea, bytes):
+            linea = linea.decode('utf-8', errors='replace')
+        linea = linea.rstrip('\r\n')
+        if linea[:1] in (' ', '\t'):
+            if actual is not None:
+                actual += linea[1:]
+            continue
+        if actual is not None:
+            yield actual
+        actual = linea
+    if actual:
+        yield actual
+
+
+def _propiedad(linea):
+    """'DTSTART;TZID=Europe/Madrid:20240101T090000' -> ('DTSTART', {'TZID': ...}, '2024...')"""
+    entre_comillas = False
+    for i, caracter in enumerate(linea):
+        if caracter == '"':
+            entre_comillas = not entre_comillas
+        elif caracter == ':' and not entre_comillas:
+            cabecera, valor = linea[:i], linea[i + 1:]
+            break
+    else:
+        raise ErrorICS(f"Línea sin valor: {linea[:60]}")
+
+    nombre, *parametros = cabecera.split(';')
+    params = {}
+    for parametro in parametros:
+        clave, _, valor_param = parametro.partition('=')
+        params[clave.upper()] = valor_param.strip('"')
+    return nombre.upper(), params, valor
+
+
+def eventos(lineas):
+    """
+    Genera un dict por VEVENT con sus propiedades en bruto: {nombre: (params, valor)}.
+    Una línea mal formada no corta la lectura: se anota en LINEAS_INVALIDAS del evento.
+    """
+    evento = None
+    anidado = 0  # VALARM y otros bloques dentro del evento
+    for linea in lineas_desplegadas(lineas):
+        if not linea:
+            continue
+        if linea.upper() == 'BEGIN:VEVENT':
+            evento, anidado = {}, 0
+        elif evento is None:
+            continue
+        elif linea.upper() == 'END:VEVENT':
+            yield evento
+            evento = None
+        elif linea.upper().startswith('BEGIN:'):
+            anidado += 1
+        elif linea.upper().startswith('END:'):
+            anidado -= 1
+        elif not anidado:
+            try:
+                nombre, params, valor = _propiedad(linea)
+            except ErrorICS as e:
+                evento.setdefault(LINEAS_INVALIDAS, []).append(str(e))
+                continue
+            evento.setdefault(nombre, (params, valor))
+
+
+def _fecha(params, valor, tz_defecto):
+    """Convierte DTSTART/DTEND a datetime aware. Las fechas sin hora empiezan a medianoche local"""
+    if params.get('VALUE') == 'DATE' or len(valor) == 8:
+        dia = datetime.strptime(valor[:8], '%Y%m%d')
+        return tz_defecto.localize(dia), True
+
+    if valor.endswith('Z'):
+        return pytz.UTC.localize(datetime.strptime(valor[:15], '%Y%m%dT%H%M%S')), False
+
+    local = datetime.strptime(valor[:15], '%Y%m%dT%H%M%S')
+    tz = tz_defecto
+    if 'TZID' in params:
+        try:
+            tz = pytz.timezone(params['TZID'])
+        except pytz.UnknownTimeZoneError:
+            # Nombres de Windows u otros no IANA: se asume la zona del profesor
+            pass
+    return tz.localize(local), False
+
+
+def _regla(valor):
+    return dict(parte.partition('=')[::2] for parte in valor.upper().split(';') if parte)
+
+
+class ImportadorICS:
+    """
+    Vuelca los eventos de un .ics en HorarioRecurrente y ExcepcionHorario de un profesor.
+
+    Las excepciones se insertan con bulk_create cada `lote` eventos (las ya importadas
+    antes, por UID e inicio, se ignoran); las franjas semanales, que como mucho son unas
+    pocas por día, se crean al final. `progreso` se llama tras cada lote con el resumen
+    acumulado.
+    """
+
+    def __init__(self, profesor, lote=500, progreso=None):
+        self.profesor = profesor
+        self.tz = zona_horaria(profesor.timezone)
+        self.lote = lote
+        self.progreso = progreso
+        self.ahora = timezone.now()
+        self.resumen = {
+            'eventos_leidos': 0,
+            'horarios_creados': 0,
+            'excepciones_importadas': 0,
+            'omitidos': 0,
+            'errores': 0,
+        }
+        self._excepciones = []
+        self._franjas = {}
+
+    def importar(self, lineas):
+        with transaction.atomic():
+            for evento in eventos(lineas):
+                self.resumen['eventos_leidos'] += 1
+                try:
+                    self._procesar(evento)
+                except (ErrorICS, ValueError, KeyError) as e:
+                    self.resumen['errores'] += 1
+                    logger.warning(f"Evento ICS descartado para {self.profesor.username}: {e}")
+                if len(self._excepciones) >= self.lote:
+                    self._volcar_excepciones()
+            self._volcar_excepciones()
+            self._crear_franjas()
+        invalidar_huecos_libres(self.profesor.id)
+        return self.resumen
+
+    def _procesar(self, evento):
+        if LINEAS_INVALIDAS in evento:
+            raise ErrorICS('; '.join(evento[LINEAS_INVALIDAS]))
+        # RECURRENCE-ID marca una ocurrencia movida de una serie, que no es tiempo bloqueado
+        if (evento.get('STATUS', ({}, ''))[1].upper() == 'CANCELLED'
+                or 'DTSTART' not in evento or 'RECURRENCE-ID' in evento):
+            self.resumen['omitidos'] += 1
+            return
+
+        inicio, todo_el_dia = _fecha(*evento['DTSTART'], self.tz)
+        if 'DTEND' in evento:
+            fin, _ = _fecha(*evento['DTEND'], self.tz)
+        elif 'DURATION' in evento:
+            fin = inicio + _duracion(evento['DURATION'][1])
+        else:
+            fin = inicio + (timedelta(days=1) if todo_el_dia else timedelta(0))
+        if fin <= inicio:
+            self.resumen['omitidos'] += 1
+            return
+
+        if 'RRULE' in evento:
+            self._repeticion(evento, inicio, fin, todo_el_dia)
+        elif fin > self.ahora:
+            self._excepciones.append(ExcepcionHorario(
+                profesor=self.profesor,
+                inicio=inicio.astimezone(pytz.UTC),
+                fin=fin.astimezone(pytz.UTC),
+                motivo=evento.get('SUMMARY', ({}, ''))[1][:200],
+                uid_ics=evento.get('UID', ({}, None))[1],
+            ))
+        else:
+            self.resumen['omitidos'] += 1
+
+    def _repeticion(self, evento, inicio, fin, todo_el_dia):
+        regla = _regla(evento['RRULE'][1])
+        frecuencia = regla.get('FREQ')
+        if todo_el_dia or frecuencia not in ('WEEKLY', 'DAILY') or regla.get('INTERVAL', '1') != '1':
+            self.resumen['omitidos'] += 1
+            return
+
+        if 'UNTIL' in regla:
+            hasta, _ = _fecha({}, regla['UNTIL'], self.tz)
+            if hasta < self.ahora:
+                self.resumen['omitidos'] += 1
+                return
+        if 'COUNT' in regla:
+            semanas = int(regla['COUNT']) if frecuencia == 'WEEKLY' else int(regla['COUNT']) / 7
+            if inicio + timedelta(weeks=semanas) < self.ahora:
+                self.resumen['omitidos'] += 1
+                return
+
+        inicio_local, fin_local = inicio.astimezone(self.tz), fin.astimezone(self.tz)
+        if fin_local.date() != inicio_local.date() or fin_local - inicio_local < timedelta(minutes=25):
+            # Las franjas de HorarioRecurrente no cruzan la medianoche y duran al menos 25 minutos
+            self.resumen['omitidos'] += 1
+            return
+
+        # Si al pasar a la zona del profesor cambia el día, BYDAY se desplaza con él
+        desfase = (inicio_local.date() - inicio.date()).days
+        if 'BYDAY' in regla:
+            dias = {(DIAS_ICS[dia[-2:]] + desfase) % 7 for dia in regla['BYDAY'].split(',')}
+        elif frecuencia == 'DAILY':
+            dias = set(range(7))
+        else:
+            dias = {inicio_local.weekday()}
+
+        for dia in dias:
+            self._franjas[(dia, inicio_local.time().replace(second=0), fin_local.time().replace(second=0))] = True
+
+    def _volcar_excepciones(self):
+        if not self._excepciones:
+            return
+        # ignore_conflicts descarta en silencio las ya importadas: se cuentan las filas nuevas
+        existentes = ExcepcionHorario.objects.filter(profesor=self.profesor)
+        antes = existentes.count()
+        ExcepcionHorario.objects.bulk_create(self._excepciones, ignore_conflicts=True)
+        self.resumen['excepciones_importadas'] += existentes.count() - antes
+        self._excepciones = []
+        if self.progreso:
+            self.progreso(dict(self.resumen))
+
+    def _crear_franjas(self):
+        """Añade las franjas que no se solapan con las activas del profesor ni entre sí"""
+        ocupadas = {}
+        for horario in HorarioRecurrente.objects.filter(profesor=self.profesor, activo=True):
+            ocupadas.setdefault(horario.dia_semana, []).append((horario.hora_inicio, horario.hora_fin))
+
+        nuevas = []
+        for dia, hora_inicio, hora_fin in sorted(self._franjas):
+            if any(hora_inicio < fin and hora_fin > inicio for inicio, fin in ocupadas.get(dia, ())):
+                self.resumen['omitidos'] += 1
+                continue
+            ocupadas.setdefault(dia, []).append((hora_inicio, hora_fin))
+            nuevas.append(HorarioRecurrente(
+                profesor=self.profesor, dia_semana=dia, hora_inicio=hora_inicio, hora_fin=hora_fin
+            ))
+
+        HorarioRecurrente.objects.bulk_create(nuevas, ignore_conflicts=True)
+        self.resumen['horarios_creados'] = len(nuevas)
+
+
+def _duracion(valor):
+    """DURATION de iCalendar (p. ej. PT1H30M, P1D) a timedelta"""
+    valor = valor.upper().lstrip('+')
+    if not valor.startswith('P'):
+        raise ErrorICS(f"Duración inválida: {valor}")
+    total = timedelta(0)
+    numero = ''
+    en_tiempo = False
+    unidades = {'W': 'weeks', 'D': 'days', 'H': 'hours', 'M': 'minutes', 'S': 'seconds'}
+    for caracter in valor[1:]:
+        if caracter == 'T':
+            en_tiempo = True
+        elif caracter.isdigit():
+            numero += caracter
+        elif caracter in unidades and numero:
+            if caracter == 'M' and not en_tiempo:
+                raise ErrorICS(f"Duración inválida: {valor}")
+            total += timedelta(**{unidades[caracter]: int(numero)})
+            numero = ''
+        else:
+            raise ErrorICS(f"Duración inválida: {valor}")
+    return total
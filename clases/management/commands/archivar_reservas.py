@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from clases.models import Reserva, ReservaArchivada
+
+
+class Command(BaseCommand):
+    help = "Mueve las reservas completadas/validadas/rechazadas antiguas a la tabla de archivo por lotes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=settings.RESERVAS_ARCHIVO_DIAS,
+            help="Antigüedad mínima (por inicio de la clase) para archivar"
+        )
+        parser.add_argument(
+            '--lote', type=int, default=settings.RESERVAS_ARCHIVO_LOTE,
+            help="Reservas movidas por transacción"
+        )
+        parser.add_argument(
+            '--max-lotes', type=int, default=None,
+            help="Detenerse tras este número de lotes (por defecto, hasta terminar)"
+        )
+
+    def handle(self, *args, **options):
+        corte = timezone.now() - timedelta(days=options['dias'])
+        pendientes = Reserva.objects.filter(
+            estado__in=ReservaArchivada.ESTADOS_ARCHIVABLES,
+            inicio__lt=corte
+        ).order_by('id')
+
+        total = 0
+        lotes = 0
+        while options['max_lotes'] is None or lotes < options['max_lotes']:
+            with transaction.atomic():
+                reservas = list(pendientes.select_related('clase')[:options['lote']])
+                if not reservas:
+                    break
+                ReservaArchivada.objects.bulk_create(
+                    [ReservaArchivada.desde_reserva(reserva) for reserva in reservas],
+                    ignore_conflicts=True
+                )
+                Reserva.objects.filter(id__in=[reserva.id for reserva in reservas]).delete()
+
+            total += len(reservas)
+            lotes += 1
+            self.stdout.write(f"Lote {lotes}: {len(reservas)} reservas archivadas ({total} en total)")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} reservas anteriores a {corte:%Y-%m-%d} archivadas"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clases.ics import ErrorICS, ImportadorICS
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Importa un calendario .ics en el horario de un profesor (franjas semanales y tiempo bloqueado)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('profesor_id', type=int)
+        parser.add_argument('ruta', help="Ruta del fichero .ics")
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help="Excepciones insertadas por cada bulk_create"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            profesor = CustomUser.objects.get(id=options['profesor_id'], role='teacher')
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No existe el profesor {options['profesor_id']}")
+
+        def progreso(resumen):
+            self.stdout.write(
+                f"{resumen['eventos_leidos']} eventos leídos, "
+                f"{resumen['excepciones_importadas']} excepciones importadas"
+            )
+
+        importador = ImportadorICS(profesor, lote=options['lote'], progreso=progreso)
+        try:
+            with open(options['ruta'], 'rb') as fichero:
+                resumen = importador.importar(fichero)
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {options['ruta']}: {e}")
+        except ErrorICS as e:
+            raise CommandError(f"Archivo .ics inválido: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resumen['eventos_leidos']} eventos: {resumen['horarios_creados']} franjas semanales, "
+            f"{resumen['excepciones_importadas']} excepciones, {resumen['omitidos']} omitidos, "
+            f"{resumen['errores']} con errores"
+        ))
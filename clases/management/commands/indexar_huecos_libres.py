@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from clases.utils import refrescar_huecos_libres
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Worker que mantiene en caché el índice de huecos libres de los profesores (mejores_profesores)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help="Reconstruir el índice completo una vez y terminar"
+        )
+
+    def handle(self, *args, **options):
+        ultima_completa = None
+        try:
+            while True:
+                profesores = CustomUser.objects.filter(role='teacher').only('id', 'timezone')
+                # Todo el índice cada medio TTL; entre medias, solo lo que han borrado las señales
+                completa = ultima_completa is None or time.monotonic() - ultima_completa > settings.HUECOS_INDICE_TTL / 2
+                escritas = refrescar_huecos_libres(profesores, solo_faltan=not completa)
+                if completa:
+                    ultima_completa = time.monotonic()
+                    self.stdout.write(f"Índice de huecos libres reconstruido ({escritas} profesores)")
+                elif escritas:
+                    self.stdout.write(f"{escritas} profesores reindexados")
+                if options['una_vez']:
+                    break
+                time.sleep(settings.HUECOS_INDICE_ESPERA)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("✅ Índice de huecos libres actualizado"))
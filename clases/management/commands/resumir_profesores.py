@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from clases.models import ResumenDiarioProfesor, DiaPendienteResumen
+from clases.resumenes import resumir_dias, dias_locales
+from clases.utils import zona_horaria
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Actualiza los resúmenes diarios de los profesores: días nuevos hasta ayer y días marcados como modificados"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde', type=date.fromisoformat, default=None,
+            help="Primer día (AAAA-MM-DD) a resumir para profesores sin resúmenes previos"
+        )
+        parser.add_argument(
+            '--profesor', type=int, default=None,
+            help="Limitar a un profesor concreto (id)"
+        )
+
+    def handle(self, *args, **options):
+        profesores = CustomUser.objects.filter(role='teacher')
+        if options['profesor']:
+            profesores = profesores.filter(id=options['profesor'])
+            if not profesores.exists():
+                raise CommandError(f"No existe el profesor {options['profesor']}")
+
+        ultimos = dict(
+            ResumenDiarioProfesor.objects
+            .values_list('profesor')
+            .annotate(ultima=Max('fecha'))
+            .order_by()
+        )
+        pendientes = {}
+        for id_pendiente, profesor_id, fecha_utc in DiaPendienteResumen.objects.values_list(
+            'id', 'clase__profesor', 'fecha_utc'
+        ):
+            pendientes.setdefault(profesor_id, []).append((id_pendiente, fecha_utc))
+
+        total = 0
+        for profesor in profesores:
+            ayer = timezone.now().astimezone(zona_horaria(profesor.timezone)).date() - timedelta(days=1)
+            ultimo = ultimos.get(profesor.id)
+            if ultimo is None:
+                primero = options['desde'] or timezone.localtime(
+                    profesor.date_joined, zona_horaria(profesor.timezone)
+                ).date()
+            else:
+                primero = ultimo + timedelta(days=1)
+
+            marcados = pendientes.get(profesor.id, [])
+            # Los días marcados posteriores al último resumen entran igualmente como días nuevos
+            fechas = {
+                fecha
+                for _, fecha_utc in marcados
+                for fecha in dias_locales(fecha_utc)
+                if ultimo is not None and fecha <= ultimo
+            }
+            dia = primero
+            while dia <= ayer:
+                fechas.add(dia)
+                dia += timedelta(days=1)
+
+            with transaction.atomic():
+                escritos = resumir_dias(profesor, fechas)
+                DiaPendienteResumen.objects.filter(id__in=[id_pendiente for id_pendiente, _ in marcados]).delete()
+
+            if escritos:
+                total += escritos
+                self.stdout.write(f"{profesor.username}: {escritos} días resumidos")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} resúmenes diarios actualizados"))
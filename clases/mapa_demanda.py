@@ -0,0 +1,147 @@
+# clases/mapa_demanda.py
+"""
+Mapa de calor de demanda frente a oferta (día de la semana × hora × duración).
+
+Los datos se sacan de la base de datos en dos listas planas (reservas y huecos
+expandidos) y toda la agregación se hace con arrays de NumPy: conversión a hora
+local con searchsorted sobre los periodos DST, reparto de los huecos en celdas
+horarias con repeat/arange y acumulación con np.add.at.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pytz
+from django.utils import timezone
+
+from users.models import CustomUser
+from .models import Clase, Reserva, ReservaArchivada, HorarioRecurrente
+from .utils import periodos_dst, expandir_horarios, zona_horaria
+
+DURACIONES = [duracion for duracion, _ in Clase.DURACION_CHOICES]
+EPOCH = datetime(1970, 1, 1)
+SEGUNDOS_DIA = 24 * 60 * 60
+
+
+def _segundos(instantes):
+    """datetimes aware -> segundos UTC desde epoch (int64)"""
+    return np.array([int(instante.timestamp()) for instante in instantes], dtype=np.int64)
+
+
+def _a_local(segundos_utc, nombre_zona):
+    """Suma a cada instante el offset de la zona vigente en ese momento (vectorizado)"""
+    periodos = periodos_dst(nombre_zona)
+    inicios = np.array(
+        [-(2 ** 62) if inicio == datetime.min else int((inicio - EPOCH).total_seconds()) for inicio, _, _ in periodos],
+        dtype=np.int64
+    )
+    offsets = np.array([int(offset.total_seconds()) for _, _, offset in periodos], dtype=np.int64)
+    indices = np.clip(np.searchsorted(inicios, segundos_utc, side='right') - 1, 0, len(periodos) - 1)
+    return segundos_utc + offsets[indices]
+
+
+def _dia_y_hora(segundos_locales):
+    # 1970-01-01 fue jueves (3 si el lunes es 0)
+    return (segundos_locales // SEGUNDOS_DIA + 3) % 7, (segundos_locales % SEGUNDOS_DIA) // 3600
+
+
+def _demanda(desde, hasta, nombre_zona):
+    """
+    Reservas (no rechazadas) que empiezan en cada celda. Se leen también las archivadas:
+    archivar_reservas mueve las de más de RESERVAS_ARCHIVO_DIAS fuera de Reserva y la
+    ventana puede llegar a 104 semanas.
+    """
+    demanda = np.zeros((7, 24, len(DURACIONES)), dtype=np.int64)
+    filas = [
+        fila
+        for modelo in (Reserva, ReservaArchivada)
+        for fila in (
+            modelo.objects
+            .filter(inicio__gte=desde, inicio__lt=hasta)
+            .exclude(estado='rechazada')
+            .values_list('inicio', 'clase__duracion_minutos')
+        )
+    ]
+    if not filas:
+        return demanda
+
+    inicios, duraciones = zip(*filas)
+    duraciones = np.array(duraciones)
+    conocidas = np.isin(duraciones, DURACIONES)
+    dia, hora = _dia_y_hora(_a_local(_segundos(inicios), nombre_zona))
+    indice_duracion = np.searchsorted(DURACIONES, duraciones)
+    np.add.at(demanda, (dia[conocidas], hora[conocidas], indice_duracion[conocidas]), 1)
+    return demanda
+
+
+def _oferta(desde, hasta, nombre_zona):
+    """
+    Minutos ofrecidos en cada celda por huecos donde cabe cada duración. Un hueco de
+    09:30 a 11:00 aporta 30 minutos a la celda de las 9 y 60 a la de las 10.
+    """
+    oferta = np.zeros((7, 24, len(DURACIONES)), dtype=np.int64)
+
+    horarios_por_profesor = {}
+    for horario in HorarioRecurrente.objects.filter(activo=True, profesor__role='teacher'):
+        horarios_por_profesor.setdefault(horario.profesor_id, []).append(horario)
+    if not horarios_por_profesor:
+        return oferta
+    zonas = dict(CustomUser.objects.filter(id__in=horarios_por_profesor).values_list('id', 'timezone'))
+
+    inicios, fines = [], []
+    for profesor_id, horarios in horarios_por_profesor.items():
+        tz = zona_horaria(zonas.get(profesor_id))
+        for inicio, fin, _ in expandir_horarios(
+            horarios, zonas.get(profesor_id), desde.astimezone(tz).date(), hasta.astimezone(tz).date()
+        ):
+            if desde <= inicio < hasta:
+                inicios.append(inicio)
+                fines.append(fin)
+    if not inicios:
+        return oferta
+
+    inicio_utc = _segundos(inicios)
+    fin_utc = _segundos(fines)
+    # Se trocea en hora local (las zonas con offsets de media hora no cuadran con horas UTC)
+    inicio = _a_local(inicio_utc, nombre_zona)
+    fin = inicio + (fin_utc - inicio_utc)
+    cabe = (fin - inicio)[:, None] >= np.array(DURACIONES) * 60
+
+    primera_hora = inicio // 3600 * 3600
+    celdas_por_hueco = (fin - primera_hora + 3599) // 3600
+    hueco = np.repeat(np.arange(len(inicio)), celdas_por_hueco)
+    desplazamiento = np.arange(len(hueco)) - np.repeat(np.cumsum(celdas_por_hueco) - celdas_por_hueco, celdas_por_hueco)
+    celda = primera_hora[hueco] + desplazamiento * 3600
+    minutos = (np.minimum(celda + 3600, fin[hueco]) - np.maximum(celda, inicio[hueco])) // 60
+
+    dia, hora = _dia_y_hora(celda)
+    for k in range(len(DURACIONES)):
+        mascara = cabe[hueco, k]
+        np.add.at(oferta, (dia[mascara], hora[mascara], k), minutos[mascara])
+    return oferta
+
+
+def calcular_mapa_demanda(nombre_zona='UTC', semanas=12):
+    """Tensores 7×24×3 de demanda y oferta de las últimas `semanas` semanas, en `nombre_zona`"""
+    hoy = timezone.now().astimezone(pytz.UTC).date()
+    desde = pytz.UTC.localize(datetime.combine(hoy - timedelta(weeks=semanas), time.min))
+    hasta = pytz.UTC.localize(datetime.combine(hoy, time.min))
+
+    demanda = _demanda(desde, hasta, nombre_zona)
+    oferta = _oferta(desde, hasta, nombre_zona)
+
+    minutos_demandados = (demanda * np.array(DURACIONES)).sum(axis=2)
+    minutos_ofrecidos = oferta.max(axis=2)  # quien cabe en 80 también cabe en 25
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(minutos_ofrecidos > 0, minutos_demandados / minutos_ofrecidos, np.nan)
+
+    return {
+        'timezone': nombre_zona,
+        'desde': desde.date().isoformat(),
+        'hasta': hasta.date().isoformat(),
+        'duraciones': DURACIONES,
+        'dias': [nombre for _, nombre in HorarioRecurrente.DIA_SEMANA_CHOICES],
+        'demanda': demanda.tolist(),
+        'oferta_minutos': oferta.tolist(),
+        # Minutos reservados por minuto ofrecido; None donde nadie ofrece clases
+        'ratio': [[None if np.isnan(valor) else round(float(valor), 3) for valor in fila] for fila in ratio],
+    }
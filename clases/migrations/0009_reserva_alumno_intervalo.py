@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clases', '0008_alter_clase_duracion_minutos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['alumno', 'inicio', 'fin'], name='reserva_alumno_intervalo'),
+        ),
+    ]
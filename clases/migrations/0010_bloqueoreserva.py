@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clases', '0009_reserva_alumno_intervalo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('expira_en', models.DateTimeField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloqueos_reserva', to=settings.AUTH_USER_MODEL)),
+                ('clase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloqueos', to='clases.clase')),
+                ('profesor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloqueos_recibidos', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Bloqueo de reserva',
+                'verbose_name_plural': 'Bloqueos de reserva',
+                'ordering': ['inicio'],
+                'indexes': [models.Index(fields=['profesor', 'inicio', 'fin'], name='bloqueo_profesor_intervalo'), models.Index(fields=['expira_en'], name='bloqueo_expira_en')],
+            },
+        ),
+    ]
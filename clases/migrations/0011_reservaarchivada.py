@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clases', '0010_bloqueoreserva'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaArchivada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reserva_id', models.BigIntegerField(unique=True)),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente (compra iniciada)'), ('aceptada', 'Aceptada por el profesor'), ('rechazada', 'Rechazada por el profesor'), ('completada', 'Clase completada'), ('validada', 'Validada por el profesor')], max_length=20)),
+                ('creada_en', models.DateTimeField()),
+                ('comentario_profesor', models.TextField(blank=True, null=True)),
+                ('archivada_en', models.DateTimeField(auto_now_add=True)),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_archivadas', to=settings.AUTH_USER_MODEL)),
+                ('clase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_archivadas', to='clases.clase')),
+                ('profesor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_archivadas_como_profesor', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reserva archivada',
+                'verbose_name_plural': 'Reservas archivadas',
+                'ordering': ['-creada_en'],
+                'indexes': [models.Index(fields=['alumno', 'inicio'], name='archivada_alumno_inicio'), models.Index(fields=['profesor', 'inicio'], name='archivada_profesor_inicio')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clases', '0011_reservaarchivada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaPendienteResumen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_utc', models.DateField()),
+                ('marcado_en', models.DateTimeField(auto_now_add=True)),
+                ('clase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dias_pendientes_resumen', to='clases.clase')),
+            ],
+            options={
+                'verbose_name': 'Día pendiente de resumen',
+                'verbose_name_plural': 'Días pendientes de resumen',
+                'unique_together': {('clase', 'fecha_utc')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiarioProfesor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('minutos_disponibles', models.PositiveIntegerField(default=0)),
+                ('minutos_reservados', models.PositiveIntegerField(default=0)),
+                ('minutos_impartidos', models.PositiveIntegerField(default=0)),
+                ('clases_impartidas', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('profesor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de profesor',
+                'verbose_name_plural': 'Resúmenes diarios de profesor',
+                'ordering': ['profesor', 'fecha'],
+                'unique_together': {('profesor', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clases', '0012_resumenes_profesor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcepcionHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+                ('uid_ics', models.CharField(blank=True, max_length=255, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('profesor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excepciones_horario', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Excepción de horario',
+                'verbose_name_plural': 'Excepciones de horario',
+                'ordering': ['inicio'],
+                'indexes': [models.Index(fields=['profesor', 'inicio', 'fin'], name='excepcion_profesor_intervalo')],
+                'unique_together': {('profesor', 'uid_ics', 'inicio')},
+            },
+        ),
+    ]
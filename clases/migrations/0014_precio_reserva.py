@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:54
+
+from django.db import migrations, models
+
+
+def rellenar_precios(apps, schema_editor):
+    """Las reservas anteriores no guardaban precio: se les asigna la tarifa vigente de su duración"""
+    PrecioClase = apps.get_model('pagos', 'PrecioClase')
+    for duracion, precio in PrecioClase.objects.values_list('duracion_minutos', 'precio'):
+        for modelo in ('Reserva', 'ReservaArchivada'):
+            apps.get_model('clases', modelo).objects.filter(
+                precio__isnull=True, clase__duracion_minutos=duracion
+            ).update(precio=precio)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clases', '0013_excepcionhorario'),
+        ('pagos', '0004_catalogo_precios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='precio',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservaarchivada',
+            name='precio',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.RunPython(rellenar_precios, migrations.RunPython.noop),
+    ]
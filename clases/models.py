@@ -2,6 +2,8 @@
 from django.db import models
 from datetime import timedelta, date, datetime
 from django.conf import settings
+from django.utils import timezone
+from pagos import precios
 
 class Clase(models.Model):
     DURACION_CHOICES = [
@@ -25,13 +27,7 @@ class Clase(models.Model):
     
     @property
     def precio(self):
-        if self.duracion_minutos == 25:
-            return 8
-        elif self.duracion_minutos == 50:
-            return 12
-        elif self.duracion_minutos == 80:
-            return 20
-        return 0
+        return precios.precio(self.duracion_minutos)
 
 class Reserva(models.Model):
     ESTADO_CHOICES = [
@@ -53,14 +49,24 @@ class Reserva(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
     creada_en = models.DateTimeField(auto_now_add=True)
     comentario_profesor = models.TextField(blank=True, null=True)
+    # Precio de la clase al reservarla: los informes de ingresos no cambian si luego cambia la tarifa
+    precio = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+
+    # Estados que ocupan el hueco del profesor y la agenda del alumno
+    ESTADOS_ACTIVOS = ['pendiente', 'aceptada']
 
     class Meta:
         unique_together = ('clase', 'inicio', 'alumno')
         ordering = ['-creada_en']
+        indexes = [
+            models.Index(fields=['alumno', 'inicio', 'fin'], name='reserva_alumno_intervalo'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.fin and self.inicio and self.clase:
             self.fin = self.inicio + timedelta(minutes=self.clase.duracion_minutos)
+        if self.precio is None and self.clase_id:
+            self.precio = self.clase.precio
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -75,6 +81,120 @@ class Reserva(models.Model):
         return self.estado == 'pendiente'
 
 
+class ReservaArchivada(models.Model):
+    """Reserva histórica movida fuera de Reserva por el comando archivar_reservas"""
+    ESTADOS_ARCHIVABLES = ['completada', 'validada', 'rechazada']
+
+    reserva_id = models.BigIntegerField(unique=True)
+    clase = models.ForeignKey(Clase, on_delete=models.CASCADE, related_name="reservas_archivadas")
+    profesor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="reservas_archivadas_como_profesor"
+    )
+    alumno = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="reservas_archivadas"
+    )
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField(blank=True, null=True)
+    estado = models.CharField(max_length=20, choices=Reserva.ESTADO_CHOICES)
+    creada_en = models.DateTimeField()
+    comentario_profesor = models.TextField(blank=True, null=True)
+    precio = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    archivada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Reserva archivada"
+        verbose_name_plural = "Reservas archivadas"
+        ordering = ['-creada_en']
+        indexes = [
+            models.Index(fields=['alumno', 'inicio'], name='archivada_alumno_inicio'),
+            models.Index(fields=['profesor', 'inicio'], name='archivada_profesor_inicio'),
+        ]
+
+    def __str__(self):
+        return f"{self.clase.titulo} - {self.alumno.username} ({self.estado}, archivada)"
+
+    @classmethod
+    def desde_reserva(cls, reserva):
+        return cls(
+            reserva_id=reserva.id,
+            clase_id=reserva.clase_id,
+            profesor_id=reserva.clase.profesor_id,
+            alumno_id=reserva.alumno_id,
+            inicio=reserva.inicio,
+            fin=reserva.fin,
+            estado=reserva.estado,
+            creada_en=reserva.creada_en,
+            comentario_profesor=reserva.comentario_profesor,
+            precio=reserva.precio,
+        )
+
+
+class BloqueoReserva(models.Model):
+    """Retención temporal de un hueco mientras el alumno completa la reserva"""
+    profesor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="bloqueos_recibidos"
+    )
+    alumno = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="bloqueos_reserva"
+    )
+    clase = models.ForeignKey(Clase, on_delete=models.CASCADE, related_name="bloqueos")
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+    expira_en = models.DateTimeField()
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Bloqueo de reserva"
+        verbose_name_plural = "Bloqueos de reserva"
+        ordering = ['inicio']
+        indexes = [
+            models.Index(fields=['profesor', 'inicio', 'fin'], name='bloqueo_profesor_intervalo'),
+            models.Index(fields=['expira_en'], name='bloqueo_expira_en'),
+        ]
+
+    def __str__(self):
+        return f"{self.alumno.username} retiene {self.inicio} con {self.profesor.username} hasta {self.expira_en}"
+
+    @property
+    def vigente(self):
+        return self.expira_en > timezone.now()
+
+
+class ExcepcionHorario(models.Model):
+    """Tiempo bloqueado del profesor (vacaciones, citas importadas...) que no se ofrece aunque caiga en su horario"""
+    profesor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="excepciones_horario"
+    )
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+    motivo = models.CharField(max_length=200, blank=True)
+    # UID del evento cuando viene de un .ics, para que reimportar el mismo fichero no duplique
+    uid_ics = models.CharField(max_length=255, blank=True, null=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Excepción de horario"
+        verbose_name_plural = "Excepciones de horario"
+        ordering = ['inicio']
+        unique_together = ['profesor', 'uid_ics', 'inicio']
+        indexes = [
+            models.Index(fields=['profesor', 'inicio', 'fin'], name='excepcion_profesor_intervalo'),
+        ]
+
+    def __str__(self):
+        return f"{self.profesor.username} bloqueado {self.inicio} - {self.fin}"
+
+
 class HorarioRecurrente(models.Model):
     DIA_SEMANA_CHOICES = [
         (0, 'Lunes'),
@@ -126,4 +246,46 @@ class HorarioRecurrente(models.Model):
             'fin': fin_datetime,
             'es_recurrente': True,
             'horario_recurrente_id': self.id
-        }
\ No newline at end of file
+        }
+
+class ResumenDiarioProfesor(models.Model):
+    """Agregado diario (día local del profesor) que alimenta el informe de ingresos y ocupación"""
+    profesor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="resumenes_diarios"
+    )
+    fecha = models.DateField()
+    minutos_disponibles = models.PositiveIntegerField(default=0)
+    minutos_reservados = models.PositiveIntegerField(default=0)
+    minutos_impartidos = models.PositiveIntegerField(default=0)
+    clases_impartidas = models.PositiveIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen diario de profesor"
+        verbose_name_plural = "Resúmenes diarios de profesor"
+        ordering = ['profesor', 'fecha']
+        unique_together = ['profesor', 'fecha']
+
+    def __str__(self):
+        return f"{self.profesor.username} - {self.fecha}: {self.minutos_impartidos} min"
+
+
+class DiaPendienteResumen(models.Model):
+    """
+    Día (en UTC) en que han cambiado reservas de una clase y cuyos resúmenes hay que recalcular.
+    Se guarda la clase y la fecha UTC para poder marcarlo desde las señales sin consultas extra.
+    """
+    clase = models.ForeignKey(Clase, on_delete=models.CASCADE, related_name="dias_pendientes_resumen")
+    fecha_utc = models.DateField()
+    marcado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Día pendiente de resumen"
+        verbose_name_plural = "Días pendientes de resumen"
+        unique_together = ['clase', 'fecha_utc']
+
+    def __str__(self):
+        return f"{self.clase.titulo} - {self.fecha_utc}"
@@ -0,0 +1,108 @@
+# clases/resumenes.py
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import pytz
+
+from pagos.precios import precios
+from .models import Reserva, ReservaArchivada, ResumenDiarioProfesor, DiaPendienteResumen
+from .utils import zona_horaria, expandir_horarios
+
+# Estados que ocupan tiempo del profesor y estados que cuentan como clase impartida
+ESTADOS_RESERVADOS = ['pendiente', 'aceptada', 'completada', 'validada']
+ESTADOS_IMPARTIDOS = ['completada', 'validada']
+
+
+def marcar_dia_pendiente(clase_id, inicio):
+    """Anota el día UTC de `inicio` para que el siguiente resumen recalcule los días locales que lo cubren"""
+    DiaPendienteResumen.objects.bulk_create(
+        [DiaPendienteResumen(clase_id=clase_id, fecha_utc=inicio.astimezone(pytz.UTC).date())],
+        ignore_conflicts=True
+    )
+
+
+def dias_locales(fecha_utc):
+    """Días locales que pueden solaparse con un día UTC, sea cual sea la zona horaria"""
+    return [fecha_utc + timedelta(days=delta) for delta in (-1, 0, 1)]
+
+
+def _tramos_consecutivos(fechas):
+    """Agrupa fechas ordenadas en tramos [desde, hasta) de días consecutivos"""
+    tramos = []
+    for fecha in fechas:
+        if tramos and tramos[-1][1] == fecha:
+            tramos[-1][1] = fecha + timedelta(days=1)
+        else:
+            tramos.append([fecha, fecha + timedelta(days=1)])
+    return tramos
+
+
+def resumir_dias(profesor, fechas):
+    """
+    Recalcula y guarda el ResumenDiarioProfesor de cada fecha (día local del profesor).
+
+    Cada tramo de días consecutivos cuesta una consulta sobre Reserva y otra sobre el
+    archivo; la disponibilidad sale de expandir los horarios recurrentes en memoria. Los
+    ingresos suman el precio guardado en cada reserva al hacerla, no la tarifa actual.
+
+    La disponibilidad solo se calcula la primera vez que se resume un día: al recalcular un
+    día ya resumido (por una reserva marcada) se conserva la guardada, porque los horarios
+    de hoy no tienen por qué ser los que había entonces. Devuelve el número de días escritos.
+    """
+    fechas = sorted(set(fechas))
+    if not fechas:
+        return 0
+
+    user_tz = zona_horaria(profesor.timezone)
+    horarios = list(profesor.horarios_recurrentes.filter(activo=True))
+    tarifas = precios()
+    resumenes = []
+
+    for desde, hasta in _tramos_consecutivos(fechas):
+        inicio_utc = user_tz.localize(datetime.combine(desde, time.min))
+        fin_utc = user_tz.localize(datetime.combine(hasta, time.min))
+        dias = defaultdict(lambda: {
+            'minutos_disponibles': 0, 'minutos_reservados': 0,
+            'minutos_impartidos': 0, 'clases_impartidas': 0, 'ingresos': Decimal('0'),
+        })
+
+        for inicio, fin, _ in expandir_horarios(horarios, profesor.timezone, desde, hasta):
+            dia = dias[inicio.astimezone(user_tz).date()]
+            dia['minutos_disponibles'] += int((fin - inicio).total_seconds() // 60)
+
+        for queryset in (
+            Reserva.objects.filter(clase__profesor=profesor),
+            ReservaArchivada.objects.filter(profesor=profesor),
+        ):
+            reservas = queryset.filter(
+                estado__in=ESTADOS_RESERVADOS,
+                inicio__gte=inicio_utc,
+                inicio__lt=fin_utc
+            ).values_list('inicio', 'estado', 'clase__duracion_minutos', 'precio')
+
+            for inicio, estado, duracion, precio in reservas:
+                dia = dias[inicio.astimezone(user_tz).date()]
+                dia['minutos_reservados'] += duracion
+                if estado in ESTADOS_IMPARTIDOS:
+                    dia['minutos_impartidos'] += duracion
+                    dia['clases_impartidas'] += 1
+                    # Solo las filas creadas sin pasar por save() carecen de precio
+                    dia['ingresos'] += precio if precio is not None else tarifas.get(duracion, 0)
+
+        fecha = desde
+        while fecha < hasta:
+            # Los días sin actividad también se guardan para que cuenten como resumidos
+            resumenes.append(ResumenDiarioProfesor(profesor=profesor, fecha=fecha, **dias[fecha]))
+            fecha += timedelta(days=1)
+
+    ResumenDiarioProfesor.objects.bulk_create(
+        resumenes,
+        update_conflicts=True,
+        unique_fields=['profesor', 'fecha'],
+        # minutos_disponibles no se actualiza: vale lo calculado la primera vez
+        update_fields=[
+            'minutos_reservados', 'minutos_impartidos',
+            'clases_impartidas', 'ingresos', 'actualizado_en',
+        ],
+    )
+    return len(resumenes)
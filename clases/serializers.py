@@ -1,7 +1,10 @@
 # serializers.py - VERSION CORREGIDA
 from rest_framework import serializers
-from .models import Clase, Reserva, HorarioRecurrente
+from .models import Clase, Reserva, ReservaArchivada, HorarioRecurrente, BloqueoReserva
+from .utils import zona_horaria, reservas_solapadas, bloqueos_vigentes
 from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 import pytz
 
@@ -14,13 +17,7 @@ class ClaseSerializer(serializers.ModelSerializer):
         fields = ['id', 'titulo', 'descripcion', 'duracion_minutos', 'precio', 'profesor', 'profesor_nombre']
 
     def get_precio(self, obj):
-        if obj.duracion_minutos == 25:
-            return 8
-        elif obj.duracion_minutos == 50:
-            return 12
-        elif obj.duracion_minutos == 80:
-            return 20
-        return 0
+        return obj.precio
 
 class ReservaSerializer(serializers.ModelSerializer):
     clase_info = ClaseSerializer(source="clase", read_only=True)
@@ -84,6 +81,21 @@ class ReservaSerializer(serializers.ModelSerializer):
     def get_puede_cambiar(self, obj):
         return obj.estado == 'pendiente'
 
+class ReservaArchivadaSerializer(ReservaSerializer):
+    """Misma forma que ReservaSerializer; el id es el de la reserva original"""
+    id = serializers.IntegerField(source='reserva_id', read_only=True)
+    archivada = serializers.BooleanField(default=True, read_only=True)
+
+    class Meta(ReservaSerializer.Meta):
+        model = ReservaArchivada
+        fields = ReservaSerializer.Meta.fields + ['archivada']
+
+    def get_puede_cancelar(self, obj):
+        return False
+
+    def get_puede_cambiar(self, obj):
+        return False
+
 class CrearReservaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reserva
@@ -97,24 +109,15 @@ class CrearReservaSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(f"Formato de fecha inválido: {str(e)}")
         
         request = self.context.get('request')
-        user_timezone = 'Europe/Madrid'
+        user_timezone = 'UTC'
         
         if request and hasattr(request, 'user') and request.user.is_authenticated:
-            user_timezone = request.user.timezone or 'Europe/Madrid'
+            user_timezone = request.user.timezone or 'UTC'
         
-        try:
-            if timezone.is_naive(value):
-                user_tz = pytz.timezone(user_timezone)
-                value = user_tz.localize(value)
-            
-            spain_tz = pytz.timezone('Europe/Madrid')
-            value_spain = value.astimezone(spain_tz)
-            value_utc = value_spain.astimezone(pytz.UTC)
-            
-        except Exception as e:
-            print(f"❌ Error en conversión de timezone: {e}")
-            if timezone.is_naive(value):
-                value = timezone.make_aware(value, timezone=pytz.UTC)
+        # Una fecha sin zona se interpreta en la zona horaria de quien reserva
+        if timezone.is_naive(value):
+            value = zona_horaria(user_timezone).localize(value)
+        value = value.astimezone(pytz.UTC)
         
         if value < timezone.now():
             raise serializers.ValidationError("No se puede reservar en fechas pasadas")
@@ -138,16 +141,42 @@ class CrearReservaSerializer(serializers.ModelSerializer):
             elif clase.duracion_minutos == 80 and user.saldo_clases_80min <= 0:
                 raise serializers.ValidationError("No tienes saldo suficiente para clases de 80 minutos")
 
-        reserva_existente = Reserva.objects.filter(
-            clase=clase,
-            inicio=inicio
-        ).exists()
-        
-        if reserva_existente:
+        fin = inicio + timedelta(minutes=clase.duracion_minutos)
+
+        if self._hueco_ocupado(user, clase, inicio, fin):
+            # La vista usa esto para proponer los huecos libres más cercanos
+            self.conflicto = {
+                'profesor': clase.profesor, 'objetivo': inicio,
+                'duracion': clase.duracion_minutos, 'alumno': user,
+            }
             raise serializers.ValidationError("Ya existe una reserva en este horario")
 
+        if reservas_solapadas(Reserva.objects.filter(alumno=user), inicio, fin).exists():
+            raise serializers.ValidationError("Ya tienes otra clase reservada en ese horario")
+
         return data
 
+    def _hueco_ocupado(self, user, clase, inicio, fin):
+        """El profesor tiene una reserva activa o un bloqueo vigente de otro alumno en [inicio, fin)"""
+        if reservas_solapadas(Reserva.objects.filter(clase__profesor=clase.profesor_id), inicio, fin).exists():
+            return True
+        otros_bloqueos = BloqueoReserva.objects.filter(profesor=clase.profesor_id).exclude(alumno=user)
+        return bloqueos_vigentes(otros_bloqueos, inicio, fin).exists()
+
+    def _bloquear(self, clase, user):
+        """
+        Serializa reservas y bloqueos concurrentes sobre el mismo profesor y sobre el mismo
+        alumno (usar dentro de atomic). Las filas se bloquean por orden de id para que dos
+        peticiones cruzadas no se esperen mutuamente. Devuelve el alumno recién leído.
+        """
+        from users.models import CustomUser
+        bloqueados = {
+            usuario.pk: usuario
+            for usuario in CustomUser.objects.select_for_update().filter(pk__in={clase.profesor_id, user.pk}).order_by('pk')
+        }
+        return bloqueados[user.pk]
+
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
         clase = validated_data['clase']
@@ -155,6 +184,14 @@ class CrearReservaSerializer(serializers.ModelSerializer):
         
         fin = inicio + timedelta(minutes=clase.duracion_minutos)
         
+        # Volver a comprobar con profesor y alumno bloqueados: otra petición pudo validar a la
+        # vez, con este profesor o (el mismo alumno) con otro. El saldo se descuenta sobre la fila leída ahora
+        user = self._bloquear(clase, user)
+        if self._hueco_ocupado(user, clase, inicio, fin):
+            raise serializers.ValidationError("Ya existe una reserva en este horario")
+        if reservas_solapadas(Reserva.objects.filter(alumno=user), inicio, fin).exists():
+            raise serializers.ValidationError("Ya tienes otra clase reservada en ese horario")
+        
         # ✅ CORREGIDO: Descontar saldo usando nombres del modelo
         if user.role == 'student':
             if clase.duracion_minutos == 25:
@@ -184,8 +221,58 @@ class CrearReservaSerializer(serializers.ModelSerializer):
             estado=estado_inicial
         )
 
+        # El bloqueo del alumno con este profesor queda consumido
+        BloqueoReserva.objects.filter(profesor=clase.profesor_id, alumno=user).delete()
+
         return reserva
 
+class BloqueoReservaSerializer(serializers.ModelSerializer):
+    profesor_nombre = serializers.CharField(source="profesor.username", read_only=True)
+    segundos_restantes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BloqueoReserva
+        fields = ['id', 'clase', 'profesor', 'profesor_nombre', 'alumno', 'inicio', 'fin',
+                  'expira_en', 'segundos_restantes', 'creado_en']
+        read_only_fields = fields
+
+    def get_segundos_restantes(self, obj):
+        return max(int((obj.expira_en - timezone.now()).total_seconds()), 0)
+
+class CrearBloqueoReservaSerializer(CrearReservaSerializer):
+    """Retiene un hueco durante RESERVA_BLOQUEO_MINUTOS con las mismas validaciones que una reserva"""
+
+    class Meta:
+        model = BloqueoReserva
+        fields = ['clase', 'inicio']
+
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.context['request'].user
+        clase = validated_data['clase']
+        inicio = validated_data['inicio']
+        fin = inicio + timedelta(minutes=clase.duracion_minutos)
+        ahora = timezone.now()
+
+        self._bloquear(clase, user)
+        # Recuperación perezosa: los bloqueos caducados de este profesor se borran aquí, sin cron
+        BloqueoReserva.objects.filter(profesor=clase.profesor_id, expira_en__lte=ahora).delete()
+
+        if self._hueco_ocupado(user, clase, inicio, fin):
+            raise serializers.ValidationError("Ya existe una reserva en este horario")
+
+        # Un alumno solo retiene un hueco a la vez con cada profesor
+        BloqueoReserva.objects.filter(profesor=clase.profesor_id, alumno=user).delete()
+
+        return BloqueoReserva.objects.create(
+            profesor_id=clase.profesor_id,
+            alumno=user,
+            clase=clase,
+            inicio=inicio,
+            fin=fin,
+            expira_en=ahora + timedelta(minutes=settings.RESERVA_BLOQUEO_MINUTOS)
+        )
+
 class HorarioRecurrenteSerializer(serializers.ModelSerializer):
     profesor_nombre = serializers.CharField(source="profesor.username", read_only=True)
     dia_semana_nombre = serializers.CharField(source="get_dia_semana_display", read_only=True)
@@ -205,7 +292,8 @@ class HorarioRecurrenteSerializer(serializers.ModelSerializer):
     def get_hora_fin(self, obj):
         return obj.hora_fin.strftime('%H:%M') if obj.hora_fin else None
 
-class CrearHorarioRecurrenteSerializer(serializers.ModelSerializer):
+class FranjaHorarioSerializer(serializers.ModelSerializer):
+    """Validación de una franja semanal que no necesita consultar la base de datos"""
     class Meta:
         model = HorarioRecurrente
         fields = ['dia_semana', 'hora_inicio', 'hora_fin', 'activo']
@@ -226,12 +314,19 @@ class CrearHorarioRecurrenteSerializer(serializers.ModelSerializer):
         if user.role != 'teacher':
             raise serializers.ValidationError("Solo los profesores pueden configurar horarios recurrentes")
         
+        return data
+
+
+class CrearHorarioRecurrenteSerializer(FranjaHorarioSerializer):
+    def validate(self, data):
+        data = super().validate(data)
+        
         horarios_solapados = HorarioRecurrente.objects.filter(
-            profesor=user,
+            profesor=self.context['request'].user,
             dia_semana=data['dia_semana'],
             activo=True,
-            hora_inicio__lt=hora_fin,
-            hora_fin__gt=hora_inicio
+            hora_inicio__lt=data['hora_fin'],
+            hora_fin__gt=data['hora_inicio']
         ).exclude(id=self.instance.id if self.instance else None).exists()
         
         if horarios_solapados:
@@ -241,4 +336,37 @@ class CrearHorarioRecurrenteSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        return HorarioRecurrente.objects.create(profesor=user, **validated_data)
\ No newline at end of file
+        return HorarioRecurrente.objects.create(profesor=user, **validated_data)
+
+class SemanaHorarioSerializer(serializers.Serializer):
+    """Plantilla semanal completa; los solapes se comprueban en memoria ordenando y barriendo"""
+    horarios = FranjaHorarioSerializer(many=True)
+
+    def validate_horarios(self, horarios):
+        por_dia = {}
+        for franja in horarios:
+            por_dia.setdefault(franja['dia_semana'], []).append(franja)
+        
+        for dia, franjas in por_dia.items():
+            franjas.sort(key=lambda franja: (franja['hora_inicio'], franja['hora_fin']))
+            fin_activas = None
+            anterior = None
+            for franja in franjas:
+                clave = (franja['hora_inicio'], franja['hora_fin'])
+                if clave == anterior:
+                    raise serializers.ValidationError(
+                        f"Franja repetida el {HorarioRecurrente(dia_semana=dia).get_dia_semana_display()} "
+                        f"{franja['hora_inicio']:%H:%M}-{franja['hora_fin']:%H:%M}"
+                    )
+                anterior = clave
+                # Igual que en la creación individual, solo se solapan las franjas activas
+                if not franja.get('activo', True):
+                    continue
+                if fin_activas is not None and franja['hora_inicio'] < fin_activas:
+                    raise serializers.ValidationError(
+                        f"Las franjas del {HorarioRecurrente(dia_semana=dia).get_dia_semana_display()} se solapan "
+                        f"({franja['hora_inicio']:%H:%M}-{franja['hora_fin']:%H:%M})"
+                    )
+                fin_activas = max(fin_activas, franja['hora_fin']) if fin_activas else franja['hora_fin']
+        
+        return horarios
@@ -0,0 +1,111 @@
+# clases/signals.py
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import CustomUser
+from .models import Clase, Reserva, ReservaArchivada, HorarioRecurrente, ExcepcionHorario, BloqueoReserva
+from .resumenes import marcar_dia_pendiente
+from .utils import invalidar_huecos_libres
+
+
+CLAVE_VERSION_CATALOGO = "catalogo_clases:version"
+
+
+def clave_historial_alumno(alumno_id):
+    return f"historial_alumno:{alumno_id}"
+
+
+def version_catalogo_clases():
+    """Versión actual del catálogo de clases; forma parte de las claves de caché y del ETag"""
+    return cache.get_or_set(CLAVE_VERSION_CATALOGO, lambda: int(time.time() * 1000), None)
+
+
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+@receiver(post_save, sender=ReservaArchivada)
+@receiver(post_delete, sender=ReservaArchivada)
+def invalidar_historial_alumno(sender, instance, **kwargs):
+    """Cualquier cambio en las reservas del alumno deja obsoleto su historial cacheado"""
+    cache.delete(clave_historial_alumno(instance.alumno_id))
+
+
+@receiver(post_init, sender=Reserva)
+def recordar_inicio_original(sender, instance, **kwargs):
+    # Se lee del __dict__ para no cargar el campo si la consulta lo difirió
+    instance._inicio_original = instance.__dict__.get('inicio')
+
+
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+def marcar_resumen_profesor(sender, instance, **kwargs):
+    """Los días afectados por la reserva se recalculan en el próximo resumir_profesores"""
+    # Las completadas/validadas solo salen de Reserva al archivarse (cancelar no las admite) y
+    # las rechazadas no cuentan: el resumen lee también el archivo, así que no cambia nada
+    if kwargs.get('signal') is post_delete and instance.estado in ReservaArchivada.ESTADOS_ARCHIVABLES:
+        return
+    if instance.inicio:
+        marcar_dia_pendiente(instance.clase_id, instance.inicio)
+    original = getattr(instance, '_inicio_original', None)
+    if original and original != instance.inicio:
+        # Cambio de fecha: el día anterior también deja de estar al día
+        marcar_dia_pendiente(instance.clase_id, original)
+    instance._inicio_original = instance.inicio
+
+
+@receiver(post_save, sender=Clase)
+@receiver(post_delete, sender=Clase)
+def invalidar_catalogo_clases(sender, instance, **kwargs):
+    """Cambiar la versión deja huérfanas todas las respuestas cacheadas del catálogo"""
+    try:
+        cache.incr(CLAVE_VERSION_CATALOGO)
+    except ValueError:
+        # La versión no estaba en caché: cualquiera nueva sirve
+        version_catalogo_clases()
+
+
+@receiver(post_init, sender=CustomUser)
+def recordar_username_original(sender, instance, **kwargs):
+    instance._username_original = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidar_catalogo_por_profesor(sender, instance, created, update_fields=None, **kwargs):
+    """
+    El catálogo solo muestra el username del profesor: cualquier otro guardado (last_login
+    en cada inicio de sesión, saldos, etc.) no lo invalida.
+    """
+    original = instance._username_original
+    instance._username_original = instance.__dict__.get('username')
+    if created or instance.role != 'teacher':
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if original != instance._username_original:
+        invalidar_catalogo_clases(sender, instance)
+
+
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+def invalidar_huecos_por_reserva(sender, instance, **kwargs):
+    # Borrar una reserva inactiva (p. ej. al archivar) no libera nada
+    if kwargs.get('signal') is post_delete and instance.estado not in Reserva.ESTADOS_ACTIVOS:
+        return
+    # Sin la clase ya cargada, basta con su profesor_id (no el objeto entero)
+    if Reserva.clase.is_cached(instance):
+        profesor_id = instance.clase.profesor_id
+    else:
+        profesor_id = Clase.objects.filter(pk=instance.clase_id).values_list('profesor_id', flat=True).first()
+    invalidar_huecos_libres(profesor_id)
+
+
+@receiver(post_save, sender=HorarioRecurrente)
+@receiver(post_delete, sender=HorarioRecurrente)
+@receiver(post_save, sender=ExcepcionHorario)
+@receiver(post_delete, sender=ExcepcionHorario)
+@receiver(post_save, sender=BloqueoReserva)
+@receiver(post_delete, sender=BloqueoReserva)
+def invalidar_huecos_del_profesor(sender, instance, **kwargs):
+    invalidar_huecos_libres(instance.profesor_id)
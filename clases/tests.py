@@ -1,3 +1,459 @@
-from django.test import TestCase
+import os
+import time as reloj
+from datetime import date, datetime, time, timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+import pytz
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from django_tests_backend.idempotencia import idempotente
+
+from pagos import precios
+from pagos.models import PrecioClase
+from users.models import CustomUser
+from .models import (
+    Clase, Reserva, ReservaArchivada, HorarioRecurrente, BloqueoReserva,
+    ResumenDiarioProfesor, DiaPendienteResumen,
+)
+from .resumenes import resumir_dias
+from .serializers import CrearReservaSerializer
+from .utils import expandir_horarios, reservas_solapadas, indice_huecos_libres, refrescar_huecos_libres
+
+
+class SolapeAlumnoBenchmarkTest(TestCase):
+    """Comprobación de solapes del alumno con un historial grande"""
+
+    HISTORIAL = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x',
+            role='student', saldo_clases_50min=10
+        )
+        cls.profesor_a = CustomUser.objects.create_user(
+            username='profe_a', email='a@test.com', password='x', role='teacher'
+        )
+        cls.profesor_b = CustomUser.objects.create_user(
+            username='profe_b', email='b@test.com', password='x', role='teacher'
+        )
+        cls.clase_a = Clase.objects.create(profesor=cls.profesor_a, titulo='A', duracion_minutos=50)
+        cls.clase_b = Clase.objects.create(profesor=cls.profesor_b, titulo='B', duracion_minutos=50)
+
+        # Historial antiguo y completado, más una clase futura con el profesor A
+        base = timezone.now() - timedelta(days=cls.HISTORIAL)
+        Reserva.objects.bulk_create([
+            Reserva(
+                clase=cls.clase_a, alumno=cls.alumno, estado='completada',
+                inicio=base + timedelta(days=i), fin=base + timedelta(days=i, minutes=50)
+            )
+            for i in range(cls.HISTORIAL)
+        ])
+        cls.inicio = (timezone.now() + timedelta(days=2)).replace(microsecond=0)
+        Reserva.objects.create(clase=cls.clase_a, alumno=cls.alumno, inicio=cls.inicio, estado='aceptada')
+
+    def _serializer(self, clase, inicio):
+        request = APIRequestFactory().post('/api/clases/reservas/')
+        request.user = self.alumno
+        return CrearReservaSerializer(
+            data={'clase': clase.id, 'inicio': inicio.isoformat()},
+            context={'request': request}
+        )
+
+    def test_rechaza_solape_con_otro_profesor(self):
+        serializer = self._serializer(self.clase_b, self.inicio + timedelta(minutes=20))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("Ya tienes otra clase reservada en ese horario", str(serializer.errors))
+
+    def test_acepta_hueco_libre(self):
+        serializer = self._serializer(self.clase_b, self.inicio + timedelta(minutes=50))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_create_revalida_el_solape_del_alumno(self):
+        # Dos peticiones validadas a la vez con profesores distintos: la segunda no debe guardarse
+        inicio = self.inicio + timedelta(days=1)
+        primera = self._serializer(self.clase_a, inicio)
+        segunda = self._serializer(self.clase_b, inicio + timedelta(minutes=20))
+        self.assertTrue(primera.is_valid(), primera.errors)
+        self.assertTrue(segunda.is_valid(), segunda.errors)
+
+        primera.save()
+        with self.assertRaisesMessage(ValidationError, "Ya tienes otra clase reservada en ese horario"):
+            segunda.save()
+        self.alumno.refresh_from_db()
+        self.assertEqual(self.alumno.saldo_clases_50min, 9)
+
+    def test_consulta_del_alumno_usa_indice(self):
+        qs = reservas_solapadas(
+            Reserva.objects.filter(alumno=self.alumno), self.inicio, self.inicio + timedelta(minutes=50)
+        ).only('id')
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = ' '.join(str(fila) for fila in cursor.fetchall())
+        self.assertIn('reserva_alumno_intervalo', plan)
+
+    def test_una_sola_consulta(self):
+        inicio = self.inicio + timedelta(minutes=20)
+        fin = inicio + timedelta(minutes=50)
+        with self.assertNumQueries(1):
+            reservas_solapadas(Reserva.objects.filter(alumno=self.alumno), inicio, fin).exists()
+
+    # El tiempo depende de la máquina: solo se mide a petición (BENCHMARK=1 python manage.py test clases)
+    @skipUnless(os.environ.get('BENCHMARK'), "benchmark de tiempo desactivado; activar con BENCHMARK=1")
+    def test_benchmark_tiempo_acotado(self):
+        inicio = self.inicio + timedelta(minutes=20)
+        fin = inicio + timedelta(minutes=50)
+        repeticiones = 200
+        comienzo = reloj.perf_counter()
+        for _ in range(repeticiones):
+            reservas_solapadas(Reserva.objects.filter(alumno=self.alumno), inicio, fin).exists()
+        media_ms = (reloj.perf_counter() - comienzo) * 1000 / repeticiones
+        # Con el índice la consulta no depende del tamaño del historial
+        self.assertLess(media_ms, 20, f"{media_ms:.2f} ms por comprobación con {self.HISTORIAL} reservas")
+
+
+class ExpandirHorariosDSTTest(SimpleTestCase):
+    """La plantilla semanal se interpreta en hora local del profesor a ambos lados del cambio de hora"""
+
+    ZONA = 'Europe/Madrid'
+
+    def _horas_utc(self, desde, hasta, hora=time(9)):
+        # Una franja de una hora todos los días (instancias sin guardar: no hace falta base de datos)
+        horarios = [
+            HorarioRecurrente(dia_semana=dia, hora_inicio=hora, hora_fin=time(hora.hour + 1, hora.minute))
+            for dia in range(7)
+        ]
+        huecos = expandir_horarios(horarios, self.ZONA, desde, hasta)
+        for inicio, fin, _ in huecos:
+            self.assertEqual(fin - inicio, timedelta(hours=1))
+            self.assertEqual(inicio.astimezone(pytz.timezone(self.ZONA)).time(), hora)
+        return [(inicio.date(), inicio.hour) for inicio, _, _ in huecos]
+
+    def test_semana_del_adelanto(self):
+        # 30/03/2025: a las 02:00 pasa a ser las 03:00 (UTC+1 -> UTC+2)
+        horas = self._horas_utc(date(2025, 3, 24), date(2025, 4, 1))
+        self.assertEqual(horas, [(date(2025, 3, dia), 8) for dia in range(24, 30)]
+                         + [(date(2025, 3, 30), 7), (date(2025, 3, 31), 7)])
+
+    def test_semana_del_retraso(self):
+        # 26/10/2025: a las 03:00 vuelve a ser las 02:00 (UTC+2 -> UTC+1)
+        horas = self._horas_utc(date(2025, 10, 20), date(2025, 10, 28))
+        self.assertEqual(horas, [(date(2025, 10, dia), 7) for dia in range(20, 26)]
+                         + [(date(2025, 10, 26), 8), (date(2025, 10, 27), 8)])
+
+    def test_franja_de_madrugada_tras_el_retraso(self):
+        # 01:00 local el día del cambio aún es horario de verano; el día siguiente ya no
+        horas = self._horas_utc(date(2025, 10, 26), date(2025, 10, 28), hora=time(1))
+        self.assertEqual(horas, [(date(2025, 10, 25), 23), (date(2025, 10, 27), 0)])
+
+    def test_rango_que_empieza_a_mitad_de_periodo(self):
+        horas = self._horas_utc(date(2025, 7, 15), date(2025, 7, 17))
+        self.assertEqual(horas, [(date(2025, 7, 15), 7), (date(2025, 7, 16), 7)])
+
+        horas = self._horas_utc(date(2025, 12, 31), date(2026, 1, 2))
+        self.assertEqual(horas, [(date(2025, 12, 31), 8), (date(2026, 1, 1), 8)])
+
+    def test_varios_cambios_en_un_rango(self):
+        huecos = expandir_horarios(
+            [HorarioRecurrente(dia_semana=dia, hora_inicio=time(9), hora_fin=time(10)) for dia in range(7)],
+            self.ZONA, date(2025, 1, 1), date(2027, 1, 1)
+        )
+        tz = pytz.timezone(self.ZONA)
+        esperado = [
+            tz.localize(datetime.combine(date(2025, 1, 1) + timedelta(days=i), time(9))).astimezone(pytz.UTC)
+            for i in range((date(2027, 1, 1) - date(2025, 1, 1)).days)
+        ]
+        self.assertEqual([inicio for inicio, _, _ in huecos], esperado)
+
+
+class BloqueoReservaTest(TestCase):
+    """Retenciones de hueco durante el pago"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student', saldo_clases_50min=5
+        )
+        cls.otro = CustomUser.objects.create_user(
+            username='otro', email='otro@test.com', password='x', role='student', saldo_clases_50min=5
+        )
+        cls.clase = Clase.objects.create(profesor=cls.profesor, titulo='Clase', duracion_minutos=50)
+        cls.inicio = (timezone.now() + timedelta(days=3)).replace(minute=0, second=0, microsecond=0)
+
+    def _cliente(self, usuario):
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente
+
+    def _reservar(self, usuario, inicio):
+        return self._cliente(usuario).post(
+            '/api/clases/reservas/', {'clase': self.clase.id, 'inicio': inicio.isoformat()}, format='json'
+        )
+
+    def _retener(self, usuario, inicio):
+        return self._cliente(usuario).post(
+            '/api/clases/bloqueos/', {'clase': self.clase.id, 'inicio': inicio.isoformat()}, format='json'
+        )
+
+    def test_bloqueo_de_otro_alumno_impide_reservar(self):
+        self.assertEqual(self._retener(self.alumno, self.inicio).status_code, 201)
+
+        # También un hueco que solo se solapa en parte
+        for inicio in (self.inicio, self.inicio + timedelta(minutes=30)):
+            respuesta = self._reservar(self.otro, inicio)
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertIn("Ya existe una reserva en este horario", respuesta.json()['error'])
+        self.assertEqual(self._retener(self.otro, self.inicio).status_code, 400)
+
+    def test_bloqueo_caducado_no_impide_reservar(self):
+        self._retener(self.alumno, self.inicio)
+        BloqueoReserva.objects.update(expira_en=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self._reservar(self.otro, self.inicio).status_code, 201)
+
+    def test_quien_retiene_puede_reservar(self):
+        self._retener(self.alumno, self.inicio)
+
+        self.assertEqual(self._reservar(self.alumno, self.inicio).status_code, 201)
+        # La reserva consume su bloqueo
+        self.assertFalse(BloqueoReserva.objects.exists())
+
+
+class VistaIdempotentePrueba(APIView):
+    """Vista mínima para probar el decorador; `respuesta` decide qué devuelve cada llamada"""
+    llamadas = 0
+    respuesta = None
+
+    @idempotente
+    def post(self, request):
+        VistaIdempotentePrueba.llamadas += 1
+        return self.respuesta(request)
+
+
+class IdempotenciaTest(TestCase):
+    """Cabecera Idempotency-Key en la creación de reservas y en el decorador idempotente"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student', saldo_clases_50min=5
+        )
+        cls.clase = Clase.objects.create(profesor=cls.profesor, titulo='Clase', duracion_minutos=50)
+        cls.inicio = (timezone.now() + timedelta(days=3)).replace(minute=0, second=0, microsecond=0)
+
+    def setUp(self):
+        caches['idempotencia'].clear()
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.alumno)
+        VistaIdempotentePrueba.llamadas = 0
+
+    def _reservar(self, inicio, clave='clave-1'):
+        return self.cliente.post(
+            '/api/clases/reservas/', {'clase': self.clase.id, 'inicio': inicio.isoformat()},
+            format='json', HTTP_IDEMPOTENCY_KEY=clave
+        )
+
+    def _llamar(self, respuesta, clave='clave-1'):
+        VistaIdempotentePrueba.respuesta = staticmethod(respuesta)
+        request = APIRequestFactory().post('/prueba/', {'a': 1}, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+        force_authenticate(request, self.alumno)
+        return VistaIdempotentePrueba.as_view()(request)
+
+    def test_reintento_devuelve_la_respuesta_guardada_sin_tocar_la_bd(self):
+        primera = self._reservar(self.inicio)
+        self.assertEqual(primera.status_code, 201)
+
+        with self.assertNumQueries(0):
+            repetida = self._reservar(self.inicio)
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_misma_clave_con_otro_cuerpo_da_422(self):
+        self._reservar(self.inicio)
+
+        respuesta = self._reservar(self.inicio + timedelta(hours=2))
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_duplicado_en_curso_da_409(self):
+        internas = []
+
+        def reentrante(request):
+            # Llega el reintento mientras la primera petición todavía se procesa
+            if not internas:
+                internas.append(self._llamar(reentrante))
+            return Response({'ok': True}, status=201)
+
+        respuesta = self._llamar(reentrante)
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(internas[0].status_code, 409)
+        self.assertEqual(VistaIdempotentePrueba.llamadas, 1)
+
+    def test_error_5xx_no_se_guarda(self):
+        fallo = self._llamar(lambda request: Response({'error': 'caído'}, status=503))
+        self.assertEqual(fallo.status_code, 503)
+
+        # El reintento se ejecuta de nuevo y su respuesta sí se guarda
+        self.assertEqual(self._llamar(lambda request: Response({'ok': True}, status=201)).status_code, 201)
+        self.assertEqual(self._llamar(lambda request: Response({'ok': True}, status=201)).status_code, 201)
+        self.assertEqual(VistaIdempotentePrueba.llamadas, 2)
+
+
+class ResumenDiarioTest(TestCase):
+    """Ingresos con el precio de la reserva y días ya resumidos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        cls.clase = Clase.objects.create(profesor=cls.profesor, titulo='Clase', duracion_minutos=50)
+        cls.inicio = (timezone.now() - timedelta(days=200)).replace(hour=12, minute=0, second=0, microsecond=0)
+        cls.fecha = cls.inicio.date()
+
+    def setUp(self):
+        self.reserva = Reserva.objects.create(
+            clase=self.clase, alumno=self.alumno, inicio=self.inicio, estado='completada'
+        )
+        self.precio = PrecioClase.objects.get(duracion_minutos=50).precio
+
+    def _cambiar_tarifa(self):
+        # El catálogo en memoria se recarga al confirmar el cambio y otra vez al deshacerlo
+        self.addCleanup(precios.invalidar)
+        with self.captureOnCommitCallbacks(execute=True):
+            tarifa = PrecioClase.objects.get(duracion_minutos=50)
+            tarifa.precio = self.precio * 2
+            tarifa.save()
+
+    def test_ingresos_usan_el_precio_guardado_al_reservar(self):
+        self.assertEqual(self.reserva.precio, self.precio)
+        self._cambiar_tarifa()
+
+        resumir_dias(self.profesor, [self.fecha])
+        self.assertEqual(ResumenDiarioProfesor.objects.get(fecha=self.fecha).ingresos, self.precio)
+
+    def test_recalcular_conserva_la_disponibilidad_guardada(self):
+        ResumenDiarioProfesor.objects.create(profesor=self.profesor, fecha=self.fecha, minutos_disponibles=120)
+
+        resumir_dias(self.profesor, [self.fecha])
+        resumen = ResumenDiarioProfesor.objects.get(fecha=self.fecha)
+        self.assertEqual(resumen.minutos_disponibles, 120)
+        self.assertEqual(resumen.clases_impartidas, 1)
+
+    def test_archivar_no_marca_dias_pendientes(self):
+        DiaPendienteResumen.objects.all().delete()
+        self._cambiar_tarifa()
+
+        call_command('archivar_reservas', stdout=open(os.devnull, 'w'))
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(ReservaArchivada.objects.get().precio, self.precio)
+        self.assertFalse(DiaPendienteResumen.objects.exists())
+
+
+class CatalogoClasesETagTest(TestCase):
+    """ETag y 304 del catálogo público de clases"""
+
+    URL = '/api/clases/clases/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        cls.clase = Clase.objects.create(profesor=cls.profesor, titulo='Clase', duracion_minutos=50)
+
+    def setUp(self):
+        cache.clear()
+        self.cliente = APIClient()
+
+    def _etag(self):
+        respuesta = self.cliente.get(self.URL)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta['ETag']
+
+    def test_if_none_match_devuelve_304(self):
+        etag = self._etag()
+
+        respuesta = self.cliente.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], etag)
+        self.assertEqual(self.cliente.get(self.URL, HTTP_IF_NONE_MATCH='"otro"').status_code, 200)
+
+    def test_cambiar_una_clase_cambia_el_etag(self):
+        etag = self._etag()
+        self.clase.titulo = 'Clase nueva'
+        self.clase.save()
+
+        self.assertNotEqual(self._etag(), etag)
+        self.assertEqual(self.cliente.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cambiar_un_precio_cambia_el_etag(self):
+        etag = self._etag()
+        self.addCleanup(precios.invalidar)
+        with self.captureOnCommitCallbacks(execute=True):
+            tarifa = PrecioClase.objects.get(duracion_minutos=50)
+            tarifa.precio += 1
+            tarifa.save()
+
+        self.assertNotEqual(self._etag(), etag)
+
+    def test_solo_el_username_del_profesor_invalida(self):
+        etag = self._etag()
+        self.profesor.last_login = timezone.now()
+        self.profesor.save(update_fields=['last_login'])
+        self.assertEqual(self.cliente.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.profesor.username = 'profe_nuevo'
+        self.profesor.save()
+        self.assertNotEqual(self._etag(), etag)
+
+
+class IndiceHuecosLibresTest(TestCase):
+    """El índice solo se lee de la caché que mantiene el worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profesor = CustomUser.objects.create_user(
+            username='profe', email='profe@test.com', password='x', role='teacher'
+        )
+        cls.alumno = CustomUser.objects.create_user(
+            username='alumno', email='alumno@test.com', password='x', role='student'
+        )
+        for dia in range(7):
+            HorarioRecurrente.objects.create(
+                profesor=cls.profesor, dia_semana=dia, hora_inicio=time(9), hora_fin=time(12)
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sin_entrada_se_omite_sin_calcular(self):
+        with self.assertLogs('clases.utils', 'WARNING'), self.assertNumQueries(0):
+            self.assertEqual(indice_huecos_libres([self.profesor], self.alumno), {})
+
+    def test_entrada_del_worker(self):
+        refrescar_huecos_libres([self.profesor])
+
+        with self.assertNumQueries(0):
+            indice = indice_huecos_libres([self.profesor], self.alumno)
+        self.assertTrue(indice[self.profesor.id])
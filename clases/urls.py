@@ -6,6 +6,7 @@ from . import views
 router = DefaultRouter()
 router.register(r'clases', views.ClaseViewSet)
 router.register(r'reservas', views.ReservaViewSet)
+router.register(r'bloqueos', views.BloqueoReservaViewSet)
 router.register(r'horarios-recurrentes', views.HorarioRecurrenteViewSet)
 router.register(r'dashboard', views.DashboardViewSet, basename='dashboard')
 router.register(r'buscar-profesores', views.BuscarProfesoresViewSet, basename='buscar-profesores')
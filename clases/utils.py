@@ -0,0 +1,385 @@
+# clases/utils.py
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+import heapq
+import logging
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Reserva, HorarioRecurrente, BloqueoReserva, ExcepcionHorario
+
+logger = logging.getLogger(__name__)
+
+def zona_horaria(nombre_zona):
+    """Devuelve la zona pytz indicada o UTC si no es válida"""
+    try:
+        return pytz.timezone(nombre_zona or 'UTC')
+    except pytz.UnknownTimeZoneError:
+        return pytz.UTC
+
+
+@lru_cache(maxsize=256)
+def periodos_dst(nombre_zona):
+    """
+    Precalcula los periodos de offset constante de una zona horaria.
+
+    Devuelve una tupla de (inicio_utc, fin_utc, offset) con datetimes naive en UTC,
+    ordenada y contigua, de forma que pasar de hora local a UTC dentro de un
+    periodo es una simple resta.
+    """
+    tz = zona_horaria(nombre_zona)
+    transiciones = getattr(tz, '_utc_transition_times', None)
+    info = getattr(tz, '_transition_info', None)
+
+    if not transiciones or not info:
+        # Zonas sin cambios de hora (UTC, offsets fijos)
+        offset = tz.utcoffset(datetime(2000, 1, 1)) or timedelta(0)
+        return ((datetime.min, datetime.max, offset),)
+
+    periodos = []
+    for i, inicio in enumerate(transiciones):
+        fin = transiciones[i + 1] if i + 1 < len(transiciones) else datetime.max
+        periodos.append((inicio, fin, info[i][0]))
+    return tuple(periodos)
+
+
+def expandir_horarios(horarios, nombre_zona, fecha_inicio, fecha_fin):
+    """
+    Expande plantillas HorarioRecurrente a intervalos concretos en UTC.
+
+    Las horas de la plantilla se interpretan en `nombre_zona` (la zona del profesor).
+    Recorre los días locales de [fecha_inicio, fecha_fin) y devuelve una lista
+    ordenada de tuplas (inicio_utc, fin_utc, horario). El periodo DST vigente se
+    avanza con un puntero, así que no hay consultas de zona por cada hueco.
+    """
+    por_dia = defaultdict(list)
+    for horario in horarios:
+        if horario.activo:
+            por_dia[horario.dia_semana].append(horario)
+    for lista in por_dia.values():
+        lista.sort(key=lambda h: h.hora_inicio)
+
+    if not por_dia or fecha_fin <= fecha_inicio:
+        return []
+
+    periodos = periodos_dst(nombre_zona)
+    inicios = [p[0] for p in periodos]
+    # Empezamos un día antes para cubrir cualquier offset posible
+    i = max(bisect_right(inicios, datetime.combine(fecha_inicio, time.min) - timedelta(days=1)) - 1, 0)
+
+    huecos = []
+    dia = fecha_inicio
+    while dia < fecha_fin:
+        for horario in por_dia.get(dia.weekday(), ()):
+            inicio_local = datetime.combine(dia, horario.hora_inicio)
+            fin_local = datetime.combine(dia, horario.hora_fin)
+
+            inicio_utc = inicio_local - periodos[i][2]
+            while inicio_utc >= periodos[i][1] and i + 1 < len(periodos):
+                i += 1
+                inicio_utc = inicio_local - periodos[i][2]
+
+            inicio_utc = inicio_utc.replace(tzinfo=pytz.UTC)
+            huecos.append((inicio_utc, inicio_utc + (fin_local - inicio_local), horario))
+        dia += timedelta(days=1)
+
+    return huecos
+
+
+def reservas_solapadas(queryset, inicio, fin):
+    """
+    Filtra las reservas activas de `queryset` que se solapan con [inicio, fin).
+
+    Es la consulta de intervalos común a las comprobaciones del profesor
+    (queryset por clase__profesor) y del alumno (queryset por alumno, servida
+    por el índice reserva_alumno_intervalo).
+    """
+    return queryset.filter(
+        estado__in=Reserva.ESTADOS_ACTIVOS,
+        inicio__lt=fin,
+        fin__gt=inicio
+    )
+
+
+def bloqueos_vigentes(queryset, inicio, fin):
+    """
+    Filtra los bloqueos de `queryset` aún no caducados que se solapan con [inicio, fin).
+
+    Los caducados no se barren con un cron: simplemente dejan de contar aquí y se
+    borran de forma perezosa al crear un bloqueo nuevo para el mismo profesor.
+    """
+    return queryset.filter(
+        expira_en__gt=timezone.now(),
+        inicio__lt=fin,
+        fin__gt=inicio
+    )
+
+
+def excepciones_solapadas(queryset, inicio, fin):
+    """Filtra las excepciones (tiempo bloqueado) de `queryset` que se solapan con [inicio, fin)"""
+    return queryset.filter(inicio__lt=fin, fin__gt=inicio)
+
+
+def quitar_excepciones(huecos, excepciones):
+    """
+    Descarta de `huecos` (ordenados, tuplas cuyo [0] y [1] son inicio y fin) los que pisan
+    alguna excepción. Ambas listas se recorren una sola vez.
+    """
+    bloqueados = _unir_intervalos(sorted(excepciones))
+    resultado = []
+    j = 0
+    for hueco in huecos:
+        while j < len(bloqueados) and bloqueados[j][1] <= hueco[0]:
+            j += 1
+        if j < len(bloqueados) and bloqueados[j][0] < hueco[1]:
+            continue
+        resultado.append(hueco)
+    return resultado
+
+
+def combinar_calendario(huecos, reservas):
+    """
+    Mezcla en una sola pasada los huecos expandidos y las reservas, ambos ordenados por inicio.
+
+    Devuelve tuplas ('libre', hueco) o ('reserva', reserva) en orden temporal. Un hueco
+    solo se emite como libre si ninguna de las reservas recibidas lo solapa.
+    """
+    eventos = heapq.merge(
+        (('libre', hueco[0], hueco) for hueco in huecos),
+        (('reserva', reserva.inicio, reserva) for reserva in reservas),
+        key=lambda evento: evento[1],
+    )
+
+    ocupado_hasta = None
+    pendiente = None  # hueco a la espera de saber si alguna reserva lo pisa
+    for tipo, inicio, elemento in eventos:
+        if pendiente is not None and inicio >= pendiente[1]:
+            yield ('libre', pendiente)
+            pendiente = None
+
+        if tipo == 'reserva':
+            pendiente = None
+            fin = elemento.fin or elemento.inicio
+            if ocupado_hasta is None or fin > ocupado_hasta:
+                ocupado_hasta = fin
+            yield ('reserva', elemento)
+        elif ocupado_hasta is None or inicio >= ocupado_hasta:
+            pendiente = elemento
+
+    if pendiente is not None:
+        yield ('libre', pendiente)
+
+
+def _unir_intervalos(intervalos):
+    """Une intervalos (inicio, fin) ordenados por inicio en una lista disjunta"""
+    unidos = []
+    for inicio, fin in intervalos:
+        if unidos and inicio <= unidos[-1][1]:
+            if fin > unidos[-1][1]:
+                unidos[-1][1] = fin
+        else:
+            unidos.append([inicio, fin])
+    return unidos
+
+
+def restar_intervalos(intervalos, ocupados):
+    """
+    Partes de `intervalos` (ordenados por inicio; tuplas cuyo [0] y [1] son inicio y fin)
+    que no pisa ninguno de `ocupados` (ordenados y disjuntos, como los de _unir_intervalos).
+    Ambas listas se recorren una sola vez.
+    """
+    libres = []
+    j = 0
+    for intervalo in intervalos:
+        inicio, fin = intervalo[0], intervalo[1]
+        while j < len(ocupados) and ocupados[j][1] <= inicio:
+            j += 1
+        k = j
+        while k < len(ocupados) and ocupados[k][0] < fin:
+            if ocupados[k][0] > inicio:
+                libres.append((inicio, ocupados[k][0]))
+            inicio = max(inicio, ocupados[k][1])
+            k += 1
+        if inicio < fin:
+            libres.append((inicio, fin))
+    return libres
+
+
+def intervalos_libres(profesor, desde, hasta, alumno=None, con_bloqueos=True):
+    """
+    Estructura de huecos libres de un profesor entre dos instantes UTC.
+
+    Devuelve una lista ordenada y disjunta de (inicio, fin): los horarios recurrentes
+    expandidos menos las reservas activas, los bloqueos vigentes (salvo los del propio
+    `alumno`, o ninguno con con_bloqueos=False) y las excepciones de horario. Cuesta
+    cuatro consultas para cualquier rango.
+    """
+    tz = zona_horaria(profesor.timezone)
+    huecos = expandir_horarios(
+        HorarioRecurrente.objects.filter(profesor=profesor, activo=True),
+        profesor.timezone,
+        desde.astimezone(tz).date() - timedelta(days=1),
+        hasta.astimezone(tz).date() + timedelta(days=2),
+    )
+    consultas = [
+        reservas_solapadas(Reserva.objects.filter(clase__profesor=profesor), desde, hasta)
+        .order_by('inicio')
+        .values_list('inicio', 'fin'),
+        excepciones_solapadas(ExcepcionHorario.objects.filter(profesor=profesor), desde, hasta)
+        .order_by('inicio')
+        .values_list('inicio', 'fin'),
+    ]
+    if con_bloqueos:
+        bloqueos = BloqueoReserva.objects.filter(profesor=profesor)
+        if alumno is not None:
+            bloqueos = bloqueos.exclude(alumno=alumno)
+        consultas.append(bloqueos_vigentes(bloqueos, desde, hasta).order_by('inicio').values_list('inicio', 'fin'))
+    ocupados = _unir_intervalos(heapq.merge(*consultas))
+
+    recortados = (
+        (max(inicio, desde), min(fin, hasta)) for inicio, fin, horario in huecos
+        if max(inicio, desde) < min(fin, hasta)
+    )
+    return restar_intervalos(recortados, ocupados)
+
+
+def clave_huecos_libres(profesor_id):
+    return f"huecos_libres:{profesor_id}"
+
+
+def invalidar_huecos_libres(profesor_id):
+    """Las señales la llaman solas; los cambios con operaciones en bloque deben llamarla a mano"""
+    cache.delete(clave_huecos_libres(profesor_id))
+
+
+def calcular_huecos_libres(profesor, ahora=None):
+    """
+    Entrada del índice de un profesor hasta HUECOS_INDICE_DIAS días vista: los intervalos
+    libres sin descontar bloqueos y, aparte, los bloqueos vigentes con su caducidad y su
+    alumno. Así un bloqueo deja de contar en cuanto caduca (sin esperar al TTL ni a una
+    señal) y el alumno que lo tiene sigue viendo su hueco.
+    """
+    ahora = ahora or timezone.now()
+    hasta = ahora + timedelta(days=settings.HUECOS_INDICE_DIAS)
+    return {
+        'libres': intervalos_libres(profesor, ahora, hasta, con_bloqueos=False),
+        'bloqueos': list(
+            bloqueos_vigentes(BloqueoReserva.objects.filter(profesor=profesor), ahora, hasta)
+            .order_by('inicio')
+            .values_list('inicio', 'fin', 'expira_en', 'alumno_id')
+        ),
+    }
+
+
+def refrescar_huecos_libres(profesores, solo_faltan=False):
+    """
+    Recalcula y guarda en caché la entrada de cada profesor (solo las que faltan, p. ej.
+    tras una invalidación, con solo_faltan). La usa el worker indexar_huecos_libres;
+    devuelve cuántas entradas ha escrito.
+    """
+    claves = {clave_huecos_libres(profesor.id): profesor for profesor in profesores}
+    if solo_faltan:
+        guardados = cache.get_many(list(claves))
+        claves = {clave: profesor for clave, profesor in claves.items() if clave not in guardados}
+    ahora = timezone.now()
+    for clave, profesor in claves.items():
+        cache.set(clave, calcular_huecos_libres(profesor, ahora), settings.HUECOS_INDICE_TTL)
+    return len(claves)
+
+
+def indice_huecos_libres(profesores, alumno=None):
+    """
+    Índice {profesor_id: [(inicio, fin), ...]} con los intervalos libres de cada profesor
+    desde ahora hasta HUECOS_INDICE_DIAS días vista, para `alumno`.
+
+    Las entradas las mantiene el worker indexar_huecos_libres en la caché compartida (una
+    sola lectura get_many para todos) y las señales las borran cuando cambian reservas,
+    horarios, excepciones o bloqueos. Aquí solo se descuentan los bloqueos aún vigentes
+    de otros alumnos. Los profesores sin entrada (el worker aún no la ha rehecho) se omiten
+    en vez de calcularse durante la petición: sin worker o sin caché compartida el índice
+    queda vacío y se avisa en el log.
+    """
+    claves = {clave_huecos_libres(profesor.id): profesor for profesor in profesores}
+    guardados = cache.get_many(list(claves))
+    alumno_id = getattr(alumno, 'id', alumno)
+
+    faltan = len(claves) - len(guardados)
+    if faltan:
+        logger.warning(
+            f"{faltan} de {len(claves)} profesores sin índice de huecos libres; "
+            "¿está en marcha indexar_huecos_libres con una caché compartida?"
+        )
+
+    indice = {}
+    ahora = timezone.now()
+    for clave, entrada in guardados.items():
+        profesor = claves[clave]
+        retenidos = [
+            (inicio, fin) for inicio, fin, expira_en, dueno in entrada['bloqueos']
+            if expira_en > ahora and dueno != alumno_id
+        ]
+        libres = entrada['libres']
+        indice[profesor.id] = restar_intervalos(libres, _unir_intervalos(retenidos)) if retenidos else libres
+    return indice
+
+
+def recortar_intervalos(libres, desde, hasta):
+    """Parte de `libres` (ordenados y disjuntos) dentro de [desde, hasta), localizada con bisect"""
+    i = bisect_right([fin for _, fin in libres], desde)
+    recortados = []
+    for inicio, fin in libres[i:]:
+        if inicio >= hasta:
+            break
+        recortados.append((max(inicio, desde), min(fin, hasta)))
+    return recortados
+
+
+def huecos_cercanos(libres, objetivo, duracion_minutos, k=5):
+    """
+    Los k inicios libres más cercanos a `objetivo` donde cabe una clase de la duración dada.
+
+    Dentro de cada intervalo libre las clases se colocan seguidas desde su inicio. Se
+    localiza `objetivo` con bisect y se avanza con dos cursores, uno hacia atrás y otro
+    hacia delante, tomando siempre el más cercano; solo se generan k candidatos.
+    """
+    duracion = timedelta(minutes=duracion_minutos)
+
+    def hacia_delante(i):
+        for inicio, fin in libres[i:]:
+            actual = inicio
+            if actual < objetivo:
+                pasos = -((inicio - objetivo) // duracion)  # redondeo hacia arriba
+                actual = inicio + pasos * duracion
+            while actual + duracion <= fin:
+                yield actual
+                actual += duracion
+
+    def hacia_atras(i):
+        for inicio, fin in reversed(libres[:i + 1]):
+            ultimo = inicio + ((fin - inicio) // duracion - 1) * duracion
+            while ultimo >= inicio:
+                if ultimo < objetivo:
+                    yield ultimo
+                ultimo -= duracion
+
+    i = bisect_left([inicio for inicio, fin in libres], objetivo)
+    delante = hacia_delante(max(i - 1, 0))
+    atras = hacia_atras(i - 1)
+    siguiente_delante = next(delante, None)
+    siguiente_atras = next(atras, None)
+
+    resultado = []
+    while len(resultado) < k and (siguiente_delante is not None or siguiente_atras is not None):
+        if siguiente_atras is None or (
+            siguiente_delante is not None and siguiente_delante - objetivo <= objetivo - siguiente_atras
+        ):
+            resultado.append(siguiente_delante)
+            siguiente_delante = next(delante, None)
+        else:
+            resultado.append(siguiente_atras)
+            siguiente_atras = next(atras, None)
+
+    return [(inicio, inicio + duracion) for inicio in resultado]
@@ -1,20 +1,76 @@
 # views.py - VERSION COMPLETA CORREGIDA (USANDO NOMBRES DEL MODELO)
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from .models import Clase, Reserva, HorarioRecurrente
-from .serializers import ClaseSerializer, ReservaSerializer, CrearReservaSerializer, HorarioRecurrenteSerializer, CrearHorarioRecurrenteSerializer
+from .models import (
+    Clase, Reserva, ReservaArchivada, HorarioRecurrente, BloqueoReserva, ResumenDiarioProfesor, ExcepcionHorario
+)
+from .serializers import (
+    ClaseSerializer, ReservaSerializer, CrearReservaSerializer, HorarioRecurrenteSerializer,
+    CrearHorarioRecurrenteSerializer, BloqueoReservaSerializer, CrearBloqueoReservaSerializer,
+    ReservaArchivadaSerializer, SemanaHorarioSerializer
+)
+from .utils import (
+    zona_horaria, expandir_horarios, combinar_calendario, reservas_solapadas,
+    bloqueos_vigentes, intervalos_libres, huecos_cercanos, excepciones_solapadas, quitar_excepciones,
+    indice_huecos_libres, recortar_intervalos, invalidar_huecos_libres
+)
+from .ics import ErrorICS, ImportadorICS
+from .mapa_demanda import calcular_mapa_demanda
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from decimal import Decimal
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime, date, timedelta
+from django_tests_backend.idempotencia import idempotente
+from pagos import precios
+from .signals import clave_historial_alumno, version_catalogo_clases
+import hashlib
+import heapq
+from itertools import chain
+import json
+import math
 import pytz
 
+# Ventana (en días) alrededor de la fecha pedida en la que se buscan huecos alternativos
+DIAS_BUSQUEDA_SUGERENCIAS = 14
+
+# Peso de cada factor en la puntuación de mejores_profesores (suman 1)
+PESO_RESERVAS_PREVIAS = 0.5
+PESO_CHAT = 0.3
+PESO_CERCANIA = 0.2
+
+
+def sugerir_huecos(profesor, objetivo, duracion, user_timezone, k=5, alumno=None):
+    """Los k huecos libres del profesor más cercanos a `objetivo`, listos para la respuesta"""
+    ahora = timezone.now()
+    margen = timedelta(days=DIAS_BUSQUEDA_SUGERENCIAS)
+    libres = intervalos_libres(profesor, max(ahora, objetivo - margen), max(ahora, objetivo) + margen, alumno)
+    user_tz = zona_horaria(user_timezone)
+    
+    return [
+        {
+            'inicio': inicio.astimezone(user_tz).isoformat(),
+            'fin': fin.astimezone(user_tz).isoformat(),
+            'inicio_utc': inicio.isoformat(),
+            'fin_utc': fin.isoformat(),
+        }
+        for inicio, fin in huecos_cercanos(libres, objetivo, duracion, k)
+    ]
+
 class ClaseViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Clase.objects.all()
     serializer_class = ClaseSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        queryset = Clase.objects.all()
+        queryset = Clase.objects.select_related('profesor')
         
         profesor_id = self.request.query_params.get('profesor_id')
         if profesor_id:
@@ -22,7 +78,58 @@ class ClaseViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
 
-class ReservaViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(request, lambda: super(ClaseViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(request, lambda: super(ClaseViewSet, self).retrieve(request, *args, **kwargs))
+
+    def _respuesta_cacheada(self, request, generar):
+        """
+        Sirve el catálogo desde caché con ETag y Cache-Control. La clave incluye la versión
+        del catálogo, que las señales de Clase incrementan, y la del catálogo de precios,
+        así que no hace falta borrar nada.
+        """
+        clave = f"catalogo_clases:{version_catalogo_clases()}:{precios.version()}:{request.get_full_path()}"
+        guardado = cache.get(clave)
+        if guardado is None:
+            respuesta = generar()
+            if respuesta.status_code != status.HTTP_200_OK:
+                return respuesta
+            contenido = json.dumps(respuesta.data, sort_keys=True, default=str)
+            guardado = {
+                'data': respuesta.data,
+                'etag': quote_etag(hashlib.md5(contenido.encode()).hexdigest()),
+            }
+            cache.set(clave, guardado, settings.CATALOGO_CLASES_CACHE_TTL)
+        
+        if guardado['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            respuesta = Response(guardado['data'])
+        respuesta['ETag'] = guardado['etag']
+        patch_cache_control(respuesta, public=True, max_age=settings.CATALOGO_CLASES_MAX_AGE)
+        return respuesta
+
+class SugerenciasConflictoMixin:
+    """create() que, si el hueco está ocupado, responde con los huecos libres más cercanos"""
+
+    def datos_creados(self, serializer):
+        return serializer.data
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            respuesta = {"error": str(serializer.errors)}
+            conflicto = getattr(serializer, 'conflicto', None)
+            if conflicto:
+                respuesta['sugerencias'] = sugerir_huecos(user_timezone=request.user.timezone, **conflicto)
+            return Response(respuesta, status=status.HTTP_400_BAD_REQUEST)
+        
+        self.perform_create(serializer)
+        return Response(self.datos_creados(serializer), status=status.HTTP_201_CREATED)
+
+class ReservaViewSet(SugerenciasConflictoMixin, viewsets.ModelViewSet):
     queryset = Reserva.objects.all()
     permission_classes = [permissions.IsAuthenticated]
 
@@ -46,9 +153,54 @@ class ReservaViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        
+        try:
+            desde = self._parse_fecha(request.query_params.get('desde'))
+            hasta = self._parse_fecha(request.query_params.get('hasta'))
+        except ValueError:
+            return Response(
+                {"error": "Formato de fecha inválido"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if desde:
+            queryset = queryset.filter(inicio__gte=desde)
+        if hasta:
+            queryset = queryset.filter(inicio__lt=hasta)
+        
         serializer = self.get_serializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        datos = serializer.data
+        
+        # El archivo solo se consulta si piden un rango que llega a reservas archivables
+        corte_archivo = timezone.now() - timedelta(days=settings.RESERVAS_ARCHIVO_DIAS)
+        if desde and desde < corte_archivo:
+            archivadas = self._archivadas().filter(inicio__gte=desde)
+            if hasta:
+                archivadas = archivadas.filter(inicio__lt=hasta)
+            datos = list(datos) + list(ReservaArchivadaSerializer(
+                archivadas.select_related('clase__profesor', 'alumno'), many=True, context={'request': request}
+            ).data)
+            datos.sort(key=lambda reserva: reserva['creada_en'], reverse=True)
+        
+        return Response(datos)
+
+    def _parse_fecha(self, valor):
+        if not valor:
+            return None
+        fecha = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+        if timezone.is_naive(fecha):
+            fecha = zona_horaria(self.request.user.timezone).localize(fecha)
+        return fecha
 
+    def _archivadas(self):
+        user = self.request.user
+        if user.role == 'student':
+            return ReservaArchivada.objects.filter(alumno=user)
+        elif user.role == 'teacher':
+            return ReservaArchivada.objects.filter(profesor=user)
+        return ReservaArchivada.objects.none()
+
+    @idempotente
     def create(self, request, *args, **kwargs):
         try:
             print(f"\n🔵 Nueva reserva desde cliente:")
@@ -149,19 +301,36 @@ class ReservaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        conflicto = Reserva.objects.filter(
-            clase=reserva.clase,
-            inicio=nueva_fecha_dt
+        nueva_fin_dt = nueva_fecha_dt + timedelta(minutes=reserva.clase.duracion_minutos)
+
+        conflicto = reservas_solapadas(
+            Reserva.objects.filter(clase__profesor=reserva.clase.profesor_id), nueva_fecha_dt, nueva_fin_dt
         ).exclude(id=reserva.id).exists()
 
         if conflicto:
             return Response(
-                {"error": "Ya existe una reserva en ese horario"},
+                {
+                    "error": "Ya existe una reserva en ese horario",
+                    "sugerencias": sugerir_huecos(
+                        reserva.clase.profesor, nueva_fecha_dt, reserva.clase.duracion_minutos,
+                        user.timezone, alumno=reserva.alumno
+                    ),
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        conflicto_alumno = reservas_solapadas(
+            Reserva.objects.filter(alumno=reserva.alumno_id), nueva_fecha_dt, nueva_fin_dt
+        ).exclude(id=reserva.id).exists()
+
+        if conflicto_alumno:
+            return Response(
+                {"error": "El alumno ya tiene otra clase reservada en ese horario"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         reserva.inicio = nueva_fecha_dt
-        reserva.fin = nueva_fecha_dt + timedelta(minutes=reserva.clase.duracion_minutos)
+        reserva.fin = nueva_fin_dt
         reserva.save()
 
         return Response({
@@ -209,6 +378,26 @@ class ReservaViewSet(viewsets.ModelViewSet):
             "reserva": ReservaSerializer(reserva, context={'request': request}).data
         })
 
+class BloqueoReservaViewSet(SugerenciasConflictoMixin, viewsets.ModelViewSet):
+    """Bloqueos temporales de huecos mientras el alumno completa la reserva"""
+    queryset = BloqueoReserva.objects.all()
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return CrearBloqueoReservaSerializer
+        return BloqueoReservaSerializer
+
+    def get_queryset(self):
+        return BloqueoReserva.objects.filter(
+            alumno=self.request.user,
+            expira_en__gt=timezone.now()
+        ).select_related('profesor')
+
+    def datos_creados(self, serializer):
+        return BloqueoReservaSerializer(serializer.instance).data
+
 class HorarioRecurrenteViewSet(viewsets.ModelViewSet):
     queryset = HorarioRecurrente.objects.all()
     permission_classes = [permissions.IsAuthenticated]
@@ -236,6 +425,105 @@ class HorarioRecurrenteViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(horarios, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['put'])
+    def semana(self, request):
+        """
+        Sustituye la plantilla semanal del profesor por la recibida. Solo se escriben las
+        diferencias: franjas nuevas con bulk_create, cambios de 'activo' con bulk_update y
+        las que sobran con un único delete, todo en la misma transacción.
+        """
+        if request.user.role != 'teacher':
+            return Response(
+                {"error": "Solo los profesores pueden configurar horarios recurrentes"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        datos = request.data
+        if isinstance(datos, list):
+            datos = {'horarios': datos}
+        serializer = SemanaHorarioSerializer(data=datos, context={'request': request})
+        if not serializer.is_valid():
+            return Response({"error": str(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        deseados = {
+            (franja['dia_semana'], franja['hora_inicio'], franja['hora_fin']): franja.get('activo', True)
+            for franja in serializer.validated_data['horarios']
+        }
+        
+        with transaction.atomic():
+            from users.models import CustomUser
+            # Dos PUT simultáneos del mismo profesor se aplican uno detrás de otro
+            CustomUser.objects.select_for_update().only('id').get(pk=request.user.pk)
+            
+            existentes = {
+                (horario.dia_semana, horario.hora_inicio, horario.hora_fin): horario
+                for horario in HorarioRecurrente.objects.filter(profesor=request.user)
+            }
+            
+            eliminar = [horario.id for clave, horario in existentes.items() if clave not in deseados]
+            actualizar = []
+            for clave, activo in deseados.items():
+                horario = existentes.get(clave)
+                if horario is not None and horario.activo != activo:
+                    horario.activo = activo
+                    actualizar.append(horario)
+            crear = [
+                HorarioRecurrente(
+                    profesor=request.user, dia_semana=dia, hora_inicio=hora_inicio,
+                    hora_fin=hora_fin, activo=activo
+                )
+                for (dia, hora_inicio, hora_fin), activo in deseados.items()
+                if (dia, hora_inicio, hora_fin) not in existentes
+            ]
+            
+            if eliminar:
+                HorarioRecurrente.objects.filter(id__in=eliminar).delete()
+            if actualizar:
+                HorarioRecurrente.objects.bulk_update(actualizar, ['activo'])
+            if crear:
+                HorarioRecurrente.objects.bulk_create(crear)
+        invalidar_huecos_libres(request.user.id)
+        
+        horarios = HorarioRecurrente.objects.filter(profesor=request.user).select_related('profesor')
+        return Response({
+            'creados': len(crear),
+            'actualizados': len(actualizar),
+            'eliminados': len(eliminar),
+            'horarios': HorarioRecurrenteSerializer(horarios, many=True).data,
+        })
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def importar_ics(self, request):
+        """
+        Importa un .ics subido en el campo 'archivo': las repeticiones semanales pasan a
+        franjas de horario y los eventos futuros a tiempo bloqueado. Se lee en streaming.
+        """
+        if request.user.role != 'teacher':
+            return Response(
+                {"error": "Solo los profesores pueden importar horarios"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            return Response(
+                {"error": "Se requiere un archivo .ics en el campo 'archivo'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        def progreso(resumen):
+            print(f"📅 Importación ICS de {request.user.username}: {resumen['eventos_leidos']} eventos leídos")
+        
+        # Iterar el UploadedFile devuelve líneas sin cargarlo entero (los grandes van a disco)
+        try:
+            resumen = ImportadorICS(request.user, progreso=progreso).importar(archivo)
+        except ErrorICS as e:
+            return Response(
+                {"error": f"Archivo .ics inválido: {e}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(resumen)
+
     @action(detail=False, methods=['get'])
     def disponibilidad_profesor(self, request):
         profesor_id = request.GET.get('profesor_id')
@@ -255,52 +543,46 @@ class HorarioRecurrenteViewSet(viewsets.ModelViewSet):
             )
         
         user_timezone = request.user.timezone or 'UTC'
+        user_tz = zona_horaria(user_timezone)
         
-        disponibilidad = []
-        fecha_inicio = date.today()
+        # La plantilla semanal está en la zona horaria del profesor
+        fecha_inicio = timezone.localdate(timezone=zona_horaria(profesor.timezone))
+        fecha_fin = fecha_inicio + timedelta(weeks=4)
         horarios_recurrentes = HorarioRecurrente.objects.filter(
             profesor=profesor, 
             activo=True
         )
+        huecos = expandir_horarios(horarios_recurrentes, profesor.timezone, fecha_inicio, fecha_fin)
         
-        for semana in range(4):
-            for horario in horarios_recurrentes:
-                fecha_semana = fecha_inicio + timedelta(weeks=semana)
-                horario_generado = horario.generar_horarios_semana(fecha_semana)
-                
-                if horario_generado:
-                    inicio_spain = timezone.make_aware(horario_generado['inicio'], timezone=pytz.timezone('Europe/Madrid'))
-                    fin_spain = timezone.make_aware(horario_generado['fin'], timezone=pytz.timezone('Europe/Madrid'))
-                    
-                    inicio_utc = inicio_spain.astimezone(pytz.UTC)
-                    fin_utc = fin_spain.astimezone(pytz.UTC)
-                    
-                    try:
-                        user_tz = pytz.timezone(user_timezone)
-                        inicio_display = inicio_utc.astimezone(user_tz).isoformat()
-                        fin_display = fin_utc.astimezone(user_tz).isoformat()
-                    except Exception as e:
-                        inicio_display = inicio_utc.isoformat()
-                        fin_display = fin_utc.isoformat()
-                    
-                    reserva_existente = Reserva.objects.filter(
-                        clase__profesor=profesor,
-                        inicio=inicio_utc,
-                        estado__in=['pendiente', 'aceptada']
-                    ).exists()
-                    
-                    if not reserva_existente:
-                        slot = {
-                            'inicio': inicio_display,
-                            'fin': fin_display,
-                            'inicio_utc': inicio_utc.isoformat(),
-                            'fin_utc': fin_utc.isoformat(),
-                            'profesor_nombre': profesor.username,
-                            'profesor_id': profesor.id,
-                            'es_recurrente': True,
-                            'timezone_visualizacion': user_timezone,
-                        }
-                        disponibilidad.append(slot)
+        if huecos:
+            # Fuera todo hueco que solape (no solo que empiece igual) con tiempo bloqueado por
+            # el profesor, reservas activas o retenciones vigentes de otros alumnos
+            desde, hasta = huecos[0][0], huecos[-1][1]
+            huecos = quitar_excepciones(huecos, chain(
+                excepciones_solapadas(
+                    ExcepcionHorario.objects.filter(profesor=profesor), desde, hasta
+                ).values_list('inicio', 'fin'),
+                reservas_solapadas(
+                    Reserva.objects.filter(clase__profesor=profesor), desde, hasta
+                ).values_list('inicio', 'fin'),
+                bloqueos_vigentes(
+                    BloqueoReserva.objects.filter(profesor=profesor).exclude(alumno=request.user), desde, hasta
+                ).values_list('inicio', 'fin'),
+            ))
+        
+        disponibilidad = []
+        for inicio_utc, fin_utc, horario in huecos:
+            disponibilidad.append({
+                'inicio': inicio_utc.astimezone(user_tz).isoformat(),
+                'fin': fin_utc.astimezone(user_tz).isoformat(),
+                'inicio_utc': inicio_utc.isoformat(),
+                'fin_utc': fin_utc.isoformat(),
+                'profesor_nombre': profesor.username,
+                'profesor_id': profesor.id,
+                'es_recurrente': True,
+                'timezone_visualizacion': user_timezone,
+                'timezone_profesor': profesor.timezone,
+            })
         
         return Response(disponibilidad)
 
@@ -312,56 +594,283 @@ class HorarioRecurrenteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        user_timezone = request.user.timezone or 'UTC'
+        user_tz = zona_horaria(user_timezone)
+        
         fecha_inicio = request.GET.get('fecha_inicio')
         if fecha_inicio:
             try:
                 fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
             except ValueError:
-                fecha_inicio = date.today()
+                fecha_inicio = timezone.localdate(timezone=user_tz)
         else:
-            fecha_inicio = date.today()
-        
-        user_timezone = request.user.timezone or 'UTC'
+            fecha_inicio = timezone.localdate(timezone=user_tz)
         
-        disponibilidad = []
         horarios_recurrentes = HorarioRecurrente.objects.filter(
             profesor=request.user, 
             activo=True
         )
+        huecos = expandir_horarios(
+            horarios_recurrentes, user_timezone, fecha_inicio, fecha_inicio + timedelta(weeks=4)
+        )
+        if huecos:
+            # Los huecos que un alumno tiene retenidos mientras paga no se ofrecen
+            huecos = quitar_excepciones(huecos, bloqueos_vigentes(
+                BloqueoReserva.objects.filter(profesor=request.user), huecos[0][0], huecos[-1][1]
+            ).values_list('inicio', 'fin'))
         
-        for semana in range(4):
-            for horario in horarios_recurrentes:
-                fecha_semana = fecha_inicio + timedelta(weeks=semana)
-                horario_generado = horario.generar_horarios_semana(fecha_semana)
-                
-                if horario_generado:
-                    inicio_spain = timezone.make_aware(horario_generado['inicio'], timezone=pytz.timezone('Europe/Madrid'))
-                    fin_spain = timezone.make_aware(horario_generado['fin'], timezone=pytz.timezone('Europe/Madrid'))
-                    
-                    inicio_utc = inicio_spain.astimezone(pytz.UTC)
-                    fin_utc = fin_spain.astimezone(pytz.UTC)
-                    
-                    try:
-                        user_tz = pytz.timezone(user_timezone)
-                        inicio_display = inicio_utc.astimezone(user_tz).isoformat()
-                        fin_display = fin_utc.astimezone(user_tz).isoformat()
-                    except Exception as e:
-                        inicio_display = inicio_utc.isoformat()
-                        fin_display = fin_utc.isoformat()
-                    
-                    slot = {
-                        'inicio': inicio_display,
-                        'fin': fin_display,
-                        'inicio_utc': inicio_utc.isoformat(),
-                        'fin_utc': fin_utc.isoformat(),
-                        'es_recurrente': True,
-                        'horario_recurrente_id': horario.id,
-                        'timezone_visualizacion': user_timezone,
-                    }
-                    disponibilidad.append(slot)
+        disponibilidad = []
+        for inicio_utc, fin_utc, horario in huecos:
+            disponibilidad.append({
+                'inicio': inicio_utc.astimezone(user_tz).isoformat(),
+                'fin': fin_utc.astimezone(user_tz).isoformat(),
+                'inicio_utc': inicio_utc.isoformat(),
+                'fin_utc': fin_utc.isoformat(),
+                'es_recurrente': True,
+                'horario_recurrente_id': horario.id,
+                'timezone_visualizacion': user_timezone,
+            })
         
         return Response(disponibilidad)
 
+    @action(detail=False, methods=['get'])
+    def huecos_cercanos(self, request):
+        """Los k huecos libres de un profesor más cercanos a una fecha"""
+        from users.models import CustomUser
+        
+        profesor_id = request.GET.get('profesor_id')
+        inicio = request.GET.get('inicio')
+        if not profesor_id or not inicio:
+            return Response(
+                {"error": "Se requieren profesor_id e inicio"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            profesor = CustomUser.objects.get(id=profesor_id, role='teacher')
+        except (CustomUser.DoesNotExist, ValueError):
+            return Response(
+                {"error": "Profesor no encontrado"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            objetivo = datetime.fromisoformat(inicio.replace('Z', '+00:00'))
+            if timezone.is_naive(objetivo):
+                objetivo = zona_horaria(request.user.timezone).localize(objetivo)
+            duracion = int(request.GET.get('duracion', 50))
+            k = min(max(int(request.GET.get('k', 5)), 1), 20)
+        except ValueError:
+            return Response(
+                {"error": "Parámetros inválidos"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if duracion not in [d for d, _ in Clase.DURACION_CHOICES]:
+            return Response(
+                {"error": "Duración debe ser 25, 50 u 80 minutos"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(sugerir_huecos(profesor, objetivo, duracion, request.user.timezone, k, request.user))
+
+    @action(detail=False, methods=['get'])
+    def mejores_profesores(self, request):
+        """
+        Los k profesores más adecuados para una clase de `duracion` que empiece entre
+        `desde` y `hasta`. Los candidatos salen del índice cacheado de huecos libres (sin
+        expandir horarios por petición) y se puntúan por reservas previas con el alumno,
+        mensajes intercambiados y cercanía del hueco a `objetivo` (por defecto, `desde`).
+        """
+        from users.models import CustomUser
+        from chatRoom.models import Message
+        
+        user_tz = zona_horaria(request.user.timezone)
+        
+        def instante(valor):
+            fecha = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+            return user_tz.localize(fecha) if timezone.is_naive(fecha) else fecha
+        
+        try:
+            desde = instante(request.GET['desde'])
+            hasta = instante(request.GET['hasta'])
+            objetivo = instante(request.GET['objetivo']) if request.GET.get('objetivo') else desde
+            duracion = int(request.GET.get('duracion', 50))
+            k = min(max(int(request.GET.get('k', 5)), 1), 20)
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Se requieren desde y hasta (ISO 8601); duracion y k deben ser números"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if duracion not in [d for d, _ in Clase.DURACION_CHOICES]:
+            return Response(
+                {"error": "Duración debe ser 25, 50 u 80 minutos"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        ahora = timezone.now()
+        desde = max(desde, ahora)
+        if hasta <= desde or hasta > ahora + timedelta(days=settings.HUECOS_INDICE_DIAS):
+            return Response(
+                {"error": f"La ventana debe estar en los próximos {settings.HUECOS_INDICE_DIAS} días"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Solo cuentan profesores con una clase de esa duración a la que apuntar la reserva
+        clases = {}
+        for clase_id, profesor_id in Clase.objects.filter(
+            duracion_minutos=duracion, profesor__role='teacher'
+        ).order_by('id').values_list('id', 'profesor'):
+            clases.setdefault(profesor_id, clase_id)
+        profesores = CustomUser.objects.filter(id__in=clases).exclude(id=request.user.id)
+        
+        candidatos = []
+        for profesor_id, libres in indice_huecos_libres(profesores, request.user).items():
+            # Un inicio es válido si es <= hasta, así que el intervalo útil llega a hasta + duración
+            dentro = recortar_intervalos(libres, desde, hasta + timedelta(minutes=duracion))
+            hueco = huecos_cercanos(dentro, objetivo, duracion, k=1)
+            if hueco:
+                candidatos.append((profesor_id, hueco[0]))
+        
+        if not candidatos:
+            return Response([])
+        
+        ids = [profesor_id for profesor_id, _ in candidatos]
+        reservas_previas = dict(
+            Reserva.objects.filter(alumno=request.user, clase__profesor__in=ids)
+            .exclude(estado='rechazada')
+            .values_list('clase__profesor').annotate(total=Count('id')).order_by()
+        )
+        for profesor_id, total in (
+            ReservaArchivada.objects.filter(alumno=request.user, profesor__in=ids)
+            .exclude(estado='rechazada')
+            .values_list('profesor').annotate(total=Count('id')).order_by()
+        ):
+            reservas_previas[profesor_id] = reservas_previas.get(profesor_id, 0) + total
+        mensajes = dict(
+            Message.objects.filter(room__student=request.user, room__teacher__in=ids)
+            .values_list('room__teacher').annotate(total=Count('id')).order_by()
+        )
+        
+        max_reservas = math.log1p(max(reservas_previas.values(), default=0)) or 1
+        max_mensajes = math.log1p(max(mensajes.values(), default=0)) or 1
+        margen = max(abs(hasta - objetivo), abs(objetivo - desde), timedelta(minutes=1))
+        
+        def puntuar(candidato):
+            profesor_id, (inicio, fin) = candidato
+            cercania = 1 - min(abs(inicio - objetivo) / margen, 1)
+            return (
+                PESO_RESERVAS_PREVIAS * math.log1p(reservas_previas.get(profesor_id, 0)) / max_reservas
+                + PESO_CHAT * math.log1p(mensajes.get(profesor_id, 0)) / max_mensajes
+                + PESO_CERCANIA * cercania
+            )
+        
+        mejores = heapq.nlargest(k, candidatos, key=puntuar)
+        nombres = dict(CustomUser.objects.filter(id__in=[p for p, _ in mejores]).values_list('id', 'username'))
+        
+        return Response([
+            {
+                'profesor_id': profesor_id,
+                'profesor': nombres.get(profesor_id),
+                'clase_id': clases[profesor_id],
+                'inicio': inicio.astimezone(user_tz).isoformat(),
+                'fin': fin.astimezone(user_tz).isoformat(),
+                'inicio_utc': inicio.isoformat(),
+                'fin_utc': fin.isoformat(),
+                'puntuacion': round(puntuar((profesor_id, (inicio, fin))), 4),
+                'reservas_previas': reservas_previas.get(profesor_id, 0),
+                'mensajes': mensajes.get(profesor_id, 0),
+            }
+            for profesor_id, (inicio, fin) in mejores
+        ])
+
+    @action(detail=False, methods=['get'])
+    def calendario(self, request):
+        """Huecos libres y clases reservadas del profesor en un único flujo ordenado"""
+        if request.user.role != 'teacher':
+            return Response(
+                {"error": "Solo los profesores pueden ver su calendario"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        user_timezone = request.user.timezone or 'UTC'
+        user_tz = zona_horaria(user_timezone)
+        hoy = timezone.localdate(timezone=user_tz)
+        
+        try:
+            fecha_inicio = request.GET.get('fecha_inicio')
+            fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date() if fecha_inicio else hoy.replace(day=1)
+            fecha_fin = request.GET.get('fecha_fin')
+            # fecha_fin es inclusiva; por defecto, hasta final de mes
+            if fecha_fin:
+                fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d').date() + timedelta(days=1)
+            else:
+                fecha_fin = (fecha_inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+        except ValueError:
+            return Response(
+                {"error": "Formato de fecha inválido, usa YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if fecha_fin <= fecha_inicio or (fecha_fin - fecha_inicio).days > 62:
+            return Response(
+                {"error": "El rango debe tener entre 1 y 62 días"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        huecos = expandir_horarios(
+            HorarioRecurrente.objects.filter(profesor=request.user, activo=True),
+            user_timezone, fecha_inicio, fecha_fin
+        )
+        
+        rango_inicio = user_tz.localize(datetime.combine(fecha_inicio, datetime.min.time()))
+        rango_fin = user_tz.localize(datetime.combine(fecha_fin, datetime.min.time()))
+        # Ni el tiempo bloqueado ni los huecos retenidos por alumnos aparecen como libres
+        huecos = quitar_excepciones(huecos, chain(
+            excepciones_solapadas(
+                ExcepcionHorario.objects.filter(profesor=request.user), rango_inicio, rango_fin
+            ).values_list('inicio', 'fin'),
+            bloqueos_vigentes(
+                BloqueoReserva.objects.filter(profesor=request.user), rango_inicio, rango_fin
+            ).values_list('inicio', 'fin'),
+        ))
+        reservas = Reserva.objects.filter(
+            clase__profesor=request.user,
+            inicio__gte=rango_inicio,
+            inicio__lt=rango_fin
+        ).exclude(estado='rechazada').select_related('clase__profesor', 'alumno').order_by('inicio')
+        
+        eventos = []
+        for tipo, elemento in combinar_calendario(huecos, reservas):
+            if tipo == 'libre':
+                inicio_utc, fin_utc, horario = elemento
+                eventos.append({
+                    'tipo': 'libre',
+                    'inicio': inicio_utc.astimezone(user_tz).isoformat(),
+                    'fin': fin_utc.astimezone(user_tz).isoformat(),
+                    'inicio_utc': inicio_utc.isoformat(),
+                    'fin_utc': fin_utc.isoformat(),
+                    'horario_recurrente_id': horario.id,
+                })
+            else:
+                datos = ReservaSerializer(elemento, context={'request': request}).data
+                eventos.append({
+                    'tipo': 'reserva',
+                    'inicio': datos['inicio'],
+                    'fin': datos['fin'],
+                    'inicio_utc': datos['inicio_utc'],
+                    'fin_utc': datos['fin_utc'],
+                    'reserva': datos,
+                })
+        
+        return Response({
+            'fecha_inicio': fecha_inicio.isoformat(),
+            'fecha_fin': (fecha_fin - timedelta(days=1)).isoformat(),
+            'timezone_visualizacion': user_timezone,
+            'eventos': eventos,
+        })
+
 class BuscarProfesoresViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -396,6 +905,183 @@ class DashboardViewSet(viewsets.ViewSet):
         context['request'] = self.request
         return context
 
+    def _archivadas_por_estado(self, queryset):
+        return dict(queryset.values_list('estado').annotate(total=Count('id')).order_by())
+
+    def _calcular_historial(self, user):
+        """
+        Clases completadas del alumno agrupadas por mes (en su zona horaria), profesor y
+        duración: un único GROUP BY sobre Reserva y otro sobre el archivo
+        """
+        user_tz = zona_horaria(user.timezone)
+        series = []
+        for queryset, profesor in (
+            (Reserva.objects.filter(alumno=user), 'clase__profesor'),
+            (ReservaArchivada.objects.filter(alumno=user), 'profesor'),
+        ):
+            filas = (
+                queryset
+                .filter(estado__in=['completada', 'validada'])
+                .annotate(mes=TruncMonth('inicio', tzinfo=user_tz))
+                .values('mes', profesor, f'{profesor}__username', 'clase__duracion_minutos')
+                .annotate(clases=Count('id'), minutos=Sum('clase__duracion_minutos'))
+                .order_by()
+            )
+            series += [
+                {
+                    'mes': fila['mes'].strftime('%Y-%m'),
+                    'profesor_id': fila[profesor],
+                    'profesor': fila[f'{profesor}__username'],
+                    'duracion_minutos': fila['clase__duracion_minutos'],
+                    'clases': fila['clases'],
+                    'minutos': fila['minutos'],
+                }
+                for fila in filas
+            ]
+        
+        por_mes, por_profesor, por_duracion = {}, {}, {}
+        for fila in series:
+            for totales, clave, extra in (
+                (por_mes, fila['mes'], {'mes': fila['mes']}),
+                (por_profesor, fila['profesor_id'], {'profesor_id': fila['profesor_id'], 'profesor': fila['profesor']}),
+                (por_duracion, fila['duracion_minutos'], {'duracion_minutos': fila['duracion_minutos']}),
+            ):
+                total = totales.setdefault(clave, {**extra, 'clases': 0, 'minutos': 0})
+                total['clases'] += fila['clases']
+                total['minutos'] += fila['minutos']
+        
+        return {
+            'user_timezone': user.timezone,
+            'total_clases': sum(fila['clases'] for fila in series),
+            'total_horas': round(sum(fila['minutos'] for fila in series) / 60, 2),
+            'por_mes': sorted(por_mes.values(), key=lambda fila: fila['mes']),
+            'por_profesor': sorted(por_profesor.values(), key=lambda fila: -fila['minutos']),
+            'por_duracion': sorted(por_duracion.values(), key=lambda fila: fila['duracion_minutos']),
+            'series': sorted(series, key=lambda fila: (fila['mes'], fila['profesor_id'], fila['duracion_minutos'])),
+        }
+
+    @action(detail=False, methods=['get'])
+    def historial(self, request):
+        """Horas de clase del alumno por mes, profesor y duración"""
+        user = request.user
+        if user.role != 'student':
+            return Response(
+                {"error": "Solo los alumnos tienen historial de aprendizaje"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        clave = clave_historial_alumno(user.id)
+        historial = cache.get(clave)
+        # El mes depende de la zona horaria, así que un cambio de país también recalcula
+        if historial is None or historial['user_timezone'] != user.timezone:
+            historial = self._calcular_historial(user)
+            cache.set(clave, historial, settings.HISTORIAL_CACHE_TTL)
+        
+        return Response(historial)
+
+    @action(detail=False, methods=['get'])
+    def ingresos(self, request):
+        """
+        Informe del profesor: minutos impartidos, ocupación (reservado / disponible) e ingresos
+        por día, semana o mes. Solo lee ResumenDiarioProfesor, que mantiene resumir_profesores.
+        """
+        user = request.user
+        if user.role != 'teacher':
+            return Response(
+                {"error": "Solo los profesores pueden ver este informe"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        agrupacion = request.query_params.get('agrupacion', 'mes')
+        if agrupacion not in ('dia', 'semana', 'mes'):
+            return Response(
+                {"error": "agrupacion debe ser dia, semana o mes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        hoy = timezone.now().astimezone(zona_horaria(user.timezone)).date()
+        try:
+            hasta = date.fromisoformat(request.query_params.get('hasta', hoy.isoformat()))
+            desde = date.fromisoformat(request.query_params.get('desde', (hasta - timedelta(days=30)).isoformat()))
+        except ValueError:
+            return Response(
+                {"error": "Formato de fecha inválido. Use YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if desde > hasta:
+            return Response(
+                {"error": "desde no puede ser posterior a hasta"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        resumenes = ResumenDiarioProfesor.objects.filter(
+            profesor=user, fecha__gte=desde, fecha__lte=hasta
+        ).values_list(
+            'fecha', 'minutos_disponibles', 'minutos_reservados',
+            'minutos_impartidos', 'clases_impartidas', 'ingresos'
+        ).order_by('fecha')
+        
+        def periodo_de(fecha):
+            if agrupacion == 'dia':
+                return fecha.isoformat()
+            if agrupacion == 'semana':
+                return (fecha - timedelta(days=fecha.weekday())).isoformat()
+            return fecha.strftime('%Y-%m')
+        
+        campos = ['minutos_disponibles', 'minutos_reservados', 'minutos_impartidos', 'clases_impartidas', 'ingresos']
+        periodos = {}
+        totales = dict.fromkeys(campos, 0)
+        actualizado_hasta = None
+        for fila in resumenes:
+            fecha, valores = fila[0], dict(zip(campos, fila[1:]))
+            periodo = periodos.setdefault(periodo_de(fecha), {'periodo': periodo_de(fecha), **dict.fromkeys(campos, 0)})
+            for campo, valor in valores.items():
+                periodo[campo] += valor
+                totales[campo] += valor
+            actualizado_hasta = fecha
+        
+        def con_ocupacion(datos):
+            disponibles = datos['minutos_disponibles']
+            datos['ocupacion'] = round(datos['minutos_reservados'] / disponibles, 3) if disponibles else None
+            datos['ingresos'] = str(Decimal(datos['ingresos']).quantize(Decimal('0.01')))
+            return datos
+        
+        return Response({
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'agrupacion': agrupacion,
+            # Último día resumido: los posteriores aún no aparecen en el informe
+            'actualizado_hasta': actualizado_hasta.isoformat() if actualizado_hasta else None,
+            'user_timezone': user.timezone,
+            'totales': con_ocupacion(totales),
+            'periodos': [con_ocupacion(periodo) for periodo in periodos.values()],
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def mapa_demanda(self, request):
+        """Demanda de alumnos frente a oferta de profesores por día, hora y duración (solo staff)"""
+        nombre_zona = request.query_params.get('tz', 'UTC')
+        if zona_horaria(nombre_zona).zone != nombre_zona:
+            return Response(
+                {"error": "Zona horaria desconocida"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            semanas = min(max(int(request.query_params.get('semanas', 12)), 1), 104)
+        except ValueError:
+            return Response(
+                {"error": "semanas debe ser un número"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Se recalcula como mucho una vez al día por combinación de parámetros
+        clave = f"mapa_demanda:{timezone.now().date().isoformat()}:{nombre_zona}:{semanas}"
+        mapa = cache.get(clave)
+        if mapa is None:
+            mapa = calcular_mapa_demanda(nombre_zona, semanas)
+            cache.set(clave, mapa, 24 * 60 * 60)
+        return Response(mapa)
+
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
         user = request.user
@@ -416,6 +1102,11 @@ class DashboardViewSet(viewsets.ViewSet):
                 estado__in=['completada', 'validada']
             ).count()
             
+            # Las reservas archivadas siguen contando en los totales
+            archivadas = self._archivadas_por_estado(ReservaArchivada.objects.filter(profesor=user))
+            total_reservas += sum(archivadas.values())
+            reservas_completadas += archivadas.get('completada', 0) + archivadas.get('validada', 0)
+            
             return Response({
                 'total_clases': total_clases,
                 'total_reservas': total_reservas,
@@ -436,6 +1127,10 @@ class DashboardViewSet(viewsets.ViewSet):
                 estado__in=['completada', 'validada']
             ).count()
             
+            archivadas = self._archivadas_por_estado(ReservaArchivada.objects.filter(alumno=user))
+            total_reservas += sum(archivadas.values())
+            reservas_completadas += archivadas.get('completada', 0) + archivadas.get('validada', 0)
+            
             return Response({
                 'total_reservas': total_reservas,
                 'reservas_activas': reservas_activas,
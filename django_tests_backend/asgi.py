@@ -3,6 +3,11 @@ ASGI config for django_tests_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+El canal en tiempo real propio (/api/chat/stream/ y /api/chat/sync/) solo funciona
+servido por ASGI; runserver usa WSGI y esas rutas responden 503. En desarrollo:
+
+    uvicorn django_tests_backend.asgi:application --reload
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,97 @@
+# django_tests_backend/idempotencia.py
+import hashlib
+import json
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CABECERA = 'Idempotency-Key'
+LONGITUD_MAXIMA_CLAVE = 255
+# Cuánto puede tardar como mucho la primera petición antes de que un reintento la repita
+TTL_EN_CURSO = 60
+
+
+def _huella(request):
+    """Huella estable de método, ruta y datos de la petición (los archivos cuentan por nombre y tamaño)"""
+    datos = request.data
+    if hasattr(datos, 'lists'):
+        contenido = sorted((clave, [str(v) for v in valores]) for clave, valores in datos.lists())
+    else:
+        contenido = datos
+    archivos = sorted((nombre, f.name, f.size) for nombre, f in request.FILES.items())
+    crudo = json.dumps([request.method, request.path, contenido, archivos], sort_keys=True, default=str)
+    return hashlib.sha256(crudo.encode()).hexdigest()
+
+
+def idempotente(vista):
+    """
+    Decorador para métodos POST de vistas DRF que acepta la cabecera Idempotency-Key.
+
+    La primera petición con una clave se ejecuta normalmente y su respuesta (si no es un
+    error 5xx) se guarda junto a la huella de la petición durante IDEMPOTENCIA_TTL segundos
+    en la caché 'idempotencia', que tiene tamaño acotado. Los reintentos con la misma
+    clave reciben la respuesta guardada sin volver a tocar la base de datos. Con varios
+    workers esa caché debe ser compartida (ver CACHES en settings).
+    """
+    @wraps(vista)
+    def envoltorio(self, request, *args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if not clave:
+            return vista(self, request, *args, **kwargs)
+
+        if len(clave) > LONGITUD_MAXIMA_CLAVE:
+            return Response(
+                {"error": f"{CABECERA} no puede superar {LONGITUD_MAXIMA_CLAVE} caracteres"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache = caches['idempotencia']
+        cache_key = 'idem:' + hashlib.sha256(
+            f"{request.user.pk}:{vista.__qualname__}:{clave}".encode()
+        ).hexdigest()
+        huella = _huella(request)
+
+        if not cache.add(cache_key, {'huella': huella, 'en_curso': True}, TTL_EN_CURSO):
+            guardado = cache.get(cache_key)
+            if guardado is not None:
+                if guardado['huella'] != huella:
+                    return Response(
+                        {"error": f"{CABECERA} ya usada con una petición distinta"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if guardado.get('en_curso'):
+                    return Response(
+                        {"error": "La petición original aún se está procesando"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                logger.info(f"Respuesta idempotente reutilizada para {vista.__qualname__}")
+                respuesta = Response(guardado['data'], status=guardado['status'])
+                respuesta['Idempotent-Replayed'] = 'true'
+                return respuesta
+            # La entrada caducó entre add() y get(): se ejecuta como nueva
+            cache.set(cache_key, {'huella': huella, 'en_curso': True}, TTL_EN_CURSO)
+
+        try:
+            respuesta = vista(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        if respuesta.status_code >= 500 or not hasattr(respuesta, 'data'):
+            # Los errores del servidor se pueden reintentar
+            cache.delete(cache_key)
+        else:
+            cache.set(
+                cache_key,
+                {'huella': huella, 'status': respuesta.status_code, 'data': respuesta.data},
+                settings.IDEMPOTENCIA_TTL
+            )
+        return respuesta
+
+    return envoltorio
@@ -82,8 +82,19 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'user-agent',
     'x-csrftoken',
+    'upload-offset',
+    'x-chunk-sha256',
     'x-requested-with',
     'ngrok-skip-browser-warning',
+    'idempotency-key',
+]
+
+# Cabeceras de respuesta que el frontend necesita leer (paginación por cursor y subidas por trozos del chat)
+CORS_EXPOSE_HEADERS = [
+    'x-has-more',
+    'x-next-before',
+    'x-next-after',
+    'upload-offset',
 ]
 
 CORS_ALLOW_METHODS = [
@@ -185,12 +196,99 @@ STATICFILES_DIRS = [
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caché
+IDEMPOTENCIA_TTL = int(os.getenv('IDEMPOTENCIA_TTL', 24 * 60 * 60))
+IDEMPOTENCIA_CACHE_BACKEND = os.getenv(
+    'IDEMPOTENCIA_CACHE_BACKEND', os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+)
+
+# La caché por defecto guarda las versiones del catálogo y el índice de huecos libres, que
+# las señales invalidan. LocMem es propia de cada proceso: con varios workers (gunicorn,
+# uvicorn) hay que usar una compartida, p. ej.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379/1
+# o DatabaseCache (CACHE_LOCATION=nombre_tabla, tras manage.py createcachetable); si no,
+# cada worker invalida solo su copia y los demás sirven datos viejos hasta su TTL.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    # Respuestas guardadas por Idempotency-Key (caducan tras IDEMPOTENCIA_TTL). También tiene que
+    # ser compartida: un reintento que cae en otro worker, o llega tras un reinicio, solo se
+    # reconoce si ve la misma caché. Por defecto usa el mismo backend y ubicación que 'default'
+    'idempotencia': {
+        'BACKEND': IDEMPOTENCIA_CACHE_BACKEND,
+        'LOCATION': os.getenv('IDEMPOTENCIA_CACHE_LOCATION', os.getenv('CACHE_LOCATION', 'idempotencia')),
+        'KEY_PREFIX': 'idempotencia',
+        'TIMEOUT': IDEMPOTENCIA_TTL,
+        # Tamaño acotado en los backends que lo admiten (Redis o Memcached expulsan por su cuenta)
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('IDEMPOTENCIA_MAX_ENTRADAS', 10000)),
+        } if IDEMPOTENCIA_CACHE_BACKEND.rsplit('.', 1)[-1] in ('LocMemCache', 'DatabaseCache', 'FileBasedCache') else {},
+    },
+}
+
+# Segundos que se guarda el historial de aprendizaje de cada alumno (se invalida al cambiar sus reservas)
+HISTORIAL_CACHE_TTL = int(os.getenv('HISTORIAL_CACHE_TTL', 60 * 60))
+
+# Catálogo público de clases: vida en caché del servidor y max-age para navegadores/proxies.
+# Con LocMem es también lo máximo que otro worker puede servir un catálogo ya cambiado
+CATALOGO_CLASES_CACHE_TTL = int(os.getenv('CATALOGO_CLASES_CACHE_TTL', 5 * 60))
+CATALOGO_CLASES_MAX_AGE = int(os.getenv('CATALOGO_CLASES_MAX_AGE', 60))
+
+# Cada cuántos segundos comprueba cada proceso si ha cambiado la versión del catálogo de precios
+PRECIOS_COMPROBACION_SEGUNDOS = int(os.getenv('PRECIOS_COMPROBACION_SEGUNDOS', 30))
+
+# Índice cacheado de huecos libres por profesor (búsqueda del mejor profesor): días vista y vida en caché.
+# Lo mantiene el worker indexar_huecos_libres, que cada HUECOS_INDICE_ESPERA segundos rehace las
+# entradas invalidadas y cada HUECOS_INDICE_TTL / 2 todas (necesita la caché compartida). La búsqueda
+# no calcula entradas que falten: sin el worker no devuelve profesores
+HUECOS_INDICE_DIAS = int(os.getenv('HUECOS_INDICE_DIAS', 14))
+HUECOS_INDICE_TTL = int(os.getenv('HUECOS_INDICE_TTL', 5 * 60))
+HUECOS_INDICE_ESPERA = int(os.getenv('HUECOS_INDICE_ESPERA', 5))
+
+# Minutos que un alumno retiene un hueco mientras completa la reserva
+RESERVA_BLOQUEO_MINUTOS = int(os.getenv('RESERVA_BLOQUEO_MINUTOS', 10))
+
+# Archivo de reservas: antigüedad (días) a partir de la cual se mueven y tamaño de cada lote
+RESERVAS_ARCHIVO_DIAS = int(os.getenv('RESERVAS_ARCHIVO_DIAS', 180))
+RESERVAS_ARCHIVO_LOTE = int(os.getenv('RESERVAS_ARCHIVO_LOTE', 500))
+
 # PUSHER
 PUSHER_APP_ID = os.getenv('PUSHER_APP_ID', '2076756')
 PUSHER_KEY = os.getenv('PUSHER_KEY', 'c0fc8ce24c06ebef7a64')
 PUSHER_SECRET = os.getenv('PUSHER_SECRET', 'c7bbfe6fa96d53fbe153')
 PUSHER_CLUSTER = os.getenv('PUSHER_CLUSTER', 'eu')
 
+# Outbox de eventos en tiempo real: eventos por pasada del worker, reintentos antes de
+# darlos por fallidos, espera (segundos) cuando no hay nada que enviar y días que se conservan
+TIEMPO_REAL_LOTE = int(os.getenv('TIEMPO_REAL_LOTE', 100))
+TIEMPO_REAL_MAX_INTENTOS = int(os.getenv('TIEMPO_REAL_MAX_INTENTOS', 8))
+TIEMPO_REAL_ESPERA = float(os.getenv('TIEMPO_REAL_ESPERA', 1))
+TIEMPO_REAL_RETENCION_DIAS = int(os.getenv('TIEMPO_REAL_RETENCION_DIAS', 7))
+# Segundos que un worker se reserva los eventos que está entregando; si muere, otro los recoge después
+TIEMPO_REAL_RESERVA = int(os.getenv('TIEMPO_REAL_RESERVA', 60))
+
+# Destino de los eventos: Pusher o, con chatRoom.realtime.BackendLocal, solo el canal SSE propio
+TIEMPO_REAL_BACKEND = os.getenv('TIEMPO_REAL_BACKEND', 'chatRoom.realtime.BackendPusher')
+# Canal SSE servido por ASGI (/api/chat/stream/): origen compartido de los eventos entre
+# procesos, segundos entre lecturas y segundos entre comentarios keep-alive
+TIEMPO_REAL_BROKER = os.getenv('TIEMPO_REAL_BROKER', 'chatRoom.difusion.BrokerOutbox')
+TIEMPO_REAL_SONDEO = float(os.getenv('TIEMPO_REAL_SONDEO', 0.5))
+TIEMPO_REAL_KEEPALIVE = int(os.getenv('TIEMPO_REAL_KEEPALIVE', 15))
+# Vida (segundos) del token firmado de /api/chat/stream/token/ con el que se abre el canal SSE
+CHAT_STREAM_TOKEN_TTL = int(os.getenv('CHAT_STREAM_TOKEN_TTL', 5 * 60))
+
+# Segundos que espera por defecto /api/chat/sync/ si no hay cambios
+CHAT_SYNC_TIMEOUT = int(os.getenv('CHAT_SYNC_TIMEOUT', 25))
+
+# Subidas por trozos de adjuntos del chat: carpeta de ensamblado, tamaño máximo de cada
+# trozo y del archivo (bytes) y horas tras las que se borra una subida abandonada
+CHAT_SUBIDAS_DIR = os.getenv('CHAT_SUBIDAS_DIR', os.path.join(BASE_DIR, 'chat_subidas'))
+CHAT_SUBIDAS_MAX_TROZO = int(os.getenv('CHAT_SUBIDAS_MAX_TROZO', 8 * 1024 * 1024))
+CHAT_SUBIDAS_MAX_ARCHIVO = int(os.getenv('CHAT_SUBIDAS_MAX_ARCHIVO', 500 * 1024 * 1024))
+CHAT_SUBIDAS_CADUCIDAD_HORAS = int(os.getenv('CHAT_SUBIDAS_CADUCIDAD_HORAS', 24))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
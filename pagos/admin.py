@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CarritoCompra, ItemCarrito, OrdenCompra
+from .models import CarritoCompra, ItemCarrito, OrdenCompra, PrecioClase
 
 @admin.register(CarritoCompra)
 class CarritoCompraAdmin(admin.ModelAdmin):
@@ -91,4 +91,10 @@ class OrdenCompraAdmin(admin.ModelAdmin):
             if orden.estado != 'cancelada':
                 orden.marcar_como_cancelada()
         self.message_user(request, f"{queryset.count()} órdenes marcadas como canceladas.")
-    marcar_como_cancelada.short_description = "Marcar como cancelada"
\ No newline at end of file
+    marcar_como_cancelada.short_description = "Marcar como cancelada"
+
+
+@admin.register(PrecioClase)
+class PrecioClaseAdmin(admin.ModelAdmin):
+    list_display = ['duracion_minutos', 'precio', 'stripe_price_id', 'actualizado_en']
+    readonly_fields = ['actualizado_en']
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:58
+
+from django.db import migrations, models
+
+# Precios y IDs de Stripe que estaban escritos en el código
+PRECIOS_INICIALES = [
+    (25, '6.00', 'price_1SZZFH2ev9LdxX5bMQ7BDq3G'),
+    (50, '12.00', 'price_1SZZGn2ev9LdxX5bVuWOacH0'),
+    (80, '16.00', 'price_1SZZIb2ev9LdxX5bShWQN2JD'),
+]
+
+
+def crear_catalogo(apps, schema_editor):
+    CatalogoPrecios = apps.get_model('pagos', 'CatalogoPrecios')
+    PrecioClase = apps.get_model('pagos', 'PrecioClase')
+    for duracion, precio, stripe_price_id in PRECIOS_INICIALES:
+        PrecioClase.objects.get_or_create(
+            duracion_minutos=duracion,
+            defaults={'precio': precio, 'stripe_price_id': stripe_price_id}
+        )
+    CatalogoPrecios.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0003_alter_carritocompra_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogoPrecios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Catálogo de Precios',
+                'verbose_name_plural': 'Catálogo de Precios',
+            },
+        ),
+        migrations.CreateModel(
+            name='PrecioClase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('duracion_minutos', models.IntegerField(choices=[(25, '25 minutos'), (50, '50 minutos'), (80, '80 minutos')], unique=True)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('stripe_price_id', models.CharField(blank=True, max_length=100)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Precio de Clase',
+                'verbose_name_plural': 'Precios de Clase',
+                'ordering': ['duracion_minutos'],
+            },
+        ),
+        migrations.RunPython(crear_catalogo, migrations.RunPython.noop),
+    ]
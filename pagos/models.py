@@ -1,9 +1,61 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.db.models import F
 from django.utils import timezone
 
 
+class CatalogoPrecios(models.Model):
+    """Fila única con la versión del catálogo de precios; cambia cada vez que se edita un precio"""
+    version = models.PositiveIntegerField(default=1)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Catálogo de Precios"
+        verbose_name_plural = "Catálogo de Precios"
+
+    def __str__(self):
+        return f"Catálogo de precios v{self.version}"
+
+    @classmethod
+    def incrementar_version(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, actualizado_en=timezone.now()):
+            cls.objects.get_or_create(pk=1)
+        # Este proceso ve el cambio al instante; el resto, en su próxima comprobación de versión
+        from .precios import invalidar
+        transaction.on_commit(invalidar)
+
+
+class PrecioClase(models.Model):
+    DURACION_CHOICES = [
+        (25, '25 minutos'),
+        (50, '50 minutos'),
+        (80, '80 minutos'),
+    ]
+
+    duracion_minutos = models.IntegerField(choices=DURACION_CHOICES, unique=True)
+    precio = models.DecimalField(max_digits=8, decimal_places=2)
+    stripe_price_id = models.CharField(max_length=100, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['duracion_minutos']
+        verbose_name = "Precio de Clase"
+        verbose_name_plural = "Precios de Clase"
+
+    def __str__(self):
+        return f"{self.get_duracion_minutos_display()}: {self.precio}€"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        CatalogoPrecios.incrementar_version()
+
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        CatalogoPrecios.incrementar_version()
+        return resultado
+
+
 class CarritoCompra(models.Model):
     usuario = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -36,12 +88,6 @@ class ItemCarrito(models.Model):
         (80, '80 minutos'),
     ]
 
-    PRECIOS = {
-        25: 6,
-        50: 12,
-        80: 16,
-    }
-
     carrito = models.ForeignKey(
         CarritoCompra,
         on_delete=models.CASCADE,
@@ -63,7 +109,8 @@ class ItemCarrito(models.Model):
 
     @property
     def precio_unitario(self):
-        return self.PRECIOS.get(self.duracion_minutos, 0)
+        from .precios import precio
+        return precio(self.duracion_minutos)
 
     @property
     def subtotal(self):
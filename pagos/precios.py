@@ -0,0 +1,69 @@
+# pagos/precios.py
+"""
+Catálogo de precios en memoria.
+
+Los precios viven en PrecioClase y se cargan una vez por proceso en un mapa inmutable.
+Cada PRECIOS_COMPROBACION_SEGUNDOS se consulta la versión de CatalogoPrecios (una fila)
+y, solo si ha cambiado, se recarga el catálogo entero. El resto de consultas de precio
+o de ID de Stripe son accesos a diccionario.
+"""
+import time
+from decimal import Decimal
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .models import CatalogoPrecios, PrecioClase
+
+_catalogo = None
+
+
+def _cargar(version):
+    filas = list(PrecioClase.objects.values_list('duracion_minutos', 'precio', 'stripe_price_id'))
+    return {
+        'version': version,
+        'precios': MappingProxyType({duracion: precio for duracion, precio, _ in filas}),
+        'stripe': MappingProxyType({duracion: stripe_id for duracion, _, stripe_id in filas if stripe_id}),
+        'comprobado_en': time.monotonic(),
+    }
+
+
+def catalogo():
+    """Catálogo vigente; solo toca la base de datos cuando toca comprobar la versión"""
+    global _catalogo
+    actual = _catalogo
+    if actual is not None and time.monotonic() - actual['comprobado_en'] < settings.PRECIOS_COMPROBACION_SEGUNDOS:
+        return actual
+
+    version = CatalogoPrecios.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+    if actual is not None and actual['version'] == version:
+        actual = {**actual, 'comprobado_en': time.monotonic()}
+    else:
+        actual = _cargar(version)
+    # Reemplazar la referencia es atómico: los hilos que ya leyeron el anterior siguen con él
+    _catalogo = actual
+    return actual
+
+
+def invalidar():
+    """Fuerza la comprobación de versión en la siguiente consulta"""
+    global _catalogo
+    _catalogo = None
+
+
+def version():
+    return catalogo()['version']
+
+
+def precios():
+    """Mapa inmutable duración -> precio"""
+    return catalogo()['precios']
+
+
+def precio(duracion_minutos):
+    return catalogo()['precios'].get(duracion_minutos, Decimal('0'))
+
+
+def stripe_price_ids():
+    """Mapa inmutable duración -> ID de precio de Stripe"""
+    return catalogo()['stripe']
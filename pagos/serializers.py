@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import CarritoCompra, ItemCarrito, OrdenCompra
+from .precios import precio
 
 
 class ItemCarritoSerializer(serializers.ModelSerializer):
@@ -102,10 +103,12 @@ class OrdenCompraSerializer(serializers.ModelSerializer):
     def get_items_detalle(self, obj):
         """Procesar los items para mostrar información más detallada"""
         items_detalle = []
-        precios = {25: 6, 50: 12, 80: 16}
         
         for item in obj.items:
-            precio_unitario = precios.get(item['duracion_minutos'], 0)
+            # El precio pagado queda guardado en la orden; el catálogo solo cubre órdenes antiguas sin él
+            precio_unitario = item.get('precio_unitario')
+            if precio_unitario is None:
+                precio_unitario = float(precio(item['duracion_minutos']))
             duracion_display = f"{item['duracion_minutos']} minutos"
             
             items_detalle.append({
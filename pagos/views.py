@@ -6,6 +6,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
 import stripe
 from django.conf import settings
+from django_tests_backend.idempotencia import idempotente
+
+from . import precios as catalogo_precios
 
 from .models import CarritoCompra, ItemCarrito, OrdenCompra
 from .serializers import (
@@ -31,11 +34,11 @@ class CarritoViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def precios(self, request):
         """Obtener precios de las clases"""
-        precios = {25: 6, 50: 12, 80: 16}
+        precios = catalogo_precios.precios()
         serializer = PreciosSerializer({
-            'duracion_25min': precios[25],
-            'duracion_50min': precios[50],
-            'duracion_80min': precios[80],
+            'duracion_25min': precios.get(25, 0),
+            'duracion_50min': precios.get(50, 0),
+            'duracion_80min': precios.get(80, 0),
         })
         return Response(serializer.data)
 
@@ -125,14 +128,11 @@ class OrdenCompraViewSet(viewsets.ModelViewSet):
         return OrdenCompra.objects.filter(usuario=self.request.user)
 
     def crear_o_obtener_precios_stripe(self):
-        """IDs de precios de Stripe Dashboard"""
-        return {
-            25: "price_1SZZFH2ev9LdxX5bMQ7BDq3G",
-            50: "price_1SZZGn2ev9LdxX5bVuWOacH0",
-            80: "price_1SZZIb2ev9LdxX5bShWQN2JD",
-        }
+        """IDs de precios de Stripe Dashboard (configurados en PrecioClase)"""
+        return catalogo_precios.stripe_price_ids()
 
     @action(detail=False, methods=['post'])
+    @idempotente
     def crear_orden_desde_carrito(self, request):
         """Crear orden desde los items del carrito"""
         carrito = CarritoCompra.objects.filter(usuario=request.user).first()
@@ -206,6 +206,7 @@ class OrdenCompraViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['post'])
+    @idempotente
     def crear_orden_directa(self, request):
         """Crear orden directamente sin usar carrito"""
         items_data = request.data.get('items')
@@ -222,8 +223,7 @@ class OrdenCompraViewSet(viewsets.ModelViewSet):
         duracion = serializer.validated_data['duracion_minutos']
         cantidad = serializer.validated_data['cantidad']
 
-        precios = {25: 6, 50: 12, 80: 16}
-        precio_unitario = precios.get(duracion, 0)
+        precio_unitario = catalogo_precios.precio(duracion)
 
         item_orden = {
             'duracion_minutos': duracion,